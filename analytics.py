@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from query_engine import resolve_annual_table
+from pivot_store import get_pivot, update_pivot
+from cache_manager import cache_region
+
+# ✅ 시장 구조 지표 (연도 합산 테이블 기준, 로딩 시 테이블별 1회 계산)
+# - market_structure: 연도별 HHI(점유율² 합, 0~10,000), 상위 N개사 점유율 합(CR3/CR5/CR10), 참여사 수
+# - company_momentum: 임의 기간 [시작, 끝]의 회사별 순위 변화/변동성(표준편차)/금액 CAGR
+# 질문 intent의 "analysis" 값(concentration / volatility / cagr)으로 조회한다.
+
+ANALYSES = ("concentration", "volatility", "cagr")
+CR_LEVELS = (3, 5, 10)
+
+
+def market_structure(annual, levels=CR_LEVELS):
+    rows = annual.dropna(subset=["점유율(%)"]).sort_values(["연도", "순위"], kind="stable")
+    by_year = rows.groupby("연도")
+    position = by_year.cumcount()
+
+    structure = pd.DataFrame({"HHI": (rows["점유율(%)"] ** 2).groupby(rows["연도"]).sum().round(1)})
+    for n in levels:
+        structure[f"CR{n}(%)"] = rows["점유율(%)"].where(position < n, 0).groupby(rows["연도"]).sum().round(2)
+    structure["참여사 수"] = by_year["주관사"].nunique()
+    return structure.reset_index()
+
+
+def company_momentum(pivots, start, end):
+    years = list(range(start, end + 1))
+    rank = pivots["rank"].reindex(columns=years)
+    amount = pivots["amount"].reindex(columns=years)
+
+    # 변동성은 기간 중 최소 3개 연도(기간이 더 짧으면 전 연도) 순위권에 든 회사만 계산
+    listed = rank.notna().sum(axis=1)
+    momentum = pd.DataFrame({
+        f"{start}년 순위": rank[start].astype("Int64"),
+        f"{end}년 순위": rank[end].astype("Int64"),
+        "순위 상승폭": (rank[start] - rank[end]).astype("Int64"),  # 양수면 순위가 올라감
+        "순위 변동성": rank.std(axis=1, ddof=0).where(listed >= min(3, len(years))).round(2),
+        "평균 순위": rank.mean(axis=1).round(1),
+        "순위권 연도 수": listed,
+        f"{start}년 금액(원)": amount[start],
+        f"{end}년 금액(원)": amount[end],
+    })
+
+    span_years = end - start
+    valid = (amount[start] > 0) & (amount[end] > 0)
+    if span_years > 0:
+        ratio = (amount[end] / amount[start]).where(valid)
+        momentum["금액 CAGR(%)"] = ((np.power(ratio, 1 / span_years) - 1) * 100).round(2)
+    else:
+        momentum["금액 CAGR(%)"] = np.nan
+
+    momentum = momentum[listed > 0]
+    momentum.index.name = "주관사"
+    return momentum.reset_index()
+
+
+_analytics_cache = cache_region("analytics")
+
+def get_analytics(dfs, product, role="lead", filter_cond=None):
+    annual = resolve_annual_table(dfs, product, role, filter_cond)
+    if annual is None or annual.empty:
+        return None
+
+    def build():
+        # 회사 × 연도 순위/금액 행렬 (기간 창 계산은 이 행렬을 잘라서 벡터 연산)
+        matrix = get_pivot(dfs, product, role, filter_cond)
+        pivots = {"rank": matrix.frame("순위"), "amount": matrix.frame("금액(원)")}
+        return {"annual": annual, "structure": market_structure(annual), "pivots": pivots}
+    return _analytics_cache.get_or_build(id(annual), build, anchor=annual)
+
+
+# ✅ 증분 반영: 시장 구조 지표는 바뀐 연도만 다시 계산, 순위/금액 행렬은 갱신된 피벗에서 다시 꺼냄
+def update_analytics(old_annual, new_annual, years):
+    matrix = update_pivot(old_annual, new_annual, years)
+    cached = _analytics_cache.pop(id(old_annual), anchor=old_annual)
+    if cached is None or matrix is None:
+        return None
+    previous, cost = cached
+    structure = previous["structure"]
+    structure = pd.concat(
+        [structure[~structure["연도"].isin(years)], market_structure(new_annual[new_annual["연도"].isin(years)])],
+        ignore_index=True,
+    ).sort_values("연도").reset_index(drop=True)
+    pivots = {"rank": matrix.frame("순위"), "amount": matrix.frame("금액(원)")}
+    return _analytics_cache.put(id(new_annual), {"annual": new_annual, "structure": structure, "pivots": pivots}, anchor=new_annual, cost=cost)
+
+
+# ✅ 로딩 시 모든 (상품, 역할, 조건) 테이블의 지표를 미리 계산
+def warm_analytics(dfs):
+    for product, role, filter_cond in (k for k in dfs if isinstance(k, tuple) and len(k) == 3):
+        get_analytics(dfs, product, role, filter_cond)
@@ -0,0 +1,260 @@
+import os
+import json
+import asyncio
+import contextvars
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from collections import OrderedDict
+
+from query_engine import load_store, parse_query, result_to_dict
+from metrics import REGISTRY
+from cache_manager import cache_stats, CACHE
+from llm_gate import parse_or_degrade
+from conversation import ConversationState, apply_followup
+from query_log import QUERY_LOG, logged_request, warm_from_log
+from tracing import trace_request
+from narrative import narrate_result
+from ingest import refresh_store
+from deadline import REQUEST_TIMEOUT, RequestCancelled, DeadlineExceeded, request_scope, watch
+
+# ✅ Streamlit 없이 리그테이블 질의를 처리하는 경량 HTTP/JSON 서버 (asyncio + 표준 라이브러리)
+# 실행: python api_server.py --port 8080
+#   POST /query  {"query": "2024년 DCM 대표주관 순위 1~10위 알려줘"}
+#                {"parsed": {"product": "DCM", "years": [2024], "top_n": 10}}  ← GPT 호출 없이 바로 조회
+#                {"query": "그럼 2023년은?", "session": "abc"}  ← 같은 session의 직전 질문에 변경분만 적용
+#                {"query": "...", "page": 2, "page_size": 50}  ← 표마다 해당 페이지만 반환 (total_rows, pages 포함)
+#   GET  /health
+#   GET  /cache   ← 캐시 영역별 항목 수/추정 메모리/적중률/제거 수 (cache_manager.py)
+# DCM/ECM 엑셀이 바뀌면(python ingest.py ... --write) 다음 질의 때 바뀐 기간 행만 반영 (ingest.py)
+#   GET  /metrics  (Prometheus 텍스트 형식)
+# 요청마다 LEAGUE_REQUEST_TIMEOUT초 마감(넘으면 504), 응답 전에 클라이언트가 연결을 끊으면 진행 중인 GPT 호출/조회를 중단
+# HTTP/1.1 keep-alive를 지원하므로 대시보드/배치 작업이 연결을 재사용할 수 있다.
+
+MAX_BODY_BYTES = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = float(os.getenv("API_KEEP_ALIVE_TIMEOUT", "15"))
+LLM_MAX_WORKERS = int(os.getenv("API_LLM_MAX_WORKERS", "8"))
+MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "256"))
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class PlainText:
+    def __init__(self, text, content_type="text/plain; charset=utf-8"):
+        self.text = text
+        self.content_type = content_type
+
+
+class LeagueTableServer:
+    def __init__(self, dfs, parser=parse_query, llm_workers=LLM_MAX_WORKERS):
+        self.dfs = dfs
+        self.parser = parser
+        # GPT 호출은 블로킹이므로 별도 풀에서 실행 (전역 동시 호출 수는 llm_gate에서 제한)
+        self.llm_pool = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="llm")
+        self.sessions = OrderedDict()  # session id → ConversationState (오래된 세션부터 정리)
+        self.routes = {
+            ("GET", "/health"): self.handle_health,
+            ("POST", "/query"): self.handle_query,
+            ("GET", "/metrics"): self.handle_metrics,
+            ("GET", "/cache"): self.handle_cache,
+        }
+
+    async def handle_health(self, body):
+        return {"status": "ok", "tables": len(self.dfs)}
+
+    async def handle_metrics(self, body):
+        return PlainText(REGISTRY.render(), "text/plain; version=0.0.4; charset=utf-8")
+
+    async def handle_cache(self, body):
+        return {"budget_bytes": int(CACHE.budget_bytes), "bytes": CACHE.bytes, "version": CACHE.version, "regions": cache_stats()}
+
+    def get_session(self, session_id):
+        if session_id is None:
+            return ConversationState()
+        state = self.sessions.pop(str(session_id), None) or ConversationState()
+        self.sessions[str(session_id)] = state
+        while len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+        return state
+
+    async def handle_query(self, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"잘못된 JSON 요청입니다: {e}")
+        if not isinstance(payload, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "요청 본문은 JSON 객체여야 합니다.")
+
+        try:
+            page = None if payload.get("page") is None else int(payload["page"])
+            page_size = None if payload.get("page_size") is None else max(1, int(payload["page_size"]))
+        except (TypeError, ValueError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'page'와 'page_size'는 정수여야 합니다.")
+
+        # 질의 로그: 실행 스레드에서도 span이 모이도록 요청 context를 복사해 executor로 넘김
+        with trace_request(enabled=QUERY_LOG.enabled) as spans:
+            with logged_request(payload.get("query"), "api", spans) as log_record:
+                result = await self.answer(payload)
+                log_record.update(parsed=result["parsed"], degraded=result["degraded"], followup=result["followup"])
+        return result_to_dict(result, page, page_size)
+
+    async def in_executor(self, pool, fn, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(pool, context.run, fn, *args)
+
+    async def answer(self, payload):
+        query = payload.get("query")
+        parsed = payload.get("parsed")
+        degraded = False
+        changed = None
+        conversation = self.get_session(payload.get("session"))
+
+        if parsed is None:
+            if not query:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "'query' 또는 'parsed' 필드가 필요합니다.")
+            followup = apply_followup(query, conversation.last_parsed)
+            if followup is not None:
+                parsed, changed = followup
+        if parsed is None:
+            try:
+                parsed, degraded = await self.in_executor(self.llm_pool, parse_or_degrade, query, self.parser)
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                raise HttpError(HTTPStatus.BAD_GATEWAY, f"GPT 질문 해석에 실패했습니다: {e}")
+        elif not isinstance(parsed, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'parsed'는 JSON 객체여야 합니다.")
+
+        # 새 분기 엑셀이 저장됐으면 바뀐 기간만 먼저 반영 (확인 주기 안이면 바로 반환)
+        await self.in_executor(None, refresh_store, self.dfs)
+        # pandas 필터링도 이벤트 루프를 막지 않도록 기본 스레드 풀에서 실행
+        result = await self.in_executor(None, conversation.run, parsed, self.dfs)
+        if not ("message" in parsed and len(parsed) == 1):
+            conversation.remember(parsed)
+        result["query"] = query
+        result["parsed"] = parsed
+        result["degraded"] = degraded  # true면 GPT 과부하로 로컬 간이 해석을 사용
+        result["followup"] = changed  # 후속 질문으로 해석했다면 바뀐 항목 목록
+        result["summary"] = narrate_result(result)  # 결과 표 기반 로컬 요약 (GPT 호출 없음)
+        return result
+
+    async def read_request(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), timeout=KEEP_ALIVE_TIMEOUT)
+        if not request_line:
+            return None
+
+        try:
+            method, target, version = request_line.decode("latin-1").strip().split(" ", 2)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "잘못된 요청 라인입니다.")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "요청 본문이 너무 큽니다.")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return method.upper(), target.split("?", 1)[0], body, keep_alive
+
+    async def dispatch(self, method, path, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} {path}는 지원하지 않습니다.")
+            raise HttpError(HTTPStatus.NOT_FOUND, f"{path} 경로를 찾을 수 없습니다.")
+        return await handler(body)
+
+    def write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, PlainText):
+            body, content_type = payload.text.encode("utf-8"), payload.content_type
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    self.write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, body, keep_alive = request
+                try:
+                    # 연결이 끊기면(EOF) 이 요청의 취소 토큰을 취소해 실행 스레드의 작업도 멈춤
+                    with request_scope(REQUEST_TIMEOUT) as token, watch(token, reader.at_eof):
+                        status, payload = HTTPStatus.OK, await self.dispatch(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except DeadlineExceeded:
+                    status, payload = HTTPStatus.GATEWAY_TIMEOUT, {"error": f"질의 처리 시간({REQUEST_TIMEOUT:g}초)을 초과했습니다."}
+                except RequestCancelled:
+                    break  # 클라이언트가 떠났으므로 응답하지 않음
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"질의 처리 중 오류가 발생했습니다: {e}"}
+
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"✅ 리그테이블 API 서버 시작: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="더벨 리그테이블 HTTP/JSON 질의 서버")
+    arg_parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    arg_parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8080")))
+    args = arg_parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()  # .env에서 OPENAI_API_KEY 불러오기
+
+    dfs, _ = load_store()
+    warm_from_log(dfs)  # 질의 로그 상위 intent로 캐시 워밍
+    server = LeagueTableServer(dfs)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import csv
+import contextlib
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from query_engine import load_store, parse_query, run_query, result_to_dict, DISPLAY_COLUMNS
+from llm_gate import MAX_CONCURRENCY, normalize_query_key, parse_or_degrade
+from export import export_frames
+from narrative import narrate_result
+
+# ✅ 질문 파일을 한 번에 처리하는 배치 CLI (야간 리포트 생성용)
+# 실행: python batch_answer.py questions.txt -o answers.jsonl --workers 4
+#   - 입력: 한 줄에 질문 하나(.txt) 또는 {"id": ..., "query": ...} 형식의 JSONL
+#   - 출력: .jsonl(질문당 1줄) 또는 .csv/.parquet/.xlsx(결과 행당 1줄), 입력 순서대로 바로바로 기록
+# 데이터는 1회만 로딩하고, GPT 해석은 제한된 스레드 풀에서 병렬로 수행한다.
+# 풀 크기 기본값은 GPT 게이트 동시 호출 수(LLM_MAX_CONCURRENCY)와 같게 두고, 그래도 게이트 대기 초과/해석 시간 초과가
+# 나면 그 질문만 로컬 규칙 해석으로 답한다 (결과의 "degraded": true, 질문이 오류로 빠지지 않음).
+
+CSV_FIELDS = ["id", "query", "title", "warning", "error"] + DISPLAY_COLUMNS + ["변화", "기타"]
+
+
+def read_questions(path):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append({"id": item.get("id", line_no), "query": item["query"], "parsed": item.get("parsed")})
+            else:
+                questions.append({"id": line_no, "query": line, "parsed": None})
+    return questions
+
+
+# ✅ 같은 질문(공백/대소문자 차이만 있는 경우 포함)은 GPT를 한 번만 호출, 결과는 (parsed, degraded)
+def parse_all(questions, pool, parser=parse_query):
+    futures = {}
+    for q in questions:
+        if q["parsed"] is not None:
+            continue
+        key = normalize_query_key(q["query"])
+        if key not in futures:
+            futures[key] = pool.submit(parse_or_degrade, q["query"], parser)
+    return futures
+
+
+def answer_all(questions, dfs, workers=MAX_CONCURRENCY, parser=parse_query):
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as pool:
+        futures = parse_all(questions, pool, parser)
+
+        # 해석이 끝나는 대로 입력 순서에 맞춰 조회/출력 (조회는 연도 합산 캐시를 공유)
+        for q in questions:
+            record = {"id": q["id"], "query": q["query"]}
+            try:
+                parsed, degraded = q["parsed"], False
+                if parsed is None:
+                    parsed, degraded = futures[normalize_query_key(q["query"])].result()
+                result = run_query(parsed, dfs)
+                result["parsed"] = parsed
+                result["degraded"] = degraded  # true면 GPT 대신 로컬 간이 해석을 사용
+                result["summary"] = narrate_result(result)
+                record.update(result_to_dict(result))
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            yield record
+
+
+def write_jsonl(records, f):
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+
+
+# 질문 1건 → 결과 행(CSV_FIELDS 기준) 목록
+def flatten_record(record):
+    base = {"id": record["id"], "query": record["query"]}
+    if "error" in record:
+        return [{**base, "error": record["error"]}]
+    rows = [{**base, "warning": warning} for warning in record.get("warnings", [])]
+    for item in record.get("results", []):
+        for row in item["rows"]:
+            extra = {k: v for k, v in row.items() if k not in CSV_FIELDS}
+            out = {**base, "title": item["title"], **{k: v for k, v in row.items() if k in CSV_FIELDS}}
+            if extra:
+                out["기타"] = json.dumps(extra, ensure_ascii=False)
+            rows.append(out)
+    return rows
+
+
+def write_csv(records, f):
+    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerows(flatten_record(record))
+        f.flush()
+
+
+# ✅ Parquet/XLSX: 질문별 결과를 청크로 흘려 기록 (전체 답변을 메모리에 모으지 않음)
+def write_table(records, fmt, f):
+    frames = (pd.DataFrame(flatten_record(record), columns=CSV_FIELDS) for record in records)
+    export_frames(frames, fmt, f)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="리그테이블 질문 배치 처리")
+    arg_parser.add_argument("input", help="질문 파일 (.txt: 한 줄에 하나, .jsonl: {\"query\": ...})")
+    arg_parser.add_argument("-o", "--output", default="-", help="출력 파일 (.jsonl/.csv/.parquet/.xlsx, 기본: 표준출력 JSONL)")
+    arg_parser.add_argument("--format", choices=["jsonl", "csv", "parquet", "xlsx"], default=None)
+    arg_parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_LLM_WORKERS", str(MAX_CONCURRENCY))),
+                            help="동시 GPT 호출 수 (기본: LLM_MAX_CONCURRENCY, 더 크게 잡아도 게이트에서 대기)")
+    args = arg_parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()  # .env에서 OPENAI_API_KEY 불러오기
+
+    ext = os.path.splitext(args.output)[1].lstrip(".").lower()
+    fmt = args.format or (ext if ext in ("csv", "parquet", "xlsx") else "jsonl")
+    if fmt in ("parquet", "xlsx") and args.output == "-":
+        arg_parser.error(f"{fmt} 형식은 -o 로 출력 파일을 지정해야 합니다.")
+    questions = read_questions(args.input)
+    with contextlib.redirect_stdout(sys.stderr):  # 로딩 로그가 표준출력 결과와 섞이지 않도록
+        dfs, _ = load_store()
+    records = answer_all(questions, dfs, workers=args.workers)
+
+    if args.output == "-":
+        (write_csv if fmt == "csv" else write_jsonl)(records, sys.stdout)
+        return
+
+    if fmt in ("parquet", "xlsx"):
+        with open(args.output, "wb") as f:
+            write_table(records, fmt, f)
+        return
+
+    newline = "" if fmt == "csv" else None
+    with open(args.output, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline=newline) as f:
+        (write_csv if fmt == "csv" else write_jsonl)(records, f)
+
+
+if __name__ == "__main__":
+    main()
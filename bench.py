@@ -0,0 +1,282 @@
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+os.environ.setdefault("LEAGUE_QUERY_LOG", "0")
+
+import numpy as np
+import pandas as pd
+
+# ✅ 핵심 조회/차트 준비 함수 마이크로 벤치마크 (합성 데이터로 규모를 키워 측정)
+# 실행: python bench.py                              ← 기본 규모 측정 후 bench_baseline.json 대비 느려진 케이스를 경고로 표시
+#       python bench.py --check                      ← 같은 비교에서 회귀가 있으면 종료 코드 1 (배포 전 확인용)
+#       python bench.py --scales 1x1,100x10 --cases compare_rank,top_n_groupby
+#       python bench.py --save-baseline              ← 현재 결과를 기준값으로 저장 (코드 변경으로 측정 경로가 바뀌면 갱신)
+#   - 규모 'PxC' = 연도 수 P배 × 회사 수 C배 (synthetic_data.py, 행 수는 대략 P×C배)
+#   - 케이스마다 실행 시간(중앙값/최솟값)과 tracemalloc 최대 할당량을 기록
+#   - 시간은 반복마다 바로 앞에서 잰 보정 작업(리그테이블 코드와 무관한 작은 pandas 정렬·groupby) 대비 배수의 중앙값으로 저장·비교
+#     → 기준값을 만든 장비와 CPU 속도·부하가 달라도 기준 시간을 이 실행의 보정 시간으로 환산해 비교
+#   - 배수가 기준값보다 tolerance 이상 커지거나 메모리가 mem-tolerance 이상 늘면 회귀로 표시
+#     (시간 차이 MIN_DELTA_MS 미만, 메모리 차이 MIN_DELTA_KB 미만은 측정 잡음으로 보고 무시)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_SCALES = "1x1,10x1,10x10"
+MIN_DELTA_MS = 1.0
+MIN_DELTA_KB = 256
+QUIET_LOGGERS = ["streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.deprecation_util"]
+
+
+def _context(dfs):
+    from query_engine import get_annual_table
+
+    quarterly = dfs[("dcm", "lead", None)]
+    annual = get_annual_table(dfs, "dcm")
+    years = sorted(annual["연도"].unique().tolist())
+    last = annual[annual["연도"] == years[-1]]
+    return {
+        "dfs": dfs,
+        "quarterly": quarterly,
+        "annual": annual,
+        "years": years,
+        "recent": years[-3:],
+        "leaders": last.sort_values("순위")["주관사"].head(5).tolist(),
+    }
+
+
+# ✅ 케이스: ctx(합성 저장소와 미리 계산한 값)를 받아 측정할 인자 없는 함수를 반환 (준비 작업은 측정 제외)
+def case_annual_table(ctx):
+    from query_engine import build_annual_table
+    return lambda: build_annual_table(ctx["quarterly"])
+
+
+def case_compare_rank(ctx):
+    from query_engine import compare_rank
+    y1, y2 = ctx["years"][-2:]
+    return lambda: compare_rank(ctx["annual"], y1, y2)
+
+
+def case_compare_share(ctx):
+    from query_engine import compare_share
+    y1, y2 = ctx["years"][-2:]
+    return lambda: compare_share(ctx["annual"], y1, y2)
+
+
+def case_top_n_groupby(ctx):
+    # 앱의 분기 원본 Top N 처리 (연도 필터 → 정렬 → 연도별 head)
+    df, years = ctx["quarterly"], ctx["recent"]
+    return lambda: df[df["연도"].isin(years)].sort_values(["연도", "순위"]).groupby("연도").head(10).reset_index(drop=True)
+
+
+def case_product_top_n(ctx):
+    from query_engine import execute_intent, normalize_intent
+    intent = normalize_intent({"product": ["DCM", "ECM", "IPO"], "years": ctx["recent"], "top_n": 10})
+    return lambda: execute_intent(intent, ctx["dfs"])
+
+
+def case_company_year_chart(ctx):
+    from company_profiles import get_company_profiles
+    from improved_company_year_chart_logic import handle_company_year_chart_logic
+    get_company_profiles(ctx["dfs"])  # 프로필은 로딩 시 1회 생성되므로 측정에서 제외
+    parsed = {"company": ctx["leaders"][:2], "years": ctx["recent"], "is_chart": True, "columns": ["금액"]}
+    return lambda: handle_company_year_chart_logic(parsed, ctx["dfs"])
+
+
+def case_pivot_build(ctx):
+    from pivot_store import PivotMatrix
+    return lambda: PivotMatrix(ctx["annual"])
+
+
+def case_matrix_chart_prep(ctx):
+    from pivot_store import PivotMatrix
+    from utils import build_company_matrix_figure
+    matrix = PivotMatrix(ctx["annual"])
+    metrics = ["금액(원)", "점유율(%)", "순위"]
+
+    def run():
+        chart = matrix.take(ctx["leaders"], ctx["years"][-5:], metrics)
+        return [build_company_matrix_figure(chart["periods"], chart["companies"], chart["values"][m], m, m) for m in metrics]
+    return run
+
+
+def case_line_chart_prep(ctx):
+    from utils import plot_line_chart_plotly
+    annual = ctx["annual"]
+    rows = annual[annual["주관사"].isin(ctx["leaders"]) & annual["연도"].isin(ctx["years"][-5:])]
+    return lambda: plot_line_chart_plotly(rows, "연도", "순위", key="bench_line")
+
+
+CASES = {
+    "annual_table": case_annual_table,
+    "compare_rank": case_compare_rank,
+    "compare_share": case_compare_share,
+    "top_n_groupby": case_top_n_groupby,
+    "product_top_n": case_product_top_n,
+    "company_year_chart": case_company_year_chart,
+    "pivot_build": case_pivot_build,
+    "matrix_chart_prep": case_matrix_chart_prep,
+    "line_chart_prep": case_line_chart_prep,
+}
+
+
+# 보정 작업: 장비 속도만 반영하도록 저장소 코드를 쓰지 않는 작은 표 정렬 + groupby 반복
+# (케이스 대부분처럼 pandas 호출 오버헤드가 주가 되는 크기)
+def calibration_workload(rows=2000, loops=20, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({"그룹": rng.integers(0, 50, rows), "값": rng.random(rows)})
+
+    def run():
+        for _ in range(loops):
+            frame.sort_values(["그룹", "값"]).groupby("그룹")["값"].sum()
+    return run
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(fn, repeat=5, calibrate=None):
+    fn()  # 워밍업 (import/캐시)
+    gc.collect()
+    times, ratios, calibration = [], [], []
+    for _ in range(repeat):
+        if calibrate is not None:
+            # 실행 도중 장비 부하가 바뀌어도 같은 순간의 보정 시간과 짝지어 배수를 계산
+            calibration.append(_timed(calibrate))
+        times.append(_timed(fn) / 1000)
+        if calibrate is not None:
+            ratios.append(times[-1] * 1000 / calibration[-1])
+
+    # 메모리는 별도 1회 실행으로 측정 (tracemalloc은 실행 시간을 늘리므로)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    row = {
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+    if calibrate is not None:
+        row.update(relative=round(statistics.median(ratios), 4), calibration_ms=round(statistics.median(calibration), 3))
+    return row
+
+
+def parse_scale(text):
+    period, _, company = text.lower().partition("x")
+    return float(period), float(company or 1)
+
+
+def run_suite(scales, cases, repeat=5, seed=0):
+    from synthetic_data import generate_store
+
+    # Streamlit 함수를 화면 없이(bare mode) 호출하면 매번 찍히는 경고 로그를 끔
+    # (Streamlit 설정 로딩 시 로그 레벨이 다시 잡히므로 레벨 대신 로거 자체를 비활성화)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+    calibrate = calibration_workload()
+    calibrate()
+    results = {}
+    for scale in scales:
+        period_scale, company_scale = parse_scale(scale)
+        ctx = _context(generate_store(period_scale, company_scale, seed))
+        for name in cases:
+            fn = CASES[name](ctx)
+            row = measure(fn, repeat, calibrate)
+            row.update(case=name, scale=scale, rows=len(ctx["quarterly"]))
+            results[f"{name}@{scale}"] = row
+            print(f"… {name}@{scale}: {row['median_ms']}ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance, mem_tolerance):
+    regressions = []
+    for key, row in results.items():
+        base = baseline.get(key)
+        if base is None or "relative" not in base:
+            continue
+        # 기준 배수와 이번 배수를 이 실행의 보정 시간으로 환산해 비교 (장비가 달라도 같은 기준)
+        base_ms = round(base["relative"] * row["calibration_ms"], 3)
+        now_ms = round(row["relative"] * row["calibration_ms"], 3)
+        row["base_ms"], row["base_kb"] = base_ms, base["peak_kb"]
+        if now_ms - base_ms > MIN_DELTA_MS and row["relative"] > base["relative"] * (1 + tolerance):
+            regressions.append(f"{key}: 시간 {base_ms}ms → {now_ms}ms (보정 환산, {row['relative'] / base['relative']:.2f}배)")
+        grown = row["peak_kb"] - base["peak_kb"]
+        if grown > MIN_DELTA_KB and row["peak_kb"] > base["peak_kb"] * (1 + mem_tolerance):
+            regressions.append(f"{key}: 메모리 {base['peak_kb']}KB → {row['peak_kb']}KB")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'케이스':<22}{'규모':>8}{'행 수':>10}{'중앙값(ms)':>12}{'최소(ms)':>11}{'메모리(KB)':>12}{'기준 환산(ms)':>13}")
+    for row in results.values():
+        base = row.get("base_ms", "-")
+        print(f"{row['case']:<22}{row['scale']:>8}{row['rows']:>10}{row['median_ms']:>12}{row['min_ms']:>11}{row['peak_kb']:>12}{base:>13}")
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="리그테이블 핵심 함수 마이크로 벤치마크 (합성 데이터)")
+    arg_parser.add_argument("--scales", default=DEFAULT_SCALES, help="규모 목록 (예: 1x1,10x10,100x10)")
+    arg_parser.add_argument("--cases", help=f"케이스 목록 (기본: 전체 {', '.join(CASES)})")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="케이스당 반복 횟수")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--baseline", default=BASELINE_PATH, help="기준값 JSON 경로")
+    arg_parser.add_argument("--save-baseline", action="store_true", help="현재 결과를 기준값으로 저장")
+    arg_parser.add_argument("--check", action="store_true", help="기준값 대비 회귀가 있으면 종료 코드 1")
+    arg_parser.add_argument("--tolerance", type=float, default=0.3, help="허용 시간 증가율 (0.3 = 30%%)")
+    arg_parser.add_argument("--mem-tolerance", type=float, default=0.2, help="허용 메모리 증가율")
+    arg_parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    args = arg_parser.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(",")] if args.cases else list(CASES)
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        arg_parser.error(f"알 수 없는 케이스: {', '.join(unknown)}")
+
+    results = run_suite([s.strip() for s in args.scales.split(",") if s.strip()], cases, args.repeat, args.seed)
+
+    if args.save_baseline:
+        # 기존 기준값에 덮어써서 일부 케이스/규모만 갱신할 수 있게 함
+        baseline = load_baseline(args.baseline) or {}
+        baseline.setdefault("results", {}).update(results)
+        baseline["environment"] = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print_report(results)
+        print(f"\n✅ 기준값 저장: {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline["results"], args.tolerance, args.mem_tolerance) if baseline else []
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if baseline is None:
+        print(f"\nℹ️ 기준값 파일이 없어 비교하지 않았습니다 ({args.baseline}, --save-baseline으로 생성)")
+    for regression in regressions:
+        print(f"{'❌' if args.check else '⚠️'} 회귀: {regression}")
+    if regressions and not args.check:
+        print("ℹ️ 경고만 표시했습니다 (--check로 실행하면 회귀 시 종료 코드 1)")
+    sys.exit(1 if regressions and args.check else 0)
+
+
+if __name__ == "__main__":
+    main()
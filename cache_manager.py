@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import CACHE_REQUESTS, CACHE_EVICTIONS, CACHE_BYTES, CACHE_ENTRIES
+
+# ✅ 프로세스 공용 캐시 관리자: 모듈마다 따로 두던 캐시(연도 합산, 피벗, 지표, 회사 프로필, 합산 상품, 요약용 연도 행,
+# 상품 묶음, 질의 결과 조각, 순위 이정표)를 이름 붙은 영역(region)으로 모아 하나의 메모리 예산(LEAGUE_CACHE_BUDGET_MB) 안에서 관리
+#   - 크기: DataFrame은 memory_usage(deep=True), 배열은 nbytes, dict/list 등은 내용까지 합산 (기준 객체 anchor는 제외)
+#   - 비용: 값을 처음 만들 때 걸린 시간(초) → 증분 갱신으로 바꿔 끼워도 처음 비용을 그대로 유지
+#   - 예산을 넘으면 우선순위가 가장 낮은 항목부터 버림 (GreedyDual-Size-Frequency)
+#       우선순위 = 기준값(clock) + 조회 수 × 재계산 비용 / 크기
+#     다시 만들기 싸고, 크고, 잘 안 쓰이는 항목이 먼저 나가고, 버릴 때마다 clock을 올려 오래전 인기 항목도 결국 밀려남
+#   - 데이터 버전(snapshot): 새 분기가 반영될 때마다 1 증가, versioned 영역은 이전 버전 항목을 조회 시 버림
+#     (원본 테이블 객체를 기준으로 하는 영역은 anchor가 바뀌면 자동으로 무효, 증분 반영 함수가 새 객체로 옮겨 둠)
+# 영역별 통계: cache_stats() / API GET /cache / Prometheus league_cache_bytes, league_cache_evictions_total
+
+CACHE_BUDGET_MB = float(os.getenv("LEAGUE_CACHE_BUDGET_MB", "512"))
+MIN_COST = 1e-6  # 비용을 재지 않은 항목(초)
+OBJECT_SAMPLE = 1000  # object 배열 원소 크기는 앞쪽 일부만 재서 추정
+CONTAINER_SAMPLE = 64  # 원소가 많은 dict/list는 고르게 뽑은 일부만 재서 전체 크기 추정 (회사 프로필, 연도별 행)
+
+
+# ✅ 값이 차지하는 메모리(바이트) 추정 (exclude: 세지 않을 객체, 예: 다른 곳에서 이미 소유한 원본 테이블)
+def estimate_size(value, exclude=()):
+    seen = {id(obj) for obj in exclude}
+    return _sizeof(value, seen)
+
+
+def _sizeof(obj, seen):
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype != object or not obj.size:
+            return int(obj.nbytes)
+        sample = obj.ravel()[:OBJECT_SAMPLE]
+        return int(obj.nbytes + sum(sys.getsizeof(x) for x in sample) * obj.size / len(sample))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + _sample_sum(list(obj.items()), seen, pairs=True)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + _sample_sum(list(obj), seen)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return sys.getsizeof(obj) + _sizeof(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+# pairs: dict의 (키, 값) — 임시 튜플 자체는 세지 않음 (임시 객체 id가 재사용되면 seen에서 잘못 걸러짐)
+def _sample_sum(items, seen, pairs=False):
+    sample = items
+    if len(items) > CONTAINER_SAMPLE:
+        step = len(items) / CONTAINER_SAMPLE
+        sample = [items[int(i * step)] for i in range(CONTAINER_SAMPLE)]
+    if pairs:
+        total = sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in sample)
+    else:
+        total = sum(_sizeof(item, seen) for item in sample)
+    return int(total * len(items) / len(sample)) if sample else 0
+
+
+# anchor가 튜플이면 원소별로 같은 객체인지 비교 (여러 테이블을 묶은 값)
+def _same_anchor(a, b):
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+    return a is b
+
+
+class _Entry:
+    __slots__ = ("region", "key", "value", "anchor", "size", "cost", "hits", "priority", "version")
+
+    def __init__(self, region, key, value, anchor, size, cost, version):
+        self.region = region
+        self.key = key
+        self.value = value
+        self.anchor = anchor
+        self.size = max(1, size)
+        self.cost = max(MIN_COST, cost)
+        self.hits = 1
+        self.version = version
+        self.priority = 0.0
+
+
+class CacheRegion:
+    def __init__(self, manager, name, versioned=False):
+        self.manager = manager
+        self.name = name
+        self.versioned = versioned
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    # anchor: 값이 기준으로 삼는 객체 (id(객체)를 키로 쓸 때 같은 객체인지 확인, 크기 계산에서는 제외)
+    def get(self, key, anchor=None):
+        with self.manager.lock:
+            entry = self.entries.get(key)
+            if entry is not None and anchor is not None and not _same_anchor(entry.anchor, anchor):
+                self.manager._remove(entry)
+                entry = None
+            if entry is not None and self.versioned and entry.version != self.manager.version:
+                self.manager._remove(entry, reason="stale")
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                entry.hits += 1
+                entry.priority = self.manager.clock + entry.hits * entry.cost / entry.size
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return None if entry is None else entry.value
+
+    # version: 계산을 시작할 때의 데이터 버전 (계산 중에 새 분기가 반영됐으면 저장 즉시 이전 버전 항목이 됨)
+    def put(self, key, value, anchor=None, cost=0.0, size=None, version=None):
+        if size is None:
+            size = estimate_size(value, exclude=(anchor, *anchor) if isinstance(anchor, tuple) else (anchor,))
+        entry = _Entry(self, key, value, anchor, size, cost, self.manager.version if version is None else version)
+        self.manager._admit(entry)
+        return value
+
+    # 없으면 build()로 만들고 걸린 시간을 비용으로 기록
+    def get_or_build(self, key, build, anchor=None):
+        value = self.get(key, anchor)
+        if value is not None:
+            return value
+        version = self.manager.version
+        started = time.perf_counter()
+        value = build()
+        return self.put(key, value, anchor, cost=time.perf_counter() - started, version=version)
+
+    # 증분 갱신용: 항목을 꺼내 (값, 비용) 반환 (통계에는 넣지 않음), anchor가 다르면 None
+    def pop(self, key, anchor=None):
+        with self.manager.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.manager._remove(entry, reason=None)
+        if anchor is not None and not _same_anchor(entry.anchor, anchor):
+            return None
+        return entry.value, entry.cost
+
+    # 같은 키로 바꿔 끼울 때: 갱신하는 동안에도 다른 요청은 이전 값을 보도록 꺼내지 않고 (값, 비용)만 반환
+    def peek(self, key, anchor=None):
+        with self.manager.lock:
+            entry = self.entries.get(key)
+        if entry is None or (anchor is not None and not _same_anchor(entry.anchor, anchor)):
+            return None
+        return entry.value, entry.cost
+
+    def items(self):
+        with self.manager.lock:
+            return [(entry.key, entry.anchor, entry.value) for entry in self.entries.values()]
+
+    def clear(self):
+        with self.manager.lock:
+            for entry in list(self.entries.values()):
+                self.manager._remove(entry, reason=None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cache": self.name,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "cost_seconds": round(sum(e.cost for e in self.entries.values()), 4),
+        }
+
+
+class CacheManager:
+    def __init__(self, budget_bytes=CACHE_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.RLock()
+        self.regions = {}
+        self.bytes = 0
+        self.clock = 0.0
+        self.version = 0
+
+    def region(self, name, versioned=False):
+        with self.lock:
+            if name not in self.regions:
+                self.regions[name] = CacheRegion(self, name, versioned)
+            return self.regions[name]
+
+    def bump_version(self):
+        with self.lock:
+            self.version += 1
+            return self.version
+
+    def _admit(self, entry):
+        with self.lock:
+            region = entry.region
+            previous = region.entries.get(entry.key)
+            if previous is not None:
+                self._remove(previous, reason=None)
+            # 혼자서 예산을 넘는 값은 저장하지 않음 (호출 측은 계산한 값을 그대로 사용)
+            if entry.size > self.budget_bytes:
+                region.evictions += 1
+                CACHE_EVICTIONS.inc(cache=region.name, reason="oversize")
+                return
+            entry.priority = self.clock + entry.hits * entry.cost / entry.size
+            region.entries[entry.key] = entry
+            region.bytes += entry.size
+            self.bytes += entry.size
+            if self.bytes > self.budget_bytes:
+                self._evict()
+            self._publish(region)
+
+    def _evict(self):
+        candidates = sorted((e for r in self.regions.values() for e in r.entries.values()), key=lambda e: e.priority)
+        for entry in candidates:
+            if self.bytes <= self.budget_bytes:
+                break
+            self.clock = max(self.clock, entry.priority)
+            self._remove(entry, reason="budget")
+
+    def _remove(self, entry, reason="replaced"):
+        region = entry.region
+        if region.entries.get(entry.key) is not entry:
+            return
+        del region.entries[entry.key]
+        region.bytes -= entry.size
+        self.bytes -= entry.size
+        if reason is not None:
+            region.evictions += 1
+            CACHE_EVICTIONS.inc(cache=region.name, reason=reason)
+        self._publish(region)
+
+    def _publish(self, region):
+        CACHE_BYTES.set(region.bytes, cache=region.name)
+        CACHE_ENTRIES.set(len(region.entries), cache=region.name)
+
+    def stats(self):
+        with self.lock:
+            return [region.stats() for region in self.regions.values()]
+
+    def clear(self):
+        with self.lock:
+            for region in self.regions.values():
+                region.clear()
+
+
+CACHE = CacheManager()
+
+
+def cache_region(name, versioned=False):
+    return CACHE.region(name, versioned)
+
+
+def cache_stats():
+    return CACHE.stats()
+
+
+# ✅ 데이터 버전 (증분 반영 때마다 1 증가)
+def store_version():
+    return CACHE.version
+
+
+def bump_store_version():
+    return CACHE.bump_version()
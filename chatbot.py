@@ -1,7 +1,12 @@
 import openai
 import os
 import re
+import time
 import pandas as pd
+from query_engine import get_annual_table, product_display_names
+from narrative import narrate_ranking
+from metrics import LLM_LATENCY, LLM_FIRST_TOKEN
+from deadline import RequestCancelled, DeadlineExceeded, check_cancelled, on_cancel, remaining
 from dotenv import load_dotenv
 
 # .env 파일 로드
@@ -11,7 +16,59 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-def answer_query(query, dfs):
+# ✅ GPT 분석을 토큰 단위로 스트리밍 (표는 먼저 출력하고, 분석은 도착하는 대로 이어서 출력)
+# 요청 마감이 지나면 받은 데까지만 보여주고 중단, 요청이 취소되면(다시 질문/페이지 이탈) 스트림을 닫고 예외를 올림
+def stream_analysis(query, table_markdown=None, client=None):
+    from openai import OpenAI  # openai>=1.0.0 기준
+
+    user_content = query if not table_markdown else f"{query}\n\n[조회 결과]\n{table_markdown}"
+    started = time.perf_counter()
+    first_token = True
+    timeout = remaining()
+    try:
+        check_cancelled("analysis")
+        client = client or OpenAI()
+        try:
+            stream = client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "너는 한국 자본시장 리그테이블 전문가야. 질문에 정확하게 답해줘. 조회 결과가 주어지면 그 수치만 근거로 사용해."},
+                    {"role": "user", "content": user_content}
+                ],
+                temperature=0.2,
+                max_tokens=500,
+                stream=True,
+                **({"timeout": max(timeout, 0.1)} if timeout is not None else {})
+            )
+            with on_cancel(getattr(stream, "close", None)):
+                for chunk in stream:
+                    check_cancelled("analysis")
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if first_token:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - started, model="gpt-3.5-turbo", purpose="analysis")
+                        first_token = False
+                    yield delta
+        except Exception:
+            # 취소/마감으로 연결이 끊겨 난 오류면 RequestCancelled/DeadlineExceeded로 바꿔 올림
+            check_cancelled("analysis")
+            raise
+    except DeadlineExceeded:
+        yield "\n\n⏱️ 응답 시간이 초과되어 분석을 중단했습니다."
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        yield f"GPT 응답 실패: {e}"
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - started, model="gpt-3.5-turbo", purpose="analysis")
+
+
+# ✅ 표와 요약(narrative.py, 로컬 계산)은 즉시 반환하고, GPT 분석은 요청한 경우(enrich)에만 스트림으로 따로 반환
+# 반환값: (표/요약 텍스트, 분석 스트림 또는 None)
+GPT_ANALYSIS_DEFAULT = os.getenv("LEAGUE_GPT_ANALYSIS", "0") == "1"
+
+def answer_query_stream(query, dfs, enrich=GPT_ANALYSIS_DEFAULT):
     # ✅ 연도와 상품군 추출
     from utils import product_aliases  # 상단에 반드시 import
 
@@ -21,34 +78,21 @@ def answer_query(query, dfs):
         raw_product = match.group(2).lower()
         product = product_aliases.get(raw_product)
 
-        df = dfs.get(product)
+        df = get_annual_table(dfs, product)  # 분기 실적 → 연도 합산 리그테이블
         if df is None:
-            return f"❌ '{product}' 데이터가 없어요."
+            return f"❌ '{product}' 데이터가 없어요.", None
 
         df_year = df[df["연도"] == year]
         if df_year.empty:
-            return f"❌ {year}년 데이터가 없어요."
+            return f"❌ {year}년 데이터가 없어요.", None
 
         df_sorted = df_year.sort_values(by="순위")
 
-        # ✅ GPT 질문 및 응답
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "너는 한국 자본시장 리그테이블 전문가야. 질문에 정확하게 답해줘."},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0.2,
-                max_tokens=500
-            )
-            answer = response['choices'][0]['message']['content']
-        except Exception as e:
-            answer = f"GPT 응답 실패: {e}"
-
-        # ✅ 표 + GPT 응답 반환
+        # ✅ 표와 요약은 바로 반환, GPT 분석은 opt-in일 때만 표·요약을 근거로 스트림 전달
         markdown_table = df_sorted[["순위", "주관사", "금액(원)", "건수", "점유율(%)"]].head(10).to_markdown(index=False)
-        return f"📌 {year}년 {product} 대표주관사 순위\n\n{markdown_table}\n\n📍 GPT 분석: {answer}"
+        summary = narrate_ranking(df_sorted.head(10), df, product_display_names.get(product, product.upper()))
+        text = f"📌 {year}년 {product} 대표주관사 순위\n\n{markdown_table}\n\n📍 요약: {summary}"
+        return text, stream_analysis(query, f"{markdown_table}\n\n[요약]\n{summary}") if enrich else None
 
     # ✅ 회사명 기반 질문 (예: '한국투자증권 2022~2024년 실적 보여줘')
     company_match = re.search(r"(\d{4})[~\-](\d{4})년.*(증권)", query)
@@ -68,11 +112,19 @@ def answer_query(query, dfs):
                     combined_df = pd.concat([combined_df, row])
 
         if combined_df.empty:
-            return f"⚠️ {company}의 {y1}~{y2}년 실적을 찾을 수 없습니다."
+            return f"⚠️ {company}의 {y1}~{y2}년 실적을 찾을 수 없습니다.", None
 
         display_cols = ["연도", "product", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
         table_text = combined_df[display_cols].sort_values(["product", "연도"]).to_markdown(index=False)
 
-        return f"📊 {company}의 {y1}~{y2}년 상품별 실적\n\n{table_text}"
+        return f"📊 {company}의 {y1}~{y2}년 상품별 실적\n\n{table_text}", None
+
+    return "❓ 죄송해요! 아직 그 질문엔 답변할 수 없어요.\n질문 형식을 다시 확인해 주세요.", None
+
 
-    return "❓ 죄송해요! 아직 그 질문엔 답변할 수 없어요.\n질문 형식을 다시 확인해 주세요."
+# ✅ 기존 호출 방식 호환: 표 + 요약 (+ opt-in GPT 분석)을 하나의 문자열로 반환
+def answer_query(query, dfs, enrich=GPT_ANALYSIS_DEFAULT):
+    text, analysis = answer_query_stream(query, dfs, enrich)
+    if analysis is None:
+        return text
+    return f"{text}\n\n📍 GPT 분석: {''.join(analysis)}"
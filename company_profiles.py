@@ -0,0 +1,176 @@
+import pandas as pd
+
+from utils import company_aliases
+from query_engine import DISPLAY_COLUMNS, get_annual_table
+from cache_manager import cache_region
+
+# ✅ 회사별 실적 프로필 (로딩 시 1회 생성)
+# profiles["KB증권"] = {
+#     "name": "KB증권",
+#     "rows": 상품/역할/조건/연도/분기별 순위·금액·건수·점유율 (분기=0은 연간 합산),
+#     "best": {(역할, 연도, 분기): 조건 없는 테이블 중 가장 높은 순위의 행(dict)},
+# }
+# 회사 중심 질문(최고 순위, 회사별 상품 실적)은 전체 테이블을 훑지 않고 dict 조회 1번으로 처리한다.
+
+ANNUAL = 0
+PROFILE_COLUMNS = ["상품", "역할", "조건", "연도", "분기", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
+
+
+def company_key(name):
+    return str(name).replace(" ", "")
+
+
+def _profile_frames(dfs):
+    # (상품, 역할, 조건) 3-튜플 키가 중복 없는 전체 테이블 목록
+    for product, role, filter_cond in sorted((k for k in dfs if isinstance(k, tuple) and len(k) == 3), key=str):
+        yield from _table_frames(dfs, product, role, filter_cond)
+
+
+# 테이블 1개의 연간 합산 + 분기 행 (years를 주면 그 연도만)
+def _table_frames(dfs, product, role, filter_cond, years=None):
+    df = dfs[(product, role, filter_cond)]
+    if df is None or df.empty or "주관사" not in df.columns:
+        return
+    tag = {"상품": product, "역할": role, "조건": filter_cond}
+
+    annual = get_annual_table(dfs, product, role, filter_cond)
+    if annual is not None:
+        if years:
+            annual = annual[annual["연도"].isin(years)]
+        yield annual.assign(분기=ANNUAL, **tag)
+
+    if "분기" in df.columns:
+        quarterly = df[df["분기"].notna()][[c for c in DISPLAY_COLUMNS + ["분기"] if c in df.columns]]
+        if years:
+            quarterly = quarterly[quarterly["연도"].isin(years)]
+        yield quarterly.assign(분기=quarterly["분기"].astype(int), **tag)
+
+
+def _profile_rows(frames):
+    rows = pd.concat(frames, ignore_index=True).reindex(columns=PROFILE_COLUMNS)
+    # 분기 원본에는 결측이 섞여 있어 concat 후 float이 되므로 정수형으로 복원
+    for col in ["금액(원)", "건수"]:
+        rows[col] = rows[col].round().astype("Int64")
+    rows["회사키"] = rows["주관사"].map(company_key)
+    return rows
+
+
+def _sort_profile_rows(rows):
+    # 역할/조건까지 정렬 키에 넣어 테이블 생성 순서와 관계없이 같은 순서 (증분 반영 결과와 전체 생성 결과가 같게)
+    return rows.sort_values(["연도", "분기", "상품", "역할", "조건", "순위"], kind="stable").reset_index(drop=True)
+
+
+# 기간별 최고 순위 (동순위면 상품명 순으로 먼저 나오는 상품)
+def _best_records(rows):
+    best_rows = (
+        rows[rows["조건"].isna()]
+        .sort_values(["순위", "상품"])
+        .drop_duplicates([c for c in ["회사키", "역할", "연도", "분기"] if c in rows.columns])
+    )
+    return best_rows.to_dict("records")
+
+
+def build_company_profiles(dfs):
+    frames = list(_profile_frames(dfs))
+    if not frames:
+        return {}
+    rows = _profile_rows(frames)
+
+    profiles = {}
+    for key, group in rows.groupby("회사키", sort=False):
+        profiles[key] = {
+            "name": group["주관사"].iloc[0],
+            "rows": _sort_profile_rows(group.drop(columns="회사키")),
+            "best": {},
+        }
+
+    for record in _best_records(rows):
+        key = record.pop("회사키")
+        profiles[key]["best"][(record["역할"], record["연도"], record["분기"])] = record
+    return profiles
+
+
+_profile_cache = cache_region("company_profiles")
+
+def get_company_profiles(dfs):
+    return _profile_cache.get_or_build(id(dfs), lambda: build_company_profiles(dfs), anchor=dfs)
+
+
+def get_company_profile(dfs, company):
+    return get_company_profiles(dfs).get(company_key(company_aliases.get(company, company)))
+
+
+def _matches(series, value):
+    return series.isna() if value is None else series == value
+
+
+# ✅ 증분 반영: 테이블 1개의 years 연도 행만 교체 (companies: 이전 테이블에서 그 연도에 실적이 있던 회사)
+# 새 행이 있거나 이전 행이 있던 회사만 한 번에 다시 정리하고, 나머지 회사 프로필은 그대로 공유한다.
+# 조회 중인 요청이 이전 프로필을 계속 볼 수 있도록 dict를 새로 만들어 한 번에 바꿔 끼운다.
+def update_company_profiles(dfs, table_key, years, companies=()):
+    cached = _profile_cache.peek(id(dfs), anchor=dfs)
+    if cached is None:
+        return None
+    previous, cost = cached
+    product, role, filter_cond = table_key
+    frames = list(_table_frames(dfs, product, role, filter_cond, years))
+    profiles = dict(previous)
+
+    affected = {company_key(c) for c in companies}
+    parts = [_profile_rows(frames)] if frames else []
+    affected |= set(parts[0]["회사키"]) if parts else set()
+    parts += [profiles[key]["rows"].assign(회사키=key) for key in affected if key in profiles]
+    if not parts:
+        return _profile_cache.put(id(dfs), profiles, anchor=dfs, cost=cost)
+
+    rows = pd.concat(parts, ignore_index=True)
+    stale = (rows["상품"] == product) & _matches(rows["역할"], role) & _matches(rows["조건"], filter_cond) & rows["연도"].isin(years)
+    # 새 행은 맨 앞에 있으므로 이전 행 중 교체 대상만 제거
+    if frames:
+        stale &= rows.index >= len(parts[0])
+    rows = _sort_profile_rows(rows[~stale])
+
+    best_by_company = {}
+    for record in _best_records(rows[rows["연도"].isin(years)]):
+        best_by_company.setdefault(record.pop("회사키"), []).append(record)
+    groups = dict(tuple(rows.groupby("회사키", sort=False)))
+
+    for key in affected:
+        group = groups.get(key)
+        if group is None:
+            profiles.pop(key, None)
+            continue
+        previous = profiles.get(key)
+        best = {k: v for k, v in previous["best"].items() if k[1] not in years} if previous is not None else {}
+        for record in best_by_company.get(key, []):
+            best[(record["역할"], record["연도"], record["분기"])] = record
+        profiles[key] = {
+            "name": previous["name"] if previous is not None else group["주관사"].iloc[0],
+            "rows": group.drop(columns="회사키").reset_index(drop=True),
+            "best": best,
+        }
+
+    return _profile_cache.put(id(dfs), profiles, anchor=dfs, cost=cost)
+
+
+# ✅ 프로필에서 조건에 맞는 행만 선택 (기본: 대표주관, 조건 없음, 연간 합산)
+def profile_rows(profile, years=None, role="lead", quarter=ANNUAL, products=None):
+    rows = profile["rows"]
+    # 역할 구분이 없는 테이블(예: corp)은 어떤 역할로 조회해도 포함 (get_table 폴백과 동일)
+    mask = ((rows["역할"] == role) | rows["역할"].isna()) & rows["조건"].isna() & (rows["분기"] == quarter)
+    if years:
+        mask &= rows["연도"].isin(years)
+    if products:
+        mask &= rows["상품"].isin(products)
+    return rows[mask]
+
+
+# ✅ 요청 연도 중 최고 순위 1건 (years가 비어 있으면 전체 기간)
+def best_rank(profile, years=None, role="lead", quarter=ANNUAL):
+    candidates = [
+        record for (r, year, q), record in profile["best"].items()
+        if (r == role or pd.isna(r)) and q == quarter and (not years or year in years)
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda record: (record["순위"], record["상품"], -record["연도"]))
@@ -0,0 +1,142 @@
+import pandas as pd
+
+from query_engine import get_annual_table, rerank, product_display_names
+from cache_manager import cache_region
+
+# ✅ 구성 상품 테이블을 합산해 임의의 상품 조합 리그테이블을 계산
+# 예: SB+FB(ABS 제외), ECM에서 IPO 제외 → 금액/건수 재합산 → 점유율/순위 재계산
+# 같은 조합의 파일((상품, 역할, 조건) 테이블)이 있으면 그 파일을 그대로 쓰고, 파일로 제공되지 않는 조합만 구성 테이블을 합산한다.
+# 합산 결과는 근사치: 파일 금액은 백만 원 단위 반올림·균등 배분 후 값이라 구성 테이블 합과 연도·회사에 따라
+# 수백만 원씩 차이 나고(예: DCM 2020·2021년), 금액이 비슷한 하위권은 순위가 바뀔 수 있다 (예: DCM noabs 2023년).
+#   - COMPONENTS: 더 이상 쪼갤 수 없는 구성 상품 → (상품, 조건) 테이블
+#   - COMPOSITES: 구성 상품의 합으로 정의되는 상위 상품
+#   - SHIPPED: 구성 상품 조합 → 같은 범위를 집계한 파일 (상품, 조건)
+
+COMPONENTS = {
+    "sb": ("dcm", "nofbabs"),  # DCM에서 FB·ABS를 뺀 일반회사채 등
+    "fb": ("fb", None),
+    "abs": ("abs", None),
+    "ipo": ("ipo", None),
+    "ro": ("ro", None),
+    "cb": ("cb", None),
+    "bw": ("bw", None),
+    "eb": ("eb", None),
+    "elb": ("elb", None),
+    "blockdeal": ("blockdeal", None),
+}
+
+COMPOSITES = {
+    "dcm": ["sb", "fb", "abs"],
+    "ecm": ["ipo", "ro", "cb", "bw", "eb"],
+}
+
+# 기존 조건(filter_cond) 파일이 없을 때 조합으로 대신 계산 (nofbabs는 sb 구성 테이블 자체)
+FILTER_COMPONENTS = {
+    ("dcm", None): ["sb", "fb", "abs"],
+    ("dcm", "noabs"): ["sb", "fb"],
+}
+
+
+SHIPPED = {
+    frozenset(["sb", "fb", "abs"]): ("dcm", None),
+    frozenset(["sb", "fb"]): ("dcm", "noabs"),
+    frozenset(["ipo", "ro", "cb", "bw", "eb"]): ("ecm", None),
+    **{frozenset([component]): table for component, table in COMPONENTS.items()},
+}
+
+
+def expand(products):
+    components = []
+    for product in products:
+        for component in COMPOSITES.get(product, [product]):
+            if component not in components:
+                components.append(component)
+    return components
+
+
+def resolve_components(products, exclude=()):
+    excluded = set(expand(exclude))
+    return [c for c in expand(products) if c not in excluded]
+
+
+def composite_label(products, exclude=()):
+    name = "+".join(product_display_names.get(p, p.upper()) for p in products)
+    if exclude:
+        name += f"({', '.join(product_display_names.get(p, p.upper()) for p in exclude)} 제외)"
+    return name
+
+
+def _component_annual(dfs, component, role):
+    product, filter_cond = COMPONENTS.get(component, (component, None))
+    return get_annual_table(dfs, product, role, filter_cond)
+
+
+def _implied_market(annual):
+    implied = (annual["금액(원)"] / annual["점유율(%)"] * 100).where(annual["점유율(%)"] > 0)
+    return implied.groupby(annual["연도"]).median()
+
+
+def compose_table(dfs, components, role="lead", years=None):
+    frames, markets, missing = [], [], []
+    for component in components:
+        annual = _component_annual(dfs, component, role)
+        if annual is None or annual.empty:
+            missing.append(component)
+            continue
+        if years:
+            annual = annual[annual["연도"].isin(years)]
+        frames.append(annual[["연도", "주관사", "금액(원)", "건수"]])
+        markets.append(_implied_market(annual))
+    if not frames:
+        return None, missing
+
+    combined = pd.concat(frames, ignore_index=True).groupby(["연도", "주관사"], as_index=False)[["금액(원)", "건수"]].sum()
+    # 연도 합산 테이블 중 원본 그대로인 것(분기 컬럼 없는 파일)은 실수형일 수 있어 합계를 정수로 복원
+    for col in ["금액(원)", "건수"]:
+        if combined[col].dtype.kind == "f":
+            combined[col] = combined[col].round().astype("int64")
+    market = pd.concat(markets, axis=1).sum(axis=1, min_count=1)
+    return rerank(combined, market), missing
+
+
+# 조합과 같은 범위의 파일 테이블이 있으면 그 연도 합산 테이블 (없으면 None)
+def shipped_table(dfs, components, role="lead"):
+    table = SHIPPED.get(frozenset(components))
+    if table is None:
+        return None
+    product, filter_cond = table
+    df = dfs.get((product, role, filter_cond))
+    if df is None or df.empty:
+        return None
+    return get_annual_table(dfs, product, role, filter_cond)
+
+
+_composite_cache = cache_region("composite")
+
+# 반환값: (연도 합산 테이블, [데이터 없는 구성 상품]) — 파일이 있는 조합은 파일 우선, 없을 때만 합산
+def get_composite_table(dfs, components, role="lead"):
+    shipped = shipped_table(dfs, components, role)
+    if shipped is not None:
+        return shipped, []
+    key = (id(dfs), role, tuple(components))
+    return _composite_cache.get_or_build(key, lambda: compose_table(dfs, components, role), anchor=dfs)
+
+
+# ✅ 증분 반영: 구성 테이블 중 하나가 new_annual로 바뀌었으면 해당 연도만 다시 합산해 끼워 넣음
+# 반환값: [(이전 조합 테이블, 새 조합 테이블)] (피벗/지표 캐시도 같은 연도만 갱신하도록 넘김)
+def update_composites(dfs, new_annual, years):
+    replaced = []
+    for key, anchor, (previous, _) in _composite_cache.items():
+        _, role, components = key
+        if anchor is not dfs or previous is None:
+            continue
+        if not any(_component_annual(dfs, c, role) is new_annual for c in components):
+            continue
+        part, missing = compose_table(dfs, components, role, years)
+        table = previous[~previous["연도"].isin(years)]
+        if part is not None:
+            table = pd.concat([table, part], ignore_index=True).sort_values(["연도", "순위"], kind="stable").reset_index(drop=True)
+        entry = _composite_cache.peek(key, anchor=dfs)
+        _composite_cache.put(key, (table, missing), anchor=dfs, cost=entry[1] if entry else 0.0)
+        replaced.append((previous, table))
+    return replaced
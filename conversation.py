@@ -0,0 +1,180 @@
+import re
+import json
+import copy
+import time
+
+from llm_stub import rule_based_parse
+from query_engine import run_query, run_query_by_product, run_compound, normalize_intent, split_intents, count_query
+from cache_manager import cache_region, store_version
+from deadline import check_cancelled
+
+# ✅ 세션별 대화 상태: 직전 질문의 해석 결과(parsed)와 결과 표를 기억해 후속 질문을 변경분(delta)으로 처리
+# 예) "2024년 DCM 상위 5개" → "그럼 2023년은?"        : years만 교체 (GPT 호출 없음)
+#                          → "KB증권도 추가해줘"      : company에 추가
+#                          → "그럼 ECM은?"           : product 교체, 다른 조건 유지
+#                          → "점유율은?"             : columns만 교체
+# 후속 질문은 명시적 표현(그럼/대신/추가/빼줘 …)이 있거나, 질문에 자기 상품·회사·연도가 하나도 없을 때만 인정
+# ("2024년 IPO 1위는?"처럼 상품/회사/연도를 직접 말한 질문은 어미와 관계없이 새 질문으로 해석 → 이전 회사/순위 조건을 물려받지 않음)
+# 실행 결과는 상품 단위(sub-intent)로 저장해 두고, 바뀐 상품 조각만 다시 계산한다 (여러 조각이 비어 있으면 한 번의 필터로 함께 계산).
+# 조각은 세션끼리 공유하는 캐시 영역(query_results)에 두므로 다른 세션이 같은 조각을 물어도 재사용된다.
+
+FOLLOWUP_MARKERS = ["그럼", "그러면", "이번엔", "이번에는", "대신", "추가", "빼줘", "빼고", "제외해", "만 보여", "도 보여", "도?", "도요"]
+LEADING_MARKERS = re.compile(r"^(?:그럼|그러면|이번엔|이번에는|대신)\s+")  # "대신 IPO로"의 '대신'을 대신증권으로 읽지 않도록 제거
+ADD_MARKERS = ["추가", "도 ", "도?", "도요", "도 보여", "랑", "와 같이"]
+REMOVE_MARKERS = ["빼줘", "빼고", "제외"]
+MAX_FOLLOWUP_LENGTH = 30
+
+
+# delta: 질문만 로컬 규칙으로 해석한 결과 (자기 상품/연도가 있는지 확인용)
+def _is_followup(query, delta):
+    text = query.strip()
+    if len(text) > MAX_FOLLOWUP_LENGTH:
+        return False
+    marked = any(m in text.replace("대신증권", "") for m in FOLLOWUP_MARKERS)  # 회사명 속 '대신'은 표현으로 보지 않음
+    return marked or not (delta.get("product") or delta.get("company") or delta.get("years"))
+
+
+# ✅ 후속 질문을 로컬 규칙으로 해석해 직전 parsed에 적용 (후속 질문이 아니면 None → GPT 해석)
+def apply_followup(query, last_parsed):
+    if not last_parsed:
+        return None
+    delta = rule_based_parse(LEADING_MARKERS.sub("", query.strip()))
+    if "message" in delta or not _is_followup(query, delta):
+        return None
+
+    merged = copy.deepcopy(last_parsed)
+    changed = []
+
+    if delta.get("years"):
+        merged["years"] = delta["years"]
+        changed.append("years")
+
+    if delta.get("company"):
+        current = merged.get("company") or []
+        current = [current] if isinstance(current, str) else list(current)
+        if any(m in query for m in REMOVE_MARKERS):
+            merged["company"] = [c for c in current if c not in delta["company"]]
+        elif any(m in query for m in ADD_MARKERS):
+            merged["company"] = current + [c for c in delta["company"] if c not in current]
+        else:
+            merged["company"] = delta["company"]
+        changed.append("company")
+
+    if delta.get("product"):
+        merged["product"] = delta["product"]
+        changed.append("product")
+    if delta.get("exclude"):
+        merged["exclude"] = delta["exclude"]
+        changed.append("exclude")
+
+    # 상위 N과 순위 범위는 서로 대체
+    for key, other in (("top_n", "rank_range"), ("rank_range", "top_n")):
+        if delta.get(key):
+            merged[key] = delta[key]
+            merged.pop(other, None)
+            changed.append(key)
+    if delta.get("analysis"):
+        merged["analysis"] = delta["analysis"]
+        changed.append("analysis")
+    if delta.get("columns"):
+        merged["columns"] = delta["columns"]
+        changed.append("columns")
+    for key in ("is_chart", "is_compare", "combine"):
+        if delta.get(key):
+            merged[key] = True
+            changed.append(key)
+
+    if not changed:
+        return None
+    return merged, changed
+
+
+# 새 분기가 반영되면(데이터 버전 증가) 이전 조각은 조회 시 버리고 다시 계산
+_slice_cache = cache_region("query_results", versioned=True)
+
+
+def _slice_key(parsed):
+    intent = normalize_intent(parsed)
+    return json.dumps(intent, ensure_ascii=False, sort_keys=True, default=str)
+
+
+# 상품별 조각으로 나눠 실행하고, 이전 턴과 같은 조각은 저장된 결과 재사용
+def _sub_intents(parsed):
+    products = parsed.get("product") or []
+    products = [products] if isinstance(products, str) else products
+    if len(products) <= 1 or parsed.get("combine") or parsed.get("exclude") or parsed.get("analysis"):
+        return [parsed]
+    return [{**parsed, "product": [p]} for p in products]
+
+
+# ✅ 단일 요청을 조각 캐시(query_results) 기준으로 실행 — 집계(QUERY_COUNT) 없음
+# 대화 상태와 시작 시 캐시 워밍(query_log.warm_from_log)이 같은 조각 키를 쓰도록 공용으로 둠
+# 캐시에 없는 상품 조각이 여럿이면 run_query를 상품마다 돌리지 않고 한 번의 필터로 함께 계산해 상품별로 저장
+def run_slices(parsed, dfs):
+    merged = {"intent": normalize_intent(parsed), "results": [], "warnings": []}
+    subs = _sub_intents(parsed)
+    keys = [(id(dfs), _slice_key(sub)) for sub in subs]
+    slices = {key: _slice_cache.get(key, dfs) for key in keys}
+    missing = [(sub, key) for sub, key in zip(subs, keys) if slices[key] is None]
+    check_cancelled("filter")  # 중단된 요청의 조각은 캐시에 남기지 않음
+    if len(missing) == 1:
+        sub, key = missing[0]
+        slices[key] = _slice_cache.get_or_build(key, lambda: run_query(sub, dfs, count=False), anchor=dfs)
+    elif missing:
+        version, started = store_version(), time.perf_counter()
+        fused = run_query_by_product({**parsed, "product": [p for sub, _ in missing for p in sub["product"]]}, dfs)
+        cost = (time.perf_counter() - started) / len(missing)
+        check_cancelled("filter")
+        for sub, key in missing:
+            product = normalize_intent(sub)["products"][0]
+            slices[key] = _slice_cache.put(key, fused[product], anchor=dfs, cost=cost, version=version)
+    for key in keys:
+        merged["results"] += slices[key]["results"]
+        merged["warnings"] += slices[key]["warnings"]
+    return merged
+
+
+class ConversationState:
+    def __init__(self):
+        self.last_parsed = None
+        self.last_result = None
+        self.turns = 0
+
+    # 후속 질문이면 로컬 delta 적용, 아니면 parser(GPT) 호출 → (parsed, changed or None)
+    def resolve(self, query, parser):
+        followup = apply_followup(query, self.last_parsed)
+        if followup is not None:
+            return followup
+        return parser(query), None
+
+    # 앱처럼 결과를 직접 그리는 경로에서도 다음 후속 질문의 기준으로 기억
+    # 복합 질문이면 마지막 요청을 기준으로 삼음 ("그럼 2023년은?" → 가장 최근에 물은 요청에 적용)
+    def remember(self, parsed):
+        subs = [sub for sub in split_intents(parsed) if not ("message" in sub and len(sub) == 1)]
+        self.last_parsed = subs[-1] if subs else parsed
+        self.turns += 1
+
+    def run(self, parsed, dfs):
+        if "intents" in parsed:
+            merged = run_compound(parsed, dfs, runner=self._run_single)
+        else:
+            merged = self._run_single(parsed, dfs)
+        self.last_result = merged
+        return merged
+
+    def _run_single(self, parsed, dfs):
+        if "message" in parsed and len(parsed) == 1:
+            return run_query(parsed, dfs)
+        count_query(normalize_intent(parsed))  # 조각을 캐시에서 꺼내도 질문 1건으로 집계 (조각 계산에서는 집계하지 않음)
+        return run_slices(parsed, dfs)
+
+
+def describe_changes(changed, parsed):
+    labels = {"years": "연도", "company": "증권사", "product": "상품", "exclude": "제외 상품", "top_n": "상위 N",
+              "rank_range": "순위 범위", "analysis": "분석", "columns": "항목", "is_chart": "그래프",
+              "is_compare": "비교", "combine": "합산"}
+    parts = []
+    for key in changed:
+        value = parsed.get(key)
+        parts.append(f"{labels.get(key, key)}: {value}" if not isinstance(value, bool) else labels.get(key, key))
+    return ", ".join(parts)
@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from metrics import REQUEST_CANCELLATIONS
+
+# ✅ 요청 단위 마감 시간(deadline) + 취소 토큰
+# 사용자가 다시 질문하거나 페이지를 떠나면 Streamlit은 스크립트를 멈추지만, 이미 시작된 GPT 호출이나
+# pandas 작업은 끝까지 돌면서 워커 스레드를 잡고 있다. 요청마다 CancelToken을 만들어 contextvar로 흘려보내고
+#   - 단계 경계(해석 → 조회 → 차트, 상품/요청별 반복)에서 check_cancelled()로 확인해 바로 중단
+#   - GPT 호출은 남은 시간을 HTTP timeout으로 넘기고, 취소되면 on_cancel()로 등록한 정리 함수(클라이언트 close)로 끊음
+#   - GPT 해석 단계만 따로 LEAGUE_PARSE_TIMEOUT 예산(stage_deadline)을 두고, 넘기면 로컬 규칙 해석으로 결과를 냄
+# 요청 전체 예산은 LEAGUE_REQUEST_TIMEOUT초 (0이면 마감 없음, 취소만 동작)
+# 토큰이 없는 호출(배치/테스트)은 check_cancelled()가 아무것도 하지 않는다.
+
+REQUEST_TIMEOUT = float(os.getenv("LEAGUE_REQUEST_TIMEOUT", "60"))
+PARSE_TIMEOUT = float(os.getenv("LEAGUE_PARSE_TIMEOUT", "15"))
+WATCH_INTERVAL = 0.1
+
+
+class RequestCancelled(Exception):
+    def __init__(self, reason, stage=None):
+        super().__init__(f"요청이 중단되었습니다 ({reason}{f', {stage}' if stage else ''})")
+        self.reason = reason
+        self.stage = stage
+
+
+class DeadlineExceeded(RequestCancelled):
+    def __init__(self, stage=None):
+        super().__init__("deadline", stage)
+
+
+class CancelToken:
+    def __init__(self, timeout=None, parent=None, stage=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        if parent is not None and parent.deadline is not None:
+            deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+        self.deadline = deadline
+        self.parent = parent
+        self.stage = stage
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def cancelled(self):
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self, stage=None):
+        if self.parent is not None:
+            self.parent.check(stage)
+        if self._event.is_set():
+            raise DeadlineExceeded(stage or self.stage) if self.reason == "deadline" else RequestCancelled(self.reason, stage)
+        if self.expired():
+            self.cancel("deadline")
+            REQUEST_CANCELLATIONS.inc(stage=stage or self.stage or "-", reason="deadline")
+            raise DeadlineExceeded(stage or self.stage)
+
+    # 블로킹 호출을 끊을 정리 함수 등록 (이미 취소됐으면 바로 실행), 반환값은 등록 해제 함수
+    def add_callback(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+_current_token = contextvars.ContextVar("league_cancel_token", default=None)
+
+
+def current_token():
+    return _current_token.get()
+
+
+def check_cancelled(stage=None):
+    token = _current_token.get()
+    if token is not None:
+        token.check(stage)
+
+
+def remaining():
+    token = _current_token.get()
+    return None if token is None else token.remaining()
+
+
+# ✅ 요청 1건의 토큰 설정 (timeout=0이면 마감 없이 취소만)
+@contextmanager
+def request_scope(timeout=REQUEST_TIMEOUT, token=None):
+    token = token or CancelToken(timeout or None)
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+# ✅ 단계별 예산: 상위 요청의 취소/마감을 따르면서 이 단계만 더 짧은 마감을 둠
+@contextmanager
+def stage_deadline(seconds, stage):
+    parent = _current_token.get()
+    token = CancelToken(seconds or None, parent=parent, stage=stage)
+    if parent is not None:
+        # 상위 요청이 취소되면 이 단계에 등록된 정리 함수도 실행
+        unregister = parent.add_callback(lambda: token.cancel(parent.reason or "cancelled"))
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+        if parent is not None:
+            unregister()
+
+
+# ✅ 현재 요청이 취소되면 callback 실행 (예: 진행 중인 GPT HTTP 연결 close)
+@contextmanager
+def on_cancel(callback):
+    token = _current_token.get()
+    if token is None or callback is None:
+        yield
+        return
+    unregister = token.add_callback(callback)
+    try:
+        yield
+    finally:
+        unregister()
+
+
+# ✅ 요청 스레드 밖에서만 알 수 있는 중단 신호(Streamlit rerun/stop, HTTP 연결 끊김)를 감시하는 공용 스레드
+# watch(token, is_abandoned): is_abandoned()가 True가 되면 token.cancel("abandoned")
+class _Watcher:
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, token, is_abandoned):
+        with self._lock:
+            self._watches[id(token)] = (token, is_abandoned)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="league-cancel-watcher", daemon=True)
+                self._thread.start()
+
+    def remove(self, token):
+        with self._lock:
+            self._watches.pop(id(token), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = list(self._watches.values())
+                if not watches:
+                    self._thread = None
+                    return
+            for token, is_abandoned in watches:
+                try:
+                    abandoned = is_abandoned()
+                except Exception:
+                    abandoned = False
+                if abandoned and not token.cancelled:
+                    REQUEST_CANCELLATIONS.inc(stage="-", reason="abandoned")
+                    token.cancel("abandoned")
+
+
+_WATCHER = _Watcher()
+
+
+@contextmanager
+def watch(token, is_abandoned):
+    _WATCHER.add(token, is_abandoned)
+    try:
+        yield token
+    finally:
+        _WATCHER.remove(token)
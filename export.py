@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import argparse
+import contextlib
+
+import pandas as pd
+
+# ✅ 결과 표 내보내기 (CSV / Parquet / XLSX)
+# 표를 CHUNK_ROWS 행씩 잘라 순서대로 기록하므로, 여러 표를 이어 붙인 대용량 덤프도
+# 전체를 하나의 DataFrame으로 합치지 않고 쓸 수 있다. (첫 청크의 컬럼 구성이 파일 스키마)
+# 실행: python export.py -o dump.parquet                       ← 전체 상품 × 전체 연도 (연도 합산)
+#       python export.py -o dcm.xlsx --products dcm,sb --years 2020-2024 --quarterly
+
+CHUNK_ROWS = int(os.getenv("LEAGUE_EXPORT_CHUNK_ROWS", "50000"))
+XLSX_MAX_ROWS = 1_048_575  # 시트당 최대 행(헤더 제외), 넘으면 다음 시트로
+
+EXPORT_COLUMNS = ["연도", "분기", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def iter_chunks(frames, chunk_rows=CHUNK_ROWS):
+    for frame in frames:
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+
+
+def _aligned(chunks):
+    # 첫 청크의 컬럼 순서로 이후 청크를 맞춤 → (columns, chunk) 순서대로 반환
+    columns = None
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+        yield columns, chunk.reindex(columns=columns)
+
+
+def write_csv(chunks, f):
+    f.write("\ufeff".encode("utf-8"))  # 엑셀에서 한글이 깨지지 않도록 BOM
+    header = True
+    for _, chunk in _aligned(chunks):
+        chunk.to_csv(f, header=header, index=False, encoding="utf-8")
+        header = False
+
+
+def write_parquet(chunks, f):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, schema = None, None
+    try:
+        for _, chunk in _aligned(chunks):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # 첫 청크에서 값이 전부 비어 있던 컬럼은 문자열로 고정 (이후 청크 값과 타입이 맞도록)
+                empty = set(chunk.columns[chunk.isna().all()])
+                schema = pa.schema([pa.field(field.name, pa.string()) if field.name in empty else field for field in table.schema])
+                writer = pq.ParquetWriter(f, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.table({}), f)
+
+
+def _cell(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_xlsx(chunks, f, sheet_name="결과"):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)  # 행을 바로 임시 파일로 흘려보내는 모드
+    sheet, rows, part, columns = None, 0, 0, []
+    for columns, chunk in _aligned(chunks):
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet is None or rows >= XLSX_MAX_ROWS:
+                part += 1
+                sheet = workbook.create_sheet(sheet_name if part == 1 else f"{sheet_name}_{part}")
+                sheet.append(columns)
+                rows = 0
+            sheet.append([_cell(v) for v in row])
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet(sheet_name).append(columns)
+    workbook.save(f)
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet, "xlsx": write_xlsx}
+
+
+# frames: DataFrame 목록 또는 하나씩 만들어 내는 generator / f: 바이너리 파일 객체
+def export_frames(frames, fmt, f, chunk_rows=CHUNK_ROWS):
+    if fmt not in WRITERS:
+        raise ValueError(f"지원하지 않는 형식입니다: {fmt} (가능: {', '.join(WRITERS)})")
+    WRITERS[fmt](iter_chunks(frames, chunk_rows), f)
+
+
+def export_bytes(frame, fmt):
+    buffer = io.BytesIO()
+    export_frames([frame], fmt, buffer)
+    return buffer.getvalue()
+
+
+def format_from_path(path):
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if ext not in WRITERS:
+        raise ValueError(f"출력 파일 확장자는 {', '.join(WRITERS)} 중 하나여야 합니다: {path}")
+    return ext
+
+
+# ✅ 저장소의 (상품, 역할, 조건) 테이블을 하나씩 꺼내 앞에 구분 컬럼을 붙여 반환 (전체를 합치지 않음)
+def iter_store_tables(dfs, products=None, years=None, quarterly=False):
+    from query_engine import get_annual_table, resolve_annual_table
+
+    keys = sorted((k for k in dfs if isinstance(k, tuple) and len(k) == 3), key=lambda k: tuple(str(p) for p in k))
+    if products:
+        keys = [k for k in keys if k[0] in products]
+        # 파일이 없는 상품(sb 등)은 구성 상품 합산 테이블로 대신 (연도 합산만 가능)
+        if not quarterly:
+            keys += [(p, "lead", None) for p in products if p not in {k[0] for k in keys}]
+
+    for product, role, filter_cond in keys:
+        if (product, role, filter_cond) in dfs:
+            table = dfs[(product, role, filter_cond)] if quarterly else get_annual_table(dfs, product, role, filter_cond)
+        else:
+            table = resolve_annual_table(dfs, product, role, filter_cond)
+        if table is None or table.empty:
+            continue
+        if years:
+            table = table[table["연도"].isin(years)]
+        # 원본 분기 파일은 엑셀 원래 컬럼도 갖고 있으므로 표준 컬럼만 내보냄
+        table = table[[c for c in EXPORT_COLUMNS if c in table.columns]]
+        labels = pd.DataFrame({"상품": product, "역할": role or "", "조건": filter_cond or ""}, index=table.index)
+        yield pd.concat([labels, table], axis=1)
+
+
+def _parse_years(text):
+    if not text:
+        return None
+    years = []
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        years += list(range(int(start), int(end or start) + 1))
+    return years
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="리그테이블 데이터 일괄 내보내기 (CSV / Parquet / XLSX)")
+    arg_parser.add_argument("-o", "--output", required=True, help="출력 파일 (.csv / .parquet / .xlsx)")
+    arg_parser.add_argument("--products", help="상품 목록 (쉼표 구분, 기본: 전체)")
+    arg_parser.add_argument("--years", help="연도 (예: 2020-2024 또는 2022,2024, 기본: 전체)")
+    arg_parser.add_argument("--quarterly", action="store_true", help="연도 합산 대신 원본 분기 행 그대로")
+    arg_parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = arg_parser.parse_args()
+
+    from query_engine import load_store
+
+    fmt = format_from_path(args.output)
+    products = [p.strip().lower() for p in args.products.split(",")] if args.products else None
+    with contextlib.redirect_stdout(sys.stderr):
+        dfs, _ = load_store()
+    with open(args.output, "wb") as f:
+        export_frames(iter_store_tables(dfs, products, _parse_years(args.years), args.quarterly), fmt, f, args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from utils import plot_line_chart_plotly # 단일 y축 라인 차트 함수
+from utils import plot_line_chart_plotly, render_dataframe # 단일 y축 라인 차트 함수
+from company_profiles import get_company_profile, profile_rows
+from deadline import check_cancelled
 
 def handle_company_year_chart_logic(parsed, dfs):
     companies = parsed.get("company")
@@ -36,18 +38,13 @@ def handle_company_year_chart_logic(parsed, dfs):
 
     found_data_for_company = False
 
-    for product_name_iter, df_iter_original in dfs.items():
-        if df_iter_original is None or df_iter_original.empty:
-            continue
-        df_iter = df_iter_original.copy() # 원본 수정 방지
-        df_iter.columns = df_iter.columns.str.strip()
-
-        # 특정 회사 데이터 필터링
-        df_company_product_all_years = df_iter[df_iter["주관사"].isin(companies)]
-
-        if df_company_product_all_years.empty:
-            continue
+    # 로딩 시 만들어 둔 회사 프로필에서 대표주관 연간 실적만 가져옴 (전체 테이블 복사/순회 없음)
+    profiles = [get_company_profile(dfs, c) for c in companies]
+    profile_frames = [profile_rows(p) for p in profiles if p is not None]
+    df_company_all = pd.concat(profile_frames) if profile_frames else pd.DataFrame(columns=["상품", "연도", "주관사"])
 
+    for product_name_iter, df_company_product_all_years in df_company_all.groupby("상품", sort=True):
+        check_cancelled("filter")
         found_data_for_company = True # 해당 회사에 대한 데이터를 하나라도 찾음
 
         # 테이블 데이터 준비 (요청 연도 있든 없든)
@@ -76,10 +73,11 @@ def handle_company_year_chart_logic(parsed, dfs):
         st.subheader(f"📄 {', '.join(companies)}의 상품별 실적 데이터")
         # 연도 우선, 그 다음 상품명으로 정렬
         for key_table in sorted(table_data_to_display_company_no_prod.keys(), key=lambda x: (x.split("_")[2], x.split("_")[1])):
+            check_cancelled("render")
             df_to_show = table_data_to_display_company_no_prod[key_table]
             _, p_name, yr, comps_str = key_table.split("_", 3)
             st.markdown(f"**{yr}년 {p_name}** ({comps_str})")
-            st.dataframe(df_to_show.reset_index(drop=True))
+            render_dataframe(df_to_show.reset_index(drop=True), key=key_table)
     elif not is_chart_requested: # 차트 요청도 없고 테이블 데이터도 없을 때 (매우 드문 경우)
         st.info(f"'{', '.join(companies)}'에 대한 조회 가능한 실적 데이터가 없습니다.")
 
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import argparse
+import threading
+
+import pandas as pd
+
+from utils import clean_raw_frame, read_workbook, parse_table_name
+from tracing import span
+from metrics import INGESTED_PERIODS
+from query_engine import get_annual_table, update_annual_table
+from cache_manager import bump_store_version
+from composition import update_composites
+from analytics import update_analytics
+from narrative import update_year_records
+from company_profiles import update_company_profiles
+from milestones import update_milestones
+
+logger = logging.getLogger("league.ingest")
+
+# ✅ 분기 실적 증분 반영 (append/upsert)
+# 분기 발표마다 엑셀에는 새 '기간' 행만 늘어나므로, 저장된 테이블과 기간 단위로 비교해
+# 새로 생긴 기간과 값이 바뀐 기간의 행만 넣고(다른 기간 행은 그대로) 파생 구조도 그 연도만 갱신한다.
+#   - 연도 합산 테이블 / 상품 조합 테이블 / 회사 × 연도 피벗 / 시장 구조 지표 / 요약용 연도별 행: 바뀐 연도만 다시 계산해 교체
+#   - 회사별 프로필: 그 테이블·연도에 실적이 있는 회사만 다시 정리
+#   - 순위 이정표 색인: 연속 기록이 마지막 기간에 따라 바뀌므로 반영한 테이블만 통째로 다시 계산
+#   - 상품 묶음 캐시는 버리고, 데이터 버전을 올려 대화 조각 캐시가 이전 결과를 쓰지 않게 함
+# 실행: python ingest.py 새파일.xlsx --into DCM/dcm_lead_total.xlsx          ← 기간별 diff만 출력
+#       python ingest.py 새파일.xlsx --into DCM/dcm_lead_total.xlsx --write  ← 새/바뀐 기간 행만 저장 파일에 반영
+#   (--into를 생략하면 DCM/ECM 폴더의 같은 이름 파일)
+# 실행 중인 앱/API 서버는 refresh_store()가 LEAGUE_INGEST_POLL_SECONDS마다 엑셀 수정 시각을 확인해
+# 바뀐 파일만 ingest_workbook()으로 메모리에 반영한다 (엑셀 전체 재로딩·캐시 전체 재계산 없음).
+
+PERIOD_COLUMN = "기간"
+COMPARE_COLUMNS = ["순위", "주관사", "금액(원)", "건수", "점유율(%)"]
+DATA_DIRS = ["DCM", "ECM"]
+POLL_SECONDS = float(os.getenv("LEAGUE_INGEST_POLL_SECONDS", "30"))
+
+_ingest_lock = threading.Lock()
+
+
+# 기간 → 행 해시 목록 (숫자는 실수로 맞추고 순위·주관사 순으로 정렬해 엑셀 행 순서와 정수/실수 차이는 무시)
+def _period_digests(df):
+    columns = [c for c in COMPARE_COLUMNS if c in df.columns]
+    rows = df[[PERIOD_COLUMN] + columns].copy()
+    for col in columns:
+        if col != "주관사":
+            rows[col] = pd.to_numeric(rows[col], errors="coerce").astype(float)
+    rows = rows.sort_values([PERIOD_COLUMN] + [c for c in ["순위", "주관사"] if c in columns], kind="stable")
+    hashes = pd.util.hash_pandas_object(rows[columns], index=False)
+    return hashes.groupby(rows[PERIOD_COLUMN].to_numpy(), sort=False).agg(tuple).to_dict()
+
+
+# ✅ 반환값: (새 기간 목록, 값이 바뀐 기간 목록) — 저장 테이블에만 있는 기간은 그대로 둠 (삭제하지 않음)
+def diff_periods(stored, incoming):
+    periods = list(dict.fromkeys(incoming[PERIOD_COLUMN]))
+    before = _period_digests(stored[stored[PERIOD_COLUMN].isin(periods)])
+    after = _period_digests(incoming)
+    new = [p for p in periods if p not in before]
+    changed = [p for p in periods if p in before and before[p] != after[p]]
+    return new, changed
+
+
+# ✅ periods 기간의 행만 incoming 것으로 교체 (원본 엑셀처럼 최신 기간이 위로, 나머지 행 순서는 유지)
+def upsert_periods(stored, incoming, periods):
+    rows = incoming[incoming[PERIOD_COLUMN].isin(periods)].reindex(columns=stored.columns)
+    kept = stored[~stored[PERIOD_COLUMN].isin(periods)]
+    return pd.concat([rows, kept], ignore_index=True)
+
+
+def _table_label(key):
+    return "_".join(str(k) for k in key if k)
+
+
+# ✅ 메모리의 dfs 테이블 1개에 incoming(clean_raw_frame 결과)을 반영하고 파생 캐시를 바뀐 연도만 갱신
+# 반환값: {"table", "new", "changed", "years", "rows"} (바뀐 기간이 없으면 아무것도 바꾸지 않음)
+def ingest_table(dfs, key, incoming):
+    with _ingest_lock, span("ingest", table=_table_label(key)) as ingest_span:
+        stored = dfs.get(key)
+        if stored is None:
+            stored = incoming.iloc[:0]
+        new, changed = diff_periods(stored, incoming)
+        report = {"table": key, "new": new, "changed": changed, "years": [], "rows": 0}
+        ingest_span.set(new=len(new), changed=len(changed))
+        if not new and not changed:
+            return report
+
+        periods = new + changed
+        table = upsert_periods(stored, incoming, periods)
+        years = sorted({int(y) for y in table.loc[table[PERIOD_COLUMN].isin(periods), "연도"]})
+        report.update(years=years, rows=int(table[PERIOD_COLUMN].isin(periods).sum()))
+
+        annuals = update_annual_table(stored, table, years)
+
+        # 이전 테이블을 가리키던 키(상품 / (상품, 역할) / (상품, 역할, 조건))를 새 테이블로 교체 (처음 보는 테이블은 로딩과 같은 키로 등록)
+        product, role, filter_cond = key
+        targets = [k for k, v in list(dfs.items()) if v is stored] or [product, (product, role, filter_cond) if filter_cond else (product, role), key]
+        for k in targets:
+            dfs[k] = table
+
+        new_annual = annuals[1] if annuals is not None else get_annual_table(dfs, product, role, filter_cond)
+        replaced = ([annuals] if annuals is not None else []) + update_composites(dfs, new_annual, years)
+        for old_annual, annual in replaced:
+            update_analytics(old_annual, annual, years)  # 피벗 행렬도 함께 갱신
+            update_year_records(old_annual, annual, years)
+        update_company_profiles(dfs, key, years, stored.loc[stored["연도"].isin(years), "주관사"].unique())
+        update_milestones(dfs, key, stored, replaced)
+        bump_store_version()  # 상품 묶음/질의 결과 조각 캐시는 이전 버전 항목을 버림
+
+        label = _table_label(key)
+        INGESTED_PERIODS.inc(len(new), table=label, kind="new")
+        INGESTED_PERIODS.inc(len(changed), table=label, kind="changed")
+        logger.info("증분 반영 %s: 새 기간 %s, 바뀐 기간 %s (%d행, 연도 %s)", label, new, changed, report["rows"], years)
+        return report
+
+
+def ingest_workbook(dfs, path):
+    return ingest_table(dfs, parse_table_name(path), clean_raw_frame(read_workbook(path)))
+
+
+def _workbook_mtimes(base_dir):
+    mtimes = {}
+    for folder in DATA_DIRS:
+        data_dir = os.path.join(base_dir, folder)
+        if not os.path.isdir(data_dir):
+            continue
+        for filename in os.listdir(data_dir):
+            if filename.endswith(".xlsx"):
+                path = os.path.join(data_dir, filename)
+                mtimes[path] = os.stat(path).st_mtime_ns
+    return mtimes
+
+
+_sources = {}  # id(dfs) → (dfs, {엑셀 경로: 수정 시각}, 마지막 확인 시각)
+
+# ✅ 엑셀 수정 시각이 바뀐 파일만 증분 반영 (첫 호출은 기준 시각만 기록, poll_seconds 안에 다시 부르면 바로 반환)
+def refresh_store(dfs, base_dir=None, poll_seconds=POLL_SECONDS):
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    now = time.monotonic()
+    state = _sources.get(id(dfs))
+    if state is not None and state[0] is dfs and now - state[2] < poll_seconds:
+        return []
+
+    mtimes = _workbook_mtimes(base_dir)
+    reports = []
+    if state is not None and state[0] is dfs:
+        for path, mtime in mtimes.items():
+            if state[1].get(path) == mtime:
+                continue
+            try:
+                reports.append(ingest_workbook(dfs, path))
+            except Exception as e:
+                logger.error("❌ '%s' 증분 반영 실패: %s", path, e)
+    _sources[id(dfs)] = (dfs, mtimes, now)
+    return reports
+
+
+def _default_target(path, base_dir):
+    for folder in DATA_DIRS:
+        candidate = os.path.join(base_dir, folder, os.path.basename(path))
+        if os.path.exists(candidate) and os.path.abspath(candidate) != os.path.abspath(path):
+            return candidate
+    return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="새 분기 엑셀을 저장된 리그테이블 엑셀에 기간 단위로 증분 반영")
+    arg_parser.add_argument("incoming", help="새로 받은 엑셀 파일")
+    arg_parser.add_argument("--into", help="반영할 저장 엑셀 (기본: DCM/ECM 폴더의 같은 이름 파일)")
+    arg_parser.add_argument("--write", action="store_true", help="새/바뀐 기간 행을 저장 파일에 반영 (없으면 diff만 출력)")
+    args = arg_parser.parse_args()
+
+    target = args.into or _default_target(args.incoming, os.path.dirname(os.path.abspath(__file__)))
+    if target is None:
+        arg_parser.error("반영할 저장 엑셀을 찾을 수 없습니다 (--into로 지정)")
+
+    stored_raw, incoming_raw = read_workbook(target), read_workbook(args.incoming)
+    new, changed = diff_periods(clean_raw_frame(stored_raw.copy()), clean_raw_frame(incoming_raw.copy()))
+    print(f"🆕 새 기간: {', '.join(new) or '없음'}")
+    print(f"♻️ 바뀐 기간: {', '.join(changed) or '없음'}")
+    if not (new or changed):
+        return
+    if not args.write:
+        print("ℹ️ --write를 붙이면 위 기간 행만 저장 파일에 반영합니다.")
+        return
+
+    merged = upsert_periods(stored_raw, incoming_raw, new + changed)
+    sheet_name = os.path.basename(target).replace(".xlsx", "").lower()
+    merged.to_excel(target, sheet_name=sheet_name, index=False)
+    print(f"✅ 저장: {target} ({len(merged)}행, 실행 중인 앱/서버는 다음 확인 때 바뀐 기간만 반영)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import copy
+import threading
+
+from metrics import LLM_ADMISSION, LLM_INFLIGHT, LLM_QUEUED
+from deadline import PARSE_TIMEOUT, WATCH_INTERVAL, RequestCancelled, DeadlineExceeded, check_cancelled, remaining, stage_deadline
+
+# ✅ GPT 호출 공통 게이트: 동일 질문 single-flight 합치기 + 전역 동시 호출 제한
+# - 같은 키(정규화된 질문 + 템플릿)로 진행 중인 호출이 있으면 새로 호출하지 않고 결과를 공유
+# - 동시에 LLM_MAX_CONCURRENCY개까지만 호출, 나머지는 최대 LLM_MAX_QUEUE개까지 대기
+# - 대기열이 가득 차거나 LLM_QUEUE_TIMEOUT초 안에 차례가 오지 않으면 LLMOverloaded
+#   → parse_or_degrade()는 이 경우 로컬 규칙 기반 해석으로 즉시 응답
+# - 대기(슬롯/공유 결과) 중에도 요청 취소·마감을 확인하고, 대기 시간은 요청의 남은 시간을 넘지 않음
+#   GPT 해석은 LEAGUE_PARSE_TIMEOUT 안에 끝나지 않으면 마찬가지로 로컬 해석으로 응답
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+
+class LLMOverloaded(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def normalize_query_key(query):
+    return " ".join(query.split()).lower()
+
+
+class LLMGate:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._waiting = 0
+
+    def run(self, key, fn):
+        while True:
+            with self._lock:
+                call = self._inflight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._inflight[key] = _Call()
+            if leader:
+                break
+
+            LLM_ADMISSION.inc(outcome="coalesced")
+            while not call.done.wait(WATCH_INTERVAL):
+                check_cancelled("parse_wait")
+            # 앞선 호출이 그 요청의 취소/마감으로 끊겼으면 이 요청과는 무관하므로 다시 시도
+            if isinstance(call.error, RequestCancelled):
+                continue
+            if call.error is not None:
+                raise call.error
+            # 호출 측에서 결과를 수정해도 서로 영향이 없도록 복사본 전달
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self._admit(fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def _admit(self, fn):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    LLM_ADMISSION.inc(outcome="rejected")
+                    raise LLMOverloaded("GPT 요청 대기열이 가득 찼습니다.")
+                self._waiting += 1
+                LLM_QUEUED.set(self._waiting)
+            try:
+                acquired = self._wait_slot()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+                    LLM_QUEUED.set(self._waiting)
+            if not acquired:
+                check_cancelled("parse_queue")
+                LLM_ADMISSION.inc(outcome="timeout")
+                raise LLMOverloaded(f"GPT 요청이 {self.queue_timeout:g}초 동안 대기열에서 처리되지 못했습니다.")
+
+        try:
+            check_cancelled("parse_queue")
+        except RequestCancelled:
+            self._slots.release()
+            raise
+        LLM_ADMISSION.inc(outcome="admitted")
+        LLM_INFLIGHT.inc()
+        try:
+            return fn()
+        finally:
+            LLM_INFLIGHT.dec()
+            self._slots.release()
+
+    # 대기열 제한 시간과 요청의 남은 시간 중 짧은 쪽만큼 슬롯을 기다림 (중간에 취소되면 바로 중단)
+    def _wait_slot(self):
+        budget = remaining()
+        limit = self.queue_timeout if budget is None else min(self.queue_timeout, budget)
+        waited = 0.0
+        while waited < limit:
+            step = min(WATCH_INTERVAL, limit - waited)
+            if self._slots.acquire(timeout=step):
+                return True
+            waited += step
+            check_cancelled("parse_queue")
+        return False
+
+
+LLM_GATE = LLMGate()
+
+
+# ✅ 과부하/해석 시간 초과 시 GPT 대신 로컬 규칙 기반 해석으로 응답 → (parsed, degraded)
+# 요청 자체가 취소되었거나 요청 전체 마감이 지났으면 그대로 예외를 올림
+def parse_or_degrade(query, parser):
+    try:
+        with stage_deadline(PARSE_TIMEOUT, "parse"):
+            return parser(query), False
+    except LLMOverloaded:
+        pass
+    except DeadlineExceeded:
+        check_cancelled("parse")
+    from llm_stub import rule_based_parse
+    return rule_based_parse(query), True
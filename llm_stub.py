@@ -0,0 +1,226 @@
+import re
+import json
+import time
+import threading
+import types
+
+from utils import company_aliases
+
+# ✅ GPT 없이 동작하는 오프라인 파서 스텁
+# - rule_based_parse(query): 시스템 프롬프트 규칙을 정규식으로 옮긴 로컬 파서
+# - parse_compound(query): 복합 질문이면 {"intents": [...]}로 나눠 해석 (GPT 프롬프트 규칙과 같은 모양)
+# - OfflineChatClient: openai 클라이언트와 같은 모양(client.chat.completions.create)으로 응답
+#   → 프롬프트 회귀 테스트, 부하 테스트 등에서 실제 API 대신 사용
+
+BLOCKED_KEYWORDS = [
+    "전환사채", "CB", "BW", "신주인수권부사채", "ELB", "M&A", "VC", "벤처캐피탈",
+    "인수 순위", "인수 실적", "수수료", "자문 실적", "자문 순위", "부동산", "헤지펀드", "수익률",
+]
+BLOCKED_MESSAGE = "⚠️질문 주신 내용은 추후 업데이트 될 예정입니다."
+
+# 하위 상품 키워드를 먼저 검사 (예: "회사채"가 "일반회사채"보다 뒤에)
+PRODUCT_KEYWORDS = [
+    ("ABS", ["ABS", "자산유동화증권"]),
+    ("FB", ["FB", "여전채", "여신전문금융회사채권"]),
+    ("SB", ["SB", "일반회사채", "회사채"]),
+    ("IPO", ["IPO", "기업공개"]),
+    ("RO", ["유상증자", "유증", "RO", "Rights Offering"]),
+    ("ECM", ["ECM"]),
+    ("DCM", ["DCM", "국내채권"]),
+]
+
+COLUMN_KEYWORDS = ["금액", "건수", "점유율"]
+CHART_KEYWORDS = ["그래프", "추이", "변화"]
+COMPARE_KEYWORDS = ["비교", "올랐", "떨어졌", "오른", "내린", "상승", "하락"]
+COMBINE_KEYWORDS = ["합산", "합친", "합쳐"]
+ANALYSIS_KEYWORDS = [
+    ("concentration", ["집중도", "HHI", "허핀달", "점유율 합계", "점유율 합"]),
+    ("volatility", ["변동성", "순위 변동"]),
+    ("cagr", ["CAGR", "성장률", "빠르게 성장"]),
+    # 이정표는 연속 1위 / 처음·마지막 1위 표현만 ("언제", "가장 크게 오른" 등은 비교·일반 질문에도 흔함)
+    ("milestone", ["연속 1위", "연속으로 1위", "연속 3위", "마지막으로 1위", "마지막 1위", "처음으로 1위", "첫 1위", "최초로 1위"]),
+]
+
+_company_names = sorted(set(company_aliases) | set(company_aliases.values()), key=len, reverse=True)
+
+
+def _contains_keyword(query, keyword):
+    # 영문 약어(CB, RO 등)는 단어 경계로만 매칭
+    if keyword.isascii() and keyword.replace(" ", "").isalpha():
+        return re.search(rf"(?<![A-Za-z]){re.escape(keyword)}(?![A-Za-z])", query, re.IGNORECASE) is not None
+    return keyword in query
+
+
+def _extract_years(query):
+    span_match = re.search(r"(20\d{2})\s*년?\s*(?:[~\-]|부터)\s*(20\d{2})", query)
+    if span_match:
+        y1, y2 = int(span_match.group(1)), int(span_match.group(2))
+        return list(range(min(y1, y2), max(y1, y2) + 1))
+    return [int(y) for y in re.findall(r"(20\d{2})\s*년?", query)]
+
+
+def _extract_companies(query):
+    # (질문 내 위치, 회사명) 목록을 만들어 질문에 나온 순서대로 반환
+    found, text = [], query
+    for name in _company_names:
+        pos = text.find(name)
+        if pos >= 0:
+            found.append((pos, company_aliases.get(name, name)))
+            text = text.replace(name, " " * len(name))
+    # 사전에 없는 '○○증권' 형태도 회사명으로 인정 ('증권사'는 제외)
+    for m in re.finditer(r"[가-힣A-Za-z]+증권(?!사)", text):
+        found.append((m.start(), m.group()))
+
+    companies = []
+    for _, name in sorted(found):
+        if name not in companies:
+            companies.append(name)
+    return companies
+
+
+def rule_based_parse(query):
+    if any(_contains_keyword(query, k) for k in BLOCKED_KEYWORDS):
+        return {"message": BLOCKED_MESSAGE}
+
+    products, exclude = [], []
+    for product, keywords in PRODUCT_KEYWORDS:
+        if any(re.search(rf"{re.escape(k)}\s*(?:을|를|은|는)?\s*(?:제외|빼고)", query) for k in keywords):
+            exclude.append(product)
+        elif any(_contains_keyword(query, k) for k in keywords):
+            products.append(product)
+    # "회사채"는 "일반회사채"의 일부이므로 SB만 한 번 들어가도록 정리
+    products = list(dict.fromkeys(products))
+
+    parsed = {
+        "years": _extract_years(query),
+        "product": products,
+        "columns": [c for c in COLUMN_KEYWORDS if c in query],
+        "company": _extract_companies(query),
+        "is_chart": any(k in query for k in CHART_KEYWORDS),
+        "is_compare": any(k in query for k in COMPARE_KEYWORDS),
+    }
+
+    if exclude:
+        parsed["exclude"] = exclude
+    if any(k in query for k in COMBINE_KEYWORDS):
+        parsed["combine"] = True
+
+    analysis = next((name for name, keywords in ANALYSIS_KEYWORDS if any(_contains_keyword(query, k) for k in keywords)), None)
+    if analysis:
+        parsed["analysis"] = analysis
+
+    range_match = re.search(r"(\d+)\s*[~\-]\s*(\d+)\s*위", query)
+    top_match = re.search(r"상위\s*(\d+)", query)
+    single_match = re.search(r"(?<![\d~\-])(\d{1,2})\s*위", query)  # "1위" → [1, 1]
+    if range_match:
+        parsed["rank_range"] = [int(range_match.group(1)), int(range_match.group(2))]
+    elif top_match:
+        parsed["top_n"] = int(top_match.group(1))
+    elif single_match:
+        parsed["rank_range"] = [int(single_match.group(1))] * 2
+    return parsed
+
+
+# ✅ 복합 질문 분해: "2024년 ECM이랑 DCM 1위 각각, 그리고 KB증권 IPO 순위 추이" → 요청 2개
+# 그리고/또한/; 와 새 연도·증권사로 시작하는 쉼표에서만 나눈다 ("2024년 DCM, ECM 상위 3개"의 상품 목록 쉼표는 나누지 않음).
+# 나눈 조각 중 상품·분석 키워드가 없는 조각(예: "금액, 건수")은 옆 조각에 붙이고,
+# 연도와 공통 조건(상위 N/순위 범위, 비교, 항목)이 없는 요청은 앞(없으면 뒤) 요청의 값을 이어받는다.
+CLAUSE_SEPARATOR = re.compile(
+    r"\s*(?:,?\s*그리고|,?\s*또한|;|,(?=\s*(?:20\d{2}|" + "|".join(map(re.escape, _company_names)) + r")))\s*"
+)
+SHARED_MODIFIERS = [("years",), ("top_n", "rank_range"), ("is_compare",), ("columns",)]
+
+
+def _standalone(parsed):
+    return "message" in parsed or bool(parsed.get("product") or parsed.get("analysis"))
+
+
+def split_clauses(query):
+    groups = []
+    for fragment in (f for f in CLAUSE_SEPARATOR.split(query) if f.strip()):
+        groups.append([fragment, _standalone(rule_based_parse(fragment))])
+    if sum(standalone for _, standalone in groups) <= 1:
+        return [query]
+
+    # 독립 요청이 아닌 조각은 앞 요청(맨 앞 조각이면 뒤 요청)에 합침
+    merged, pending = [], ""
+    for fragment, standalone in groups:
+        if standalone:
+            merged.append(f"{pending} {fragment}".strip())
+            pending = ""
+        elif merged:
+            merged[-1] = f"{merged[-1]}, {fragment}"
+        else:
+            pending = f"{pending} {fragment}".strip()
+    return merged
+
+
+def parse_compound(query):
+    clauses = split_clauses(query)
+    if len(clauses) == 1:
+        return rule_based_parse(query)
+
+    intents = [rule_based_parse(clause) for clause in clauses]
+    requests = [p for p in intents if "message" not in p]
+    for keys in SHARED_MODIFIERS:
+        # 그래프·시장 구조 분석 요청에는 연도만 이어받음
+        targets = requests if keys == ("years",) else [p for p in requests if not (p.get("is_chart") or p.get("analysis"))]
+        stated = [p for p in targets if any(p.get(k) for k in keys)]
+        if not stated:
+            continue
+        last = stated[0]
+        for parsed in targets:
+            if any(parsed.get(k) for k in keys):
+                last = parsed
+            else:
+                parsed.update({k: last[k] for k in keys if last.get(k)})
+    return {"intents": intents}
+
+
+class OfflineChatClient:
+    """openai.OpenAI()와 같은 호출 모양을 가진 오프라인 클라이언트 (max_tokens 초과 시 응답을 잘라냄)"""
+
+    def __init__(self, parser=parse_compound, latency=0.0):
+        self.parser = parser
+        self.latency = latency  # 부하 테스트용 GPT 응답 지연(초) 흉내
+        self.calls = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+        self._closed = threading.Event()
+
+    # 실제 클라이언트처럼 close()하면 진행 중인 호출이 연결 오류로 끝남 (요청 취소 검증용)
+    def close(self):
+        self._closed.set()
+
+    def _create(self, model, messages, max_tokens=None, response_format=None, stream=False, timeout=None, **kwargs):
+        from prompts import count_tokens
+
+        self.calls.append({"model": model, "messages": messages, "max_tokens": max_tokens, "response_format": response_format, "timeout": timeout})
+        query = messages[-1]["content"]
+        if self.latency:
+            # timeout보다 오래 걸리면 실제 API처럼 시간 초과 오류
+            if self._closed.wait(self.latency if timeout is None else min(self.latency, timeout)):
+                raise ConnectionError("클라이언트 연결이 닫혔습니다.")
+            if timeout is not None and self.latency > timeout:
+                raise TimeoutError(f"GPT 응답이 {timeout:g}초 안에 오지 않았습니다.")
+        content = json.dumps(self.parser(query), ensure_ascii=False)
+
+        # 실제 API처럼 출력 토큰 한도를 넘으면 잘린 응답을 돌려줌 (출력 한도 회귀 검증용)
+        completion_tokens = count_tokens(content, model)
+        finish_reason = "stop"
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[: max(1, len(content) * max_tokens // completion_tokens)]
+            completion_tokens, finish_reason = max_tokens, "length"
+
+        prompt_tokens = sum(count_tokens(m["content"], model) for m in messages)
+        usage = types.SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=types.SimpleNamespace(cached_tokens=0),
+        )
+        message = types.SimpleNamespace(role="assistant", content=content)
+        return types.SimpleNamespace(
+            model=model,
+            choices=[types.SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+            usage=usage,
+        )
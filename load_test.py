@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+
+os.environ.setdefault("LEAGUE_QUERY_LOG", "0")  # 부하 테스트 질문은 질의 로그/캐시 워밍 대상에서 제외
+
+# ✅ Streamlit 앱 동시 세션 부하 테스트 (AppTest로 화면 없이 실행, GPT는 오프라인 스텁)
+# 실행: python load_test.py --concurrency 1,2,4,8 --questions 5 --llm-latency 0.3
+#   - 세션마다 AppTest 1개 = 브라우저 탭 1개 (첫 실행 후 질문 폼을 questions번 제출)
+#   - 단계(동시 세션 수)마다 처리량, 질문 지연 p50/p90/p99, 빈 rerun 비용, 최대 RSS를 출력
+#   - --json 경로 지정 시 단계별 결과를 JSON으로 저장
+# GPT 호출은 OfflineChatClient(응답 지연 흉내 가능)로 대체하고 llm_gate(동시성 제한/중복 합치기)는 그대로 통과한다.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rank_compare_chatbot.py")
+
+
+def install_stub_llm(latency):
+    import query_engine
+    from llm_stub import OfflineChatClient
+
+    stub = OfflineChatClient(latency=latency)
+    original = query_engine.parse_query
+    query_engine.parse_query = lambda query, client=None, template=None: original(query, client=stub, template=template)
+    return stub
+
+
+# 여러 세션이 동시에 스크립트를 컴파일하면 CPython 3.11의 ast.parse가 스레드 안전하지 않아
+# "AST constructor recursion depth mismatch" 오류가 나므로 컴파일 단계만 직렬화 (측정 대상은 실행 시간)
+def serialize_script_compile():
+    from streamlit.runtime.scriptrunner import magic
+
+    lock = threading.Lock()
+    original = magic.add_magic
+
+    def add_magic(code, script_path):
+        with lock:
+            return original(code, script_path)
+
+    magic.add_magic = add_magic
+
+
+def _rss_kb():
+    # 현재 RSS (리눅스 /proc 기준, 없으면 프로세스 최대 RSS로 대체)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = _rss_kb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_kb = max(self.peak_kb, _rss_kb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak_kb = max(self.peak_kb, _rss_kb())
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_session(session_id, questions, timeout, barrier, latencies, reruns, errors):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    barrier.wait()
+    try:
+        started = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - started)
+        if at.exception:
+            errors.append(f"[세션 {session_id}] 첫 실행: {at.exception[0].value}")
+        for question in questions:
+            at.text_input[0].input(question)
+            at.button[0].click()
+            started = time.perf_counter()
+            at.run()
+            latencies.append(time.perf_counter() - started)
+            if at.exception:
+                errors.append(f"[세션 {session_id}] {question}: {at.exception[0].value}")
+    except Exception as e:
+        errors.append(f"[세션 {session_id}] {type(e).__name__}: {e}")
+
+
+def run_level(concurrency, questions, timeout):
+    latencies, reruns, errors = [], [], []
+    barrier = threading.Barrier(concurrency + 1)
+    sessions = [
+        threading.Thread(target=run_session, args=(i, questions, timeout, barrier, latencies, reruns, errors))
+        for i in range(concurrency)
+    ]
+    for session in sessions:
+        session.start()
+
+    sampler = RssSampler()
+    sampler.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for session in sessions:
+        session.join()
+    wall = time.perf_counter() - started
+    sampler.stop()
+
+    return {
+        "concurrency": concurrency,
+        "questions": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_qps": round(len(latencies) / wall, 3) if wall else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p90_ms": _ms(percentile(latencies, 90)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "rerun_ms": _ms(percentile(reruns, 50)),
+        "peak_rss_mb": round(sampler.peak_kb / 1024, 1),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_report(rows):
+    header = f"{'동시 세션':>8}{'질문 수':>8}{'처리량(q/s)':>13}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'rerun(ms)':>11}{'RSS(MB)':>10}{'오류':>6}"
+    print(header)
+    for row in rows:
+        print(
+            f"{row['concurrency']:>8}{row['questions']:>8}{row['throughput_qps']:>13}{row['p50_ms']:>10}"
+            f"{row['p90_ms']:>10}{row['p99_ms']:>10}{row['rerun_ms']:>11}{row['peak_rss_mb']:>10}{len(row['errors']):>6}"
+        )
+    for row in rows:
+        for error in row["errors"][:5]:
+            print(f"❌ {error}")
+
+
+def main():
+    from prompt_compare import SAMPLE_QUESTIONS
+
+    arg_parser = argparse.ArgumentParser(description="Streamlit 앱 동시 세션 부하 테스트 (GPT 스텁 사용)")
+    arg_parser.add_argument("--concurrency", default="1,2,4,8", help="동시 세션 수 목록 (쉼표 구분)")
+    arg_parser.add_argument("--questions", type=int, default=5, help="세션당 질문 수")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.0, help="스텁 GPT 응답 지연(초)")
+    arg_parser.add_argument("--timeout", type=float, default=120, help="AppTest 실행 1회 제한 시간(초)")
+    arg_parser.add_argument("--json", help="단계별 결과를 저장할 JSON 경로")
+    args = arg_parser.parse_args()
+
+    client = install_stub_llm(args.llm_latency)
+    serialize_script_compile()
+    questions = [SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)] for i in range(args.questions)]
+
+    # 데이터 로딩(st.cache_resource)은 프로세스당 1회이므로 측정 전에 한 번 실행해 둠
+    run_level(1, [], args.timeout)
+
+    rows = []
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        rows.append(run_level(concurrency, questions, args.timeout))
+        print(f"… 동시 세션 {concurrency}개 완료 ({rows[-1]['wall_s']}s)", file=sys.stderr)
+
+    print_report(rows)
+    print(f"\n스텁 GPT 호출 수: {len(client.calls)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if any(row["errors"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ✅ 프로세스 내 메트릭 레지스트리 (counter / gauge / histogram) + Prometheus 텍스트 노출
+# 사용: LLM_LATENCY.observe(1.2, model="gpt-4") / QUERY_COUNT.inc(product="dcm")
+#   - api_server.py: GET /metrics
+#   - Streamlit 앱: METRICS_PORT=9108 지정 시 http://127.0.0.1:9108/metrics 로 노출
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: 라벨은 {self.labelnames} 이어야 합니다 (받은 값: {tuple(labels)})")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+    # 라벨 조합별 현재 값 사본 (요청 전후 차이 계산용)
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", bound)]), count))
+                out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", "+Inf")]), state["count"]))
+                out.append((f"{self.name}_sum", _format_labels(self.labelnames, key), round(state["sum"], 6)))
+                out.append((f"{self.name}_count", _format_labels(self.labelnames, key), state["count"]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    # 같은 이름으로 다시 등록하면 기존 메트릭을 반환 (Streamlit 재실행 대비)
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name}은 이미 {metric.kind}로 등록되어 있습니다.")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ✅ 공통 메트릭 정의
+LLM_LATENCY = REGISTRY.histogram("league_llm_request_seconds", "GPT 호출 소요 시간(초)", ["model", "purpose"])
+LLM_TOKENS = REGISTRY.counter("league_llm_tokens_total", "GPT 질문 해석 토큰 수 (kind=input/output/cached)", ["template", "kind"])
+LLM_FIRST_TOKEN = REGISTRY.histogram("league_llm_first_token_seconds", "GPT 스트리밍 첫 토큰까지 걸린 시간(초)", ["model", "purpose"])
+LLM_ADMISSION = REGISTRY.counter("league_llm_admission_total", "GPT 호출 게이트 결과 (admitted/coalesced/rejected/timeout)", ["outcome"])
+LLM_INFLIGHT = REGISTRY.gauge("league_llm_inflight", "진행 중인 GPT 호출 수")
+LLM_QUEUED = REGISTRY.gauge("league_llm_queued", "GPT 호출 대기열 길이")
+PARSE_RESULTS = REGISTRY.counter("league_query_parse_total", "GPT 질문 해석 결과 수", ["outcome"])
+QUERY_COUNT = REGISTRY.counter("league_queries_total", "상품별 질의 수", ["product"])
+LOAD_SECONDS = REGISTRY.gauge("league_load_seconds", "엑셀 로딩 소요 시간(초)", ["data_dir"])
+LOADED_TABLES = REGISTRY.gauge("league_loaded_tables", "로딩된 테이블 수", ["data_dir"])
+LOAD_FAILURES = REGISTRY.counter("league_load_failures_total", "엑셀 로딩 실패 수", ["data_dir"])
+CACHE_REQUESTS = REGISTRY.counter("league_cache_requests_total", "캐시 조회 수", ["cache", "result"])
+CACHE_EVICTIONS = REGISTRY.counter("league_cache_evictions_total", "캐시 항목 제거 수 (reason=budget/stale/oversize/replaced)", ["cache", "reason"])
+CACHE_BYTES = REGISTRY.gauge("league_cache_bytes", "캐시 영역별 추정 메모리(바이트)", ["cache"])
+CACHE_ENTRIES = REGISTRY.gauge("league_cache_entries", "캐시 영역별 항목 수", ["cache"])
+REQUEST_CANCELLATIONS = REGISTRY.counter("league_request_cancellations_total", "중단된 요청 수 (reason=deadline/abandoned)", ["stage", "reason"])
+INGESTED_PERIODS = REGISTRY.counter("league_ingested_periods_total", "증분 반영된 기간 수 (kind=new/changed)", ["table", "kind"])
+
+
+# ✅ /metrics 노출용 HTTP 서버 (프로세스당 1회만 기동)
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from query_engine import resolve_annual_table
+from company_profiles import company_key
+from cache_manager import cache_region
+
+# ✅ 회사별 순위 이정표(milestone) 색인 (로딩 시 (상품, 역할, 조건) 테이블마다 1회 생성)
+# 연간(연도 합산 테이블)과 분기(원본 테이블) 기준으로 회사마다
+#   - 처음/마지막 1위·3위 이내 기간과 횟수
+#   - 최장 연속 1위·3위 이내 (기간 수, 시작~끝)와 최근 기간까지 이어지는 현재 연속 기록
+#   - 직전 기간 대비 가장 크게 오른/떨어진 순위 (순위권 밖으로 빠진 기간은 연속·변동 계산에서 끊김)
+# 을 미리 계산해 두고, "마지막으로 1위 한 게 언제?", "몇 분기 연속 1위?" 같은 질문은 표를 훑지 않고 색인 조회로 답한다.
+# intent의 "analysis" 값 "milestone"으로 조회 (query_engine.milestone_results)
+
+GRANULARITIES = ("연간", "분기")
+THRESHOLDS = [(1, "1위"), (3, "3위 이내")]
+TOP_N = 10  # 회사를 지정하지 않은 질문: 최장 연속 1위 상위 회사 수
+
+MILESTONE_COLUMNS = [
+    "주관사", "상품", "기준",
+    "1위 횟수", "첫 1위", "마지막 1위", "최장 연속 1위", "최장 연속 1위 기간", "현재 연속 1위",
+    "3위 이내 횟수", "첫 3위 이내", "마지막 3위 이내", "최장 연속 3위 이내", "최장 연속 3위 이내 기간", "현재 연속 3위 이내",
+    "최대 상승", "최대 상승 기간", "최대 하락", "최대 하락 기간",
+]
+
+
+def _period_labels(periods, quarterly):
+    if quarterly:
+        return [f"{p // 10}년 {p % 10}분기" for p in periods]
+    return [f"{p // 10}년" for p in periods]
+
+
+# 회사 코드별로 정렬 키가 가장 큰 원소의 위치 (codes 순서대로 반환, 키는 뒤에 줄수록 우선)
+def _best_per_code(codes, *keys):
+    order = np.lexsort((*keys, codes))
+    last = np.r_[codes[order][1:] != codes[order][:-1], True]
+    return order[last]
+
+
+# ✅ 기간별 순위 행(연도[, 분기], 주관사, 순위) → 회사키별 이정표 한 행
+# 표 1개당 수 ms가 되도록 회사 코드 × 기간 순번 정수 배열로 계산하고, 기간 문자열은 마지막에 붙임
+def build_milestones(rows, quarterly=False):
+    period_cols = ["연도", "분기"] if quarterly else ["연도"]
+    rows = rows.dropna(subset=period_cols + ["순위", "주관사"])
+    if rows.empty:
+        return None
+    # 기간 순번: 표 전체의 기간 목록에서의 위치 (회사가 빠진 기간이 있으면 순번이 건너뛰어 연속이 끊김)
+    period = rows["연도"].to_numpy(dtype=np.int64) * 10 + (rows["분기"].to_numpy(dtype=np.int64) if quarterly else 0)
+    periods = np.unique(period)
+    labels = np.array(_period_labels(periods.tolist(), quarterly), dtype=object)
+    codes, keys = pd.factorize(rows["주관사"].map(company_key), sort=True)
+    position = np.searchsorted(periods, period)
+    rank = rows["순위"].to_numpy(dtype=np.int64)
+    names = rows["주관사"].to_numpy(dtype=object)
+
+    # 회사 → 기간 순 정렬, 같은 기간에 같은 회사가 두 번 나오면 높은 순위만
+    order = np.lexsort((rank, position, codes))
+    codes, position, rank, names = codes[order], position[order], rank[order], names[order]
+    keep = np.r_[True, (codes[1:] != codes[:-1]) | (position[1:] != position[:-1])]
+    codes, position, rank, names = codes[keep], position[keep], rank[keep], names[keep]
+    n, last_position = len(keys), len(periods) - 1
+
+    company_end = np.r_[codes[1:] != codes[:-1], True]
+    columns = {"주관사": names[company_end]}
+    for limit, label in THRESHOLDS:
+        hit = rank <= limit
+        hit_codes, hit_position = codes[hit], position[hit]
+        first, last = np.full(n, None, dtype=object), np.full(n, None, dtype=object)
+        if hit.any():
+            starts = np.r_[True, hit_codes[1:] != hit_codes[:-1]]
+            ends = np.r_[hit_codes[1:] != hit_codes[:-1], True]
+            first[hit_codes[starts]] = labels[hit_position[starts]]
+            last[hit_codes[ends]] = labels[hit_position[ends]]
+
+        # 연속 구간: 회사가 바뀌거나 기간 순번이 1 넘게 건너뛰면 새 구간
+        breaks = (hit_codes[1:] != hit_codes[:-1]) | (hit_position[1:] != hit_position[:-1] + 1)
+        run_start = np.flatnonzero(np.r_[True, breaks])[:len(hit_codes)]
+        run_length = np.diff(np.r_[run_start, len(hit_codes)])
+        run_code, run_first = hit_codes[run_start], hit_position[run_start]
+        run_last = run_first + run_length - 1
+        longest_length, longest_span, current = np.zeros(n, dtype=np.int64), np.full(n, None, dtype=object), np.zeros(n, dtype=np.int64)
+        if len(run_start):
+            # 같은 길이면 최근 구간
+            best = _best_per_code(run_code, run_last, run_length)
+            longest_length[run_code[best]] = run_length[best]
+            longest_span[run_code[best]] = [
+                labels[a] if a == b else f"{labels[a]}~{labels[b]}" for a, b in zip(run_first[best], run_last[best])
+            ]
+            ongoing = run_last == last_position
+            current[run_code[ongoing]] = run_length[ongoing]
+        columns.update({
+            f"{label} 횟수": np.bincount(hit_codes, minlength=n),
+            f"첫 {label}": first,
+            f"마지막 {label}": last,
+            f"최장 연속 {label}": longest_length,
+            f"최장 연속 {label} 기간": longest_span,
+            f"현재 연속 {label}": current,
+        })
+
+    # 직전 기간 대비 순위 변화 (양수 = 상승), 바로 앞 기간에 순위가 있었던 경우만
+    adjacent = np.flatnonzero((codes[1:] == codes[:-1]) & (position[1:] == position[:-1] + 1)) + 1
+    change = rank[adjacent - 1] - rank[adjacent]
+    for column, sign in [("최대 상승", 1), ("최대 하락", -1)]:
+        moved = adjacent[change * sign > 0]
+        size, description = pd.array([pd.NA] * n, dtype="Int64"), np.full(n, None, dtype=object)
+        if len(moved):
+            # 같은 폭이면 최근 기간
+            best = moved[_best_per_code(codes[moved], position[moved], (rank[moved - 1] - rank[moved]) * sign)]
+            size[codes[best]] = np.abs(rank[best - 1] - rank[best])
+            description[codes[best]] = [
+                f"{labels[position[i] - 1]} {rank[i - 1]}위 → {labels[position[i]]} {rank[i]}위" for i in best
+            ]
+        columns.update({column: size, f"{column} 기간": description})
+    return pd.DataFrame(columns, index=pd.Index(keys, name="회사키"))
+
+
+_milestone_cache = cache_region("milestones")
+
+
+# ✅ {"연간": 색인, "분기": 색인 또는 None} (연간 테이블이 없으면 None)
+# 상품 조합(sb 등)처럼 원본 분기 테이블이 없는 상품은 연간 색인만
+def get_milestones(dfs, product, role="lead", filter_cond=None):
+    annual = resolve_annual_table(dfs, product, role, filter_cond)
+    if annual is None or annual.empty:
+        return None
+    df = dfs.get((product, role, filter_cond))
+    if df is not None and ("분기" not in df.columns or df.empty):
+        df = None
+
+    def build():
+        quarterly = build_milestones(df[df["분기"].notna()], quarterly=True) if df is not None else None
+        return {"연간": build_milestones(annual), "분기": quarterly}
+    # 빈 테이블은 다른 테이블의 연간 합산으로 대체되므로 (연간, 분기) 두 테이블로 구분
+    return _milestone_cache.get_or_build((id(annual), id(df)), build, anchor=(annual, df))
+
+
+# ✅ 회사(회사키 목록, 비우면 최장 연속 1위 상위 top_n)의 이정표 표
+def milestone_table(milestones, label, companies=None, top_n=None):
+    frames = []
+    for granularity in GRANULARITIES:
+        index = milestones.get(granularity)
+        if index is None:
+            continue
+        if companies:
+            picked = index.reindex([c for c in companies if c in index.index])
+        else:
+            picked = index.sort_values(["최장 연속 1위", "1위 횟수", "3위 이내 횟수"], ascending=False, kind="stable").head(int(top_n or TOP_N))
+        frames.append(picked.assign(상품=label, 기준=granularity))
+    if not frames:
+        return pd.DataFrame(columns=MILESTONE_COLUMNS)
+    table = pd.concat(frames).reset_index(drop=True)[MILESTONE_COLUMNS]
+    if companies:
+        # 질문에 나온 회사 순서 → 연간/분기 순
+        order = {c: i for i, c in enumerate(companies)}
+        table = table.sort_values("주관사", key=lambda s: s.map(company_key).map(order), kind="stable").reset_index(drop=True)
+    return table
+
+
+# ✅ 증분 반영: 이전 원본/연도 합산 테이블 기준 색인을 버리고, 반영한 원본 테이블 색인은 바로 다시 생성
+# (연속 기록은 마지막 기간에 따라 바뀌므로 바뀐 연도만 고치지 않고 테이블 단위로 다시 계산, 테이블 1개는 수 ms)
+def update_milestones(dfs, key, old_df, replaced):
+    stale = {id(old_df)} | {id(old_annual) for old_annual, _ in replaced}
+    for cache_key, anchor, _ in _milestone_cache.items():
+        if any(id(table) in stale for table in anchor if table is not None):
+            _milestone_cache.pop(cache_key)
+    get_milestones(dfs, *key)
+
+
+def warm_milestones(dfs):
+    for product, role, filter_cond in (k for k in dfs if isinstance(k, tuple) and len(k) == 3):
+        get_milestones(dfs, product, role, filter_cond)
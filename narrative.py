@@ -0,0 +1,227 @@
+import pandas as pd
+
+from cache_manager import cache_region
+
+# ✅ 결과 표로 만드는 한국어 요약 (GPT 호출 없이 즉시 생성, 같은 표면 항상 같은 문장)
+# - 순위표: 1위와 2위 점유율 격차, 1위의 전년 대비 순위, 순위가 크게 오르내린 곳, 점유율 변화가 큰 곳
+# - 회사 지정: 회사별 최근 연도 순위와 전년 대비 변화
+# - 비교표(상승/하락): 변화 폭 상위 회사
+# - 순위 기록(이정표): 회사별 마지막 1위, 최장/현재 연속 1위, 최대 상승·하락 (milestones.py 색인 조회 결과)
+# GPT 분석은 이 요약과 표를 근거로 덧붙이는 선택 기능(opt-in)으로만 사용한다.
+
+MOVER_COUNT = 3
+
+
+def format_amount(value):
+    if value is None or pd.isna(value):
+        return "-"
+    value = float(value)
+    if abs(value) >= 1e12:
+        return f"{value / 1e12:,.1f}조원"
+    if abs(value) >= 1e8:
+        return f"{value / 1e8:,.0f}억원"
+    return f"{value:,.0f}원"
+
+
+def _josa(word, with_batchim, without_batchim):
+    # 마지막 글자 받침 유무로 조사 선택 (한글이 아니면 받침 없는 쪽)
+    last = str(word)[-1:]
+    if "가" <= last <= "힣":
+        return with_batchim if (ord(last) - ord("가")) % 28 else without_batchim
+    return without_batchim
+
+
+def _share(row):
+    value = row.get("점유율(%)")
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def _describe(row):
+    parts = []
+    if _share(row) is not None:
+        parts.append(f"점유율 {_share(row):.2f}%")
+    if row.get("금액(원)") is not None and not pd.isna(row["금액(원)"]):
+        parts.append(format_amount(row["금액(원)"]))
+    if row.get("건수") is not None and not pd.isna(row["건수"]):
+        parts.append(f"{int(row['건수'])}건")
+    return f"({', '.join(parts)})" if parts else ""
+
+
+# 연도별 행(dict, 순위순)은 연도 합산 테이블당 1회만 만들어 두고 재사용 → 요약은 순수 파이썬 연산만
+_year_cache = cache_region("year_records")
+
+def _build_year_records(annual):
+    by_year = {}
+    for row in annual.sort_values(["연도", "순위"]).to_dict("records"):
+        by_year.setdefault(int(row["연도"]), []).append(row)
+    return by_year
+
+
+def _year_records(annual):
+    return _year_cache.get_or_build(id(annual), lambda: _build_year_records(annual), anchor=annual)
+
+
+# 증분 반영: 바뀐 연도의 행만 새로 만들고 나머지 연도 목록은 그대로 공유
+def update_year_records(old_annual, new_annual, years):
+    cached = _year_cache.pop(id(old_annual), anchor=old_annual)
+    if cached is None:
+        return
+    previous, cost = cached
+    by_year = {year: rows for year, rows in previous.items() if year not in years}
+    by_year.update(_build_year_records(new_annual[new_annual["연도"].isin(years)]))
+    _year_cache.put(id(new_annual), dict(sorted(by_year.items())), anchor=new_annual, cost=cost)
+
+
+def _prior_year(by_year, year):
+    earlier = [y for y in by_year if y < year]
+    return max(earlier) if earlier else None
+
+
+def _rank_movement(name, prev_rank, rank):
+    if prev_rank is None:
+        return f"{name}{_josa(name, '은', '는')} 새로 순위권에 들었습니다."
+    if prev_rank == rank:
+        return f"{name}{_josa(name, '은', '는')} 전년과 같은 {rank}위를 유지했습니다."
+    direction = "올라섰습니다" if prev_rank > rank else "내려앉았습니다"
+    return f"{name}{_josa(name, '은', '는')} 전년 {prev_rank}위에서 {rank}위로 {direction}."
+
+
+def _movers(rows):
+    return ", ".join(f"{r['주관사']}({r['전년 순위']}위→{int(r['순위'])}위)" for r in rows)
+
+
+# ✅ 순위표 요약 (table: 화면에 보인 행, annual: 전년 비교용 전체 연도 합산 테이블)
+def narrate_ranking(table, annual=None, label=""):
+    by_year = _year_records(table if annual is None else annual)
+    year = int(table["연도"].max())
+    current = by_year.get(year)
+    if not current:
+        return ""
+
+    leader = current[0]
+    sentences = [f"{year}년 {label} 1위는 {leader['주관사']}{_describe(leader)}입니다."]
+    if len(current) > 1 and _share(leader) is not None and _share(current[1]) is not None:
+        second = current[1]
+        sentences.append(
+            f"2위 {second['주관사']}({_share(second):.2f}%){_josa(second['주관사'], '과', '와')}의 "
+            f"점유율 격차는 {_share(leader) - _share(second):.2f}%p입니다."
+        )
+
+    prior = _prior_year(by_year, year)
+    if prior is None:
+        return " ".join(sentences)
+    previous = {r["주관사"]: r for r in by_year[prior]}
+    leader_prev = previous.get(leader["주관사"])
+    sentences.append(_rank_movement(leader["주관사"], None if leader_prev is None else int(leader_prev["순위"]), int(leader["순위"])))
+
+    # 화면에 보인 회사 기준으로 전년 대비 순위/점유율 변화가 큰 곳
+    shown = set(table.loc[table["연도"] == year, "주관사"])
+    moves, entrants, share_moves = [], [], []
+    for row in current:
+        if row["주관사"] not in shown:
+            continue
+        prev = previous.get(row["주관사"])
+        if prev is None:
+            entrants.append(row["주관사"])
+            continue
+        moves.append({**row, "전년 순위": int(prev["순위"]), "순위 변화": int(prev["순위"]) - int(row["순위"])})
+        if _share(row) is not None and _share(prev) is not None:
+            share_moves.append((_share(row) - _share(prev), row["주관사"]))
+
+    climbers = sorted((m for m in moves if m["순위 변화"] > 0), key=lambda m: -m["순위 변화"])[:MOVER_COUNT]
+    fallers = sorted((m for m in moves if m["순위 변화"] < 0), key=lambda m: m["순위 변화"])[:MOVER_COUNT]
+    if climbers:
+        sentences.append(f"전년({prior}년) 대비 순위가 크게 오른 곳은 {_movers(climbers)}입니다.")
+    if fallers:
+        sentences.append(f"순위가 내린 곳은 {_movers(fallers)}입니다.")
+    if entrants:
+        names = entrants[:MOVER_COUNT]
+        sentences.append(f"{', '.join(names)}{_josa(names[-1], '은', '는')} 새로 순위권에 들었습니다.")
+    if share_moves:
+        change, name = max(share_moves, key=lambda m: abs(m[0]))
+        if abs(change) >= 0.01:
+            sentences.append(f"점유율 변화가 가장 큰 곳은 {name}({change:+.2f}%p)입니다.")
+    return " ".join(sentences)
+
+
+# ✅ 회사 지정 실적 요약 (회사별 최근 연도 순위 + 전년 대비)
+def narrate_companies(table, annual=None, label=""):
+    by_year = _year_records(table if annual is None else annual)
+    sentences = []
+    for company, years in table.groupby("주관사", sort=False)["연도"]:
+        year = int(years.max())
+        latest = next((r for r in by_year.get(year, []) if r["주관사"] == company), None)
+        if latest is None:
+            continue
+        sentence = f"{company}의 {year}년 {label} 순위는 {int(latest['순위'])}위{_describe(latest)}입니다."
+        prior = _prior_year(by_year, year)
+        prev = next((r for r in by_year.get(prior, []) if r["주관사"] == company), None)
+        if prev is not None:
+            diff = int(prev["순위"]) - int(latest["순위"])
+            change = "변동 없음" if diff == 0 else f"{abs(diff)}계단 {'상승' if diff > 0 else '하락'}"
+            sentence += f" {prior}년 {int(prev['순위'])}위 대비 {change}."
+        sentences.append(sentence)
+    return " ".join(sentences)
+
+
+# ✅ 비교표(상승/하락) 요약: 이미 변화 폭 순으로 정렬돼 있으므로 앞에서부터
+def narrate_compare(table, title):
+    if table.empty or "변화" not in table.columns:
+        return ""
+    before, after = [c for c in table.columns if c not in ("주관사", "변화")][:2]
+    items = []
+    for _, row in table.head(MOVER_COUNT).iterrows():
+        items.append(f"{row['주관사']}({_fmt(row[before])}→{_fmt(row[after])})")
+    return f"{title}: {', '.join(items)}."
+
+
+# ✅ 순위 기록 요약: 회사별로 연간/분기 기준 1위 기록 (1위가 없으면 3위 이내 기록), 가장 큰 순위 상승·하락
+def narrate_milestones(table, label):
+    sentences = []
+    for company, rows in list(table.groupby("주관사", sort=False))[:MOVER_COUNT]:
+        parts, moves = [], []
+        for _, row in rows.iterrows():
+            unit = "년" if row["기준"] == "연간" else "분기"
+            level = "1위" if row["1위 횟수"] else "3위 이내"
+            if not row[f"{level} 횟수"]:
+                parts.append(f"{row['기준']} 기준 3위 이내 기록 없음")
+                continue
+            text = f"{row['기준']} 기준 {level} {int(row[f'{level} 횟수'])}회(마지막 {row[f'마지막 {level}']}, 최장 {int(row[f'최장 연속 {level}'])}{unit} 연속"
+            if row[f"현재 연속 {level}"]:
+                text += f", 현재 {int(row[f'현재 연속 {level}'])}{unit}째"
+            parts.append(text + ")")
+            if not pd.isna(row["최대 상승"]):
+                moves.append(f"{row['기준']} 최대 상승 {int(row['최대 상승'])}계단({row['최대 상승 기간']})")
+            if not pd.isna(row["최대 하락"]):
+                moves.append(f"{row['기준']} 최대 하락 {int(row['최대 하락'])}계단({row['최대 하락 기간']})")
+        sentence = f"{company}의 {label} 순위 기록: {', '.join(parts)}."
+        if moves:
+            sentence += f" {', '.join(moves)}."
+        sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def _fmt(value):
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.2f}"
+    return f"{int(value):,}" if not pd.isna(value) else "-"
+
+
+def narrate_item(item):
+    table, kind = item["table"], item.get("kind")
+    if table is None or table.empty:
+        return ""
+    if kind == "ranking" and {"연도", "순위", "주관사"} <= set(table.columns):
+        return narrate_ranking(table, item.get("annual"), item.get("label", ""))
+    if kind == "company" and {"연도", "순위", "주관사"} <= set(table.columns):
+        return narrate_companies(table, item.get("annual"), item.get("label", ""))
+    if kind == "compare":
+        return narrate_compare(table, item["title"])
+    if kind == "milestone":
+        return narrate_milestones(table, item.get("label", ""))
+    return ""
+
+
+# ✅ run_query 결과 전체 요약 (문단 목록, 요약할 수 없는 표는 건너뜀)
+def narrate_result(result):
+    return [text for text in (narrate_item(item) for item in result.get("results", [])) if text]
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from utils import company_aliases
+from query_engine import resolve_annual_table
+from cache_manager import cache_region
+
+# ✅ 회사 × 연도 행렬 (연도 합산 테이블 기준, 로딩 시 테이블별 1회 생성)
+# values["순위"][i, j] = companies[i]의 periods[j]년 순위 (실적 없으면 NaN)
+# 회사/연도는 정수 코드로 바꿔 두므로 N개 회사 × M개 연도 조회는 np.ix_ 슬라이스 한 번으로 끝난다.
+
+METRICS = ["순위", "금액(원)", "건수", "점유율(%)"]
+
+
+def company_code_key(name):
+    name = company_aliases.get(name, name)
+    return str(name).lower().replace(" ", "")
+
+
+class PivotMatrix:
+    def __init__(self, annual):
+        names = annual["주관사"].astype(str).to_numpy()
+        years = annual["연도"].astype(int).to_numpy()
+
+        self.companies = np.unique(names)
+        self.periods = np.unique(years)
+        self._build_codes()
+
+        rows = np.searchsorted(self.companies, names)
+        cols = np.searchsorted(self.periods, years)
+        self.values = {}
+        for metric in METRICS:
+            matrix = np.full((len(self.companies), len(self.periods)), np.nan)
+            if metric in annual.columns:
+                matrix[rows, cols] = pd.to_numeric(annual[metric], errors="coerce").to_numpy(dtype=float)
+            self.values[metric] = matrix
+
+    def _build_codes(self):
+        self.company_codes = {company_code_key(c): i for i, c in enumerate(self.companies)}
+        self.period_codes = {int(p): j for j, p in enumerate(self.periods)}
+
+    # ✅ 증분 반영: periods 연도 열만 annual_rows(그 연도들의 연도 합산 행)로 바꾼 새 행렬 (기존 행렬은 조회 중일 수 있어 그대로 둠)
+    # 나머지 연도 값은 그대로 복사하므로 전체 테이블을 다시 읽지 않는다.
+    def replace_periods(self, annual_rows, periods):
+        names = annual_rows["주관사"].astype(str).to_numpy()
+        years = annual_rows["연도"].astype(int).to_numpy()
+        companies = np.union1d(self.companies, names)
+        all_periods = np.union1d(self.periods, years)
+
+        old_grid = np.ix_(np.searchsorted(companies, self.companies), np.searchsorted(all_periods, self.periods))
+        cleared = np.isin(all_periods, [int(p) for p in periods])
+        rows = np.searchsorted(companies, names)
+        cols = np.searchsorted(all_periods, years)
+        values = {}
+        for metric, previous in self.values.items():
+            matrix = np.full((len(companies), len(all_periods)), np.nan)
+            matrix[old_grid] = previous
+            matrix[:, cleared] = np.nan
+            if metric in annual_rows.columns:
+                matrix[rows, cols] = pd.to_numeric(annual_rows[metric], errors="coerce").to_numpy(dtype=float)
+            values[metric] = matrix
+
+        # 바뀐 연도에서 빠져 더 이상 실적이 없는 회사/연도는 제거 (전체 재생성 결과와 같게, 순위는 실적 행마다 있음)
+        filled = ~np.isnan(values["순위"])
+        keep_rows, keep_cols = filled.any(axis=1), filled.any(axis=0)
+        if "순위" not in annual_rows.columns:
+            keep_rows, keep_cols = np.ones(len(companies), bool), np.ones(len(all_periods), bool)
+
+        updated = PivotMatrix.__new__(PivotMatrix)
+        updated.companies = companies[keep_rows]
+        updated.periods = all_periods[keep_cols]
+        updated.values = {m: v[np.ix_(keep_rows, keep_cols)] for m, v in values.items()}
+        updated._build_codes()
+        return updated
+
+    def company_index(self, companies):
+        index, missing = [], []
+        for company in companies:
+            code = self.company_codes.get(company_code_key(company))
+            if code is None:
+                missing.append(company)
+            elif code not in index:
+                index.append(code)
+        return index, missing
+
+    def period_index(self, periods=None):
+        if not periods:
+            return list(range(len(self.periods)))
+        return [self.period_codes[int(p)] for p in sorted(set(periods)) if int(p) in self.period_codes]
+
+    # N개 회사 × M개 연도 슬라이스 (요청 순서 유지, 없는 회사는 missing으로 반환)
+    def take(self, companies, periods=None, metrics=METRICS):
+        rows, missing = self.company_index(companies)
+        cols = self.period_index(periods)
+        grid = np.ix_(rows, cols)
+        return {
+            "companies": self.companies[rows].tolist(),
+            "periods": self.periods[cols].tolist(),
+            "values": {m: self.values[m][grid] for m in metrics if m in self.values},
+            "missing": missing,
+        }
+
+    def cell(self, company, period, metric="순위"):
+        i = self.company_codes.get(company_code_key(company))
+        j = self.period_codes.get(int(period))
+        if i is None or j is None:
+            return None
+        value = self.values[metric][i, j]
+        return None if np.isnan(value) else value
+
+    # 분석용 DataFrame 뷰 (행: 주관사, 열: 연도)
+    def frame(self, metric):
+        return pd.DataFrame(self.values[metric], index=pd.Index(self.companies, name="주관사"), columns=pd.Index(self.periods, name="연도"))
+
+
+_pivot_cache = cache_region("pivot")
+
+def get_pivot(dfs, product, role="lead", filter_cond=None):
+    annual = resolve_annual_table(dfs, product, role, filter_cond)
+    if annual is None or annual.empty:
+        return None
+    return _pivot_cache.get_or_build(id(annual), lambda: PivotMatrix(annual), anchor=annual)
+
+
+# ✅ 증분 반영: 연도 합산 테이블이 old → new로 바뀌면 바뀐 연도 열만 교체한 행렬을 new 기준으로 등록
+def update_pivot(old_annual, new_annual, years):
+    cached = _pivot_cache.pop(id(old_annual), anchor=old_annual)
+    if cached is None:
+        return None
+    matrix, cost = cached
+    matrix = matrix.replace_periods(new_annual[new_annual["연도"].isin(years)], years)
+    return _pivot_cache.put(id(new_annual), matrix, anchor=new_annual, cost=cost)
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import time
+import zlib
+import logging
+import cProfile
+import threading
+from collections import Counter
+from html import escape
+
+# ✅ 요청 단위 프로파일러 (opt-in)
+# 느린 질문 하나가 엑셀 로딩 / pandas 필터링 / plotly 차트 / GPT 중 어디서 시간을 쓰는지 확인용
+# 켜는 방법: LEAGUE_PROFILE=1 (모든 요청) 또는 앱 URL에 ?profile=1 (그 세션의 요청만)
+#   URL 스위치는 방문자 누구나 쓸 수 있으므로 LEAGUE_PROFILE_URL=1 로 허용한 배포에서만 동작
+# 요청마다 LEAGUE_PROFILE_DIR(기본 profiles/)에 아래 파일을 남긴다.
+#   - <이름>.prof   : cProfile 결과 (python -m pstats 또는 snakeviz로 열기)
+#   - <이름>.folded : 샘플링 스택 (flamegraph.pl / speedscope 입력 형식)
+#   - <이름>.svg    : 샘플링 스택으로 그린 flamegraph (브라우저로 열기, 마우스를 올리면 상세)
+#   디렉터리에는 최근 요청 LEAGUE_PROFILE_KEEP개(기본 20) 분량만 남기고 오래된 것부터 삭제
+# LEAGUE_PROFILE_MODE=sample 이면 cProfile 없이 샘플링만 (측정 오버헤드 최소), cprofile 이면 cProfile만
+#   - cProfile은 프로파일을 켠 스레드만 측정 (run_compound 작업 스레드 등은 .prof에 없음, 샘플링도 요청 스레드만)
+#   - cProfile은 프로세스에 하나만 켤 수 있으므로 (3.12+는 ValueError) 다른 세션이 쓰는 중이면 샘플링만으로 대체
+# 꺼져 있으면 profile_request()는 공유 no-op 객체만 반환하므로 오버헤드가 없음
+
+logger = logging.getLogger("league.profiler")
+
+PROFILE_ENABLED = os.getenv("LEAGUE_PROFILE", "0") == "1"
+PROFILE_URL_ENABLED = os.getenv("LEAGUE_PROFILE_URL", "0") == "1"
+PROFILE_KEEP = int(os.getenv("LEAGUE_PROFILE_KEEP", "20"))
+PROFILE_DIR = os.getenv("LEAGUE_PROFILE_DIR", "profiles")
+PROFILE_MODE = os.getenv("LEAGUE_PROFILE_MODE", "both")
+SAMPLE_INTERVAL = float(os.getenv("LEAGUE_PROFILE_INTERVAL_MS", "5")) / 1000
+
+SVG_WIDTH = 1200
+SVG_ROW_HEIGHT = 16
+SVG_MIN_WIDTH = 0.3  # 이보다 좁은 칸(px)은 그리지 않음
+
+
+class _NullProfile:
+    artifacts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_PROFILE = _NullProfile()
+_cprofile_lock = threading.Lock()  # 동시에 프로파일되는 요청 중 하나만 cProfile 사용
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+
+class StackSampler(threading.Thread):
+    # 대상 스레드의 호출 스택을 interval마다 읽어 (접힌 스택 문자열 → 횟수)로 집계
+    def __init__(self, thread_id, root_depth, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True, name="league-profile-sampler")
+        self.thread_id = thread_id
+        self.root_depth = root_depth  # 프로파일 시작 지점 위쪽(Streamlit 내부 등) 프레임은 잘라냄
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            if len(stack) > self.root_depth:
+                self.counts[";".join(stack[self.root_depth:])] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _stack_depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _artifact_name(label):
+    slug = re.sub(r"[^0-9A-Za-z가-힣]+", "_", label or "request").strip("_")[:40] or "request"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}"
+
+
+# ✅ 요청 1건의 파일(.prof/.folded/.svg)을 묶어 최근 keep건만 남김 (이름이 시각으로 시작하므로 이름순 = 시간순)
+def prune_artifacts(directory, keep=PROFILE_KEEP):
+    groups = {}
+    for name in os.listdir(directory):
+        base, ext = os.path.splitext(name)
+        if ext in (".prof", ".folded", ".svg"):
+            groups.setdefault(base, []).append(name)
+    for base in sorted(groups)[:max(len(groups) - keep, 0)]:
+        for name in groups[base]:
+            os.remove(os.path.join(directory, name))
+
+
+class RequestProfiler:
+    def __init__(self, label, directory=PROFILE_DIR, mode=PROFILE_MODE, keep=PROFILE_KEEP):
+        self.label = label
+        self.directory = directory
+        self.mode = mode
+        self.keep = keep
+        self.artifacts = {}  # 종류 → 저장 경로 (종료 후 채워짐)
+        self._profile = None
+        self._sampler = None
+
+    def __enter__(self):
+        if self.mode in ("cprofile", "both") and _cprofile_lock.acquire(blocking=False):
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError as e:  # 디버거 등 다른 프로파일링 도구가 이미 켜져 있음
+                logger.warning("cProfile을 켤 수 없어 샘플링만 사용: %s", e)
+                self._profile = None
+                _cprofile_lock.release()
+        if self.mode in ("sample", "both") or self._profile is None:
+            # 호출한 쪽 프레임을 flamegraph의 루트로 사용
+            self._sampler = StackSampler(threading.get_ident(), _stack_depth(sys._getframe(1)) - 1)
+            self._sampler.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        if self._profile is not None:
+            self._profile.disable()
+            _cprofile_lock.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+        try:
+            self.save()
+            prune_artifacts(self.directory, self.keep)
+        except OSError as e:
+            logger.warning("프로파일 저장 실패: %s", e)
+        return False
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, _artifact_name(self.label))
+        if self._profile is not None:
+            self._profile.dump_stats(base + ".prof")
+            self.artifacts["pstats"] = base + ".prof"
+        if self._sampler is not None and self._sampler.counts:
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._sampler.counts.items()):
+                    f.write(f"{stack} {count}\n")
+            with open(base + ".svg", "w", encoding="utf-8") as f:
+                f.write(flamegraph_svg(self._sampler.counts, f"{self.label} ({self.duration_ms:,.0f}ms)"))
+            self.artifacts["folded"] = base + ".folded"
+            self.artifacts["flamegraph"] = base + ".svg"
+
+
+# url_requested: 앱 URL ?profile=1 여부 (LEAGUE_PROFILE_URL=1 일 때만 반영)
+def profile_request(label, enabled=None, url_requested=False):
+    if enabled is None:
+        enabled = PROFILE_ENABLED
+    if not (enabled or (PROFILE_URL_ENABLED and url_requested)):
+        return _NULL_PROFILE
+    return RequestProfiler(label)
+
+
+# ✅ 접힌 스택 → flamegraph SVG (외부 도구 없이 생성, 아래에서 위로 호출 깊이)
+def _build_tree(counts):
+    root = {"name": "all", "count": 0, "children": {}}
+    for stack, count in counts.items():
+        root["count"] += count
+        node = root
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"name": name, "count": 0, "children": {}})
+            node["count"] += count
+    return root
+
+
+def _tree_depth(node):
+    return 1 + max((_tree_depth(child) for child in node["children"].values()), default=0)
+
+
+def _color(name):
+    # 같은 함수는 항상 같은 색 (주황~빨강 계열)
+    h = zlib.crc32(name.encode("utf-8"))
+    return f"rgb({205 + h % 50},{80 + (h >> 8) % 120},{(h >> 16) % 55})"
+
+
+def flamegraph_svg(counts, title=""):
+    root = _build_tree(counts)
+    total = root["count"] or 1
+    height = (_tree_depth(root) + 2) * SVG_ROW_HEIGHT
+    scale = SVG_WIDTH / total
+    rects = []
+
+    def draw(node, x, depth):
+        width = node["count"] * scale
+        if width < SVG_MIN_WIDTH:
+            return
+        y = height - (depth + 1) * SVG_ROW_HEIGHT
+        tooltip = f"{node['name']} — {node['count']} samples ({node['count'] / total:.1%})"
+        # 글자 폭 대략 7px 기준으로 칸에 들어가는 만큼만 표시
+        text = node["name"][: int(width / 7)] if width > 21 else ""
+        rects.append(
+            f'<g><title>{escape(tooltip)}</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{SVG_ROW_HEIGHT - 1}" fill="{_color(node["name"])}" rx="2"/>'
+            f'<text x="{x + 3:.2f}" y="{y + SVG_ROW_HEIGHT - 4}">{escape(text)}</text></g>'
+        )
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            draw(child, x, depth + 1)
+            x += child["count"] * scale
+
+    draw(root, 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fdfdfd"/>'
+        f'<text x="4" y="{SVG_ROW_HEIGHT - 3}" font-size="13">{escape(title)} · {total} samples</text>'
+        + "".join(rects)
+        + "</svg>\n"
+    )
@@ -0,0 +1,113 @@
+import sys
+import argparse
+
+from prompts import TEMPLATES, complete_json
+from query_engine import normalize_intent
+from llm_stub import OfflineChatClient
+
+# ✅ 프롬프트 템플릿 비교: full / compact의 해석 결과(intent)와 토큰 수
+# 실행: python prompt_compare.py --live     ← 실제 OpenAI API로 두 템플릿의 해석 결과 비교 (프롬프트 문구를 바꿨으면 이쪽으로 확인)
+#       python prompt_compare.py            ← 오프라인 스텁 (API 키 불필요): 응답 형식·토큰 수만 확인
+# 오프라인 스텁은 system 프롬프트를 읽지 않고 두 템플릿 모두 같은 로컬 규칙(llm_stub)으로 해석하므로
+# 해석 결과 비교는 의미가 없어 하지 않는다 (프롬프트 회귀는 잡지 못함).
+# 오프라인에서 확인하는 것은 max_tokens 초과로 잘린 응답(compact 출력 한도가 너무 작을 때), JSON 모드 설정,
+# 입력 토큰 수 비교뿐이다.
+
+SAMPLE_QUESTIONS = [
+    "2024년 DCM 대표주관 순위 1~10위 알려줘",
+    "2023년 ECM 상위 5개 증권사 금액 알려줘",
+    "2020~2024년 IPO 대표주관 순위 보여줘",
+    "2022년과 2023년 ABS 순위 비교해줘",
+    "2024년 여전채 점유율 상위 3개",
+    "2021년 일반회사채 건수 순위",
+    "2023년 유상증자 주관 순위 1~5위",
+    "KB증권 2020년부터 2024년까지 DCM 순위 추이 그래프로 보여줘",
+    "미래에셋증권과 한국투자증권 2023년 ECM 점유율 비교",
+    "2023년 대비 2024년 DCM에서 누가 올랐어?",
+    "NH투자증권 2024년 IPO 금액, 건수, 점유율 알려줘",
+    "2024년 CB 주관 순위 알려줘",
+    "2023년 M&A 자문 순위",
+    "2024년 국내채권 상위 10개",
+    "2022~2024년 DCM 상위 3개사 점유율 합계 알려줘",
+    "2020년부터 2024년까지 IPO에서 가장 빠르게 성장한 증권사는?",
+    "ECM 순위 변동성이 큰 증권사 상위 5개",
+    "2024년 ABS 제외한 DCM 대표주관 상위 5개",
+    "2023년 일반회사채와 여전채 합산 순위 알려줘",
+    "2024년 ECM이랑 DCM 1위 각각, 그리고 KB증권 IPO 순위 추이",
+    "KB증권이 IPO에서 마지막으로 1위 한 게 언제야?",
+]
+
+COMPARED_KEYS = ["products", "companies", "years", "columns", "top_n", "rank_range", "is_chart", "is_compare", "analysis", "exclude", "combine"]
+
+
+def _intent(parsed):
+    if isinstance(parsed.get("intents"), list):
+        return [_intent(sub) for sub in parsed["intents"]]
+    if "message" in parsed and len(parsed) == 1:
+        return {"message": parsed["message"]}
+    intent = normalize_intent(parsed)
+    return {k: intent[k] for k in COMPARED_KEYS}
+
+
+# compare_intents=False: 응답을 받아 JSON으로 읽었는지만 확인 (오프라인 스텁)
+def run(questions, client, baseline="full", candidate="compact", compare_intents=True):
+    rows, failures = [], 0
+    for query in questions:
+        row = {"query": query}
+        for name in (baseline, candidate):
+            try:
+                parsed, usage = complete_json(query, client, template=TEMPLATES[name])
+                row[name] = {"intent": _intent(parsed), "usage": usage}
+            except Exception as e:
+                row[name] = {"error": str(e), "usage": None}
+        base, cand = row[baseline], row[candidate]
+        row["match"] = "error" not in base and "error" not in cand and (not compare_intents or base["intent"] == cand["intent"])
+        failures += not row["match"]
+        rows.append(row)
+    return rows, failures
+
+
+def _tokens(rows, name, kind):
+    return sum(r[name]["usage"][kind] for r in rows if r[name]["usage"])
+
+
+def print_report(rows, failures, baseline="full", candidate="compact", compare_intents=True):
+    for row in rows:
+        mark = "✅" if row["match"] else "❌"
+        print(f"{mark} {row['query']}")
+        if not row["match"]:
+            for name in (baseline, candidate):
+                print(f"   {name}: {row[name].get('intent') or row[name].get('error')}")
+
+    print()
+    print(f"{'':10}{'입력 토큰':>12}{'출력 토큰':>12}{'캐시 토큰':>12}")
+    for name in (baseline, candidate):
+        print(f"{name:10}" + "".join(f"{_tokens(rows, name, kind):>12}" for kind in ("input", "output", "cached")))
+    base_in, cand_in = _tokens(rows, baseline, "input"), _tokens(rows, candidate, "input")
+    if base_in:
+        label = "해석 일치" if compare_intents else "응답 정상 (해석 비교 안 함)"
+        print(f"\n입력 토큰 절감: {(1 - cand_in / base_in) * 100:.1f}%  ({label} {len(rows) - failures}/{len(rows)})")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="full/compact 프롬프트 해석 결과 비교")
+    arg_parser.add_argument("--live", action="store_true", help="오프라인 스텁 대신 실제 OpenAI API 호출")
+    args = arg_parser.parse_args()
+
+    if args.live:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        load_dotenv()
+        client = OpenAI()
+    else:
+        client = OfflineChatClient()
+
+    rows, failures = run(SAMPLE_QUESTIONS, client, compare_intents=args.live)
+    print_report(rows, failures, compare_intents=args.live)
+    if not args.live:
+        print("ℹ️ 오프라인 스텁은 두 템플릿을 같은 로컬 규칙으로 해석하므로 응답 형식·토큰 수만 확인했습니다 (해석 비교는 --live)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
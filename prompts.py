@@ -0,0 +1,218 @@
+import os
+import re
+import json
+
+from tracing import span
+from metrics import LLM_LATENCY, LLM_TOKENS
+from deadline import check_cancelled, on_cancel, remaining
+
+# ✅ GPT 질문 해석용 프롬프트 템플릿 + 토큰 집계
+# - full: 기존 장문 프롬프트 (gpt-4, 자유 텍스트 응답)
+# - compact: 같은 규칙을 압축한 프롬프트 + JSON 모드 + 작은 max_tokens
+#   절감은 입력/출력 토큰 수 기준 (compact 시스템 메시지는 약 500토큰으로, 공급자 프롬프트 캐시 최소 길이 1024토큰보다
+#   짧아 캐시 적중은 기대하지 않음 — 토큰 표의 cached는 참고용)
+# 선택: LEAGUE_PROMPT_TEMPLATE=full|compact (기본 full), 모델은 LEAGUE_PARSER_MODEL로 덮어쓰기 가능
+# 템플릿 비교: python prompt_compare.py --live (오프라인 실행은 응답 형식·토큰 수만 확인)
+
+FULL_SYSTEM_PROMPT = (
+    '사용자의 질문을 다음 항목으로 분석해서 반드시 올바른 JSON 형식으로 응답해줘. '
+    'true/false/null은 반드시 소문자 그대로 사용하고, 문자열은 큰따옴표("")로 감싸줘. '
+    '\n\n'
+    '- years: [2023, 2024] 형태\n'
+    '- product: ECM, DCM, SB, ABS, FB, IPO, RO 중 하나 또는 여러 개 (문맥 또는 명시된 키워드 기반 추출)\n'
+    '- columns: ["금액", "건수", "점유율"] 중 하나 이상\n'
+    '- company: 증권사명 (한 개 또는 여러 개 리스트 가능)\n'
+    '- top_n: 숫자 (선택적)\n'
+    '- rank_range: [시작위, 끝위] (선택적)\n'
+    '- is_chart: true/false\n'
+    '- is_compare: true/false\n'
+    '- analysis: "concentration", "volatility", "cagr", "milestone" 중 하나 (선택적)\n'
+    '- exclude: 제외할 상품 목록 (예: "ABS 제외한 DCM" → product ["DCM"], exclude ["ABS"]) (선택적)\n'
+    '- combine: 여러 상품을 합산한 하나의 순위를 원하면 true (예: "SB와 FB 합산 순위") (선택적)\n'
+    '\n'
+    '🟡 아래 조건을 반드시 따를 것:\n'
+    '1. 질문에 "1~10위", "상위 3개", "상위 몇 개" 등 **정확한 숫자 범위나 개수 표현**이 있을 경우에만 "rank_range" 또는 "top_n"을 포함할 것\n'
+    '2. 질문에 "금액", "점유율", "건수"가 들어 있으면 "columns" 필드에 반드시 포함할 것\n'
+    '3. "그래프", "추이", "변화" 등의 표현이 있으면 "is_chart": true 로 설정할 것\n'
+    '4. "비교", "누가 올랐어?", "누가 떨어졌어?" 등의 표현이 있으면 "is_compare": true 로 설정할 것\n'
+    '5. 연도가 명시되어 있을 경우 "years" 배열로 정확히 추출할 것\n'
+    '   - "2020~2024년", "2020년부터 2024년까지"처럼 기간이면 사이 연도를 모두 포함할 것\n'
+    '6. 시장 구조 분석이나 순위 기록 질문이면 "analysis"를 포함할 것:\n'
+    '   - "집중도", "HHI", "허핀달", "점유율 합계" → "concentration" (예: "DCM 상위 3개사 점유율 합계" → top_n 3)\n'
+    '   - "변동성", "순위 변동" → "volatility"\n'
+    '   - "성장률", "CAGR", "가장 빠르게 성장" → "cagr"\n'
+    '   - "N년/분기 연속 1위", "마지막으로/처음으로 1위" 같은 회사의 1위 기록(이정표) → "milestone" (두 연도 비교·"가장 크게 오른" 질문은 is_compare)\n'
+    '7. 질문에 다음 키워드가 포함되면 반드시 해당 "product"로 처리할 것:\n'
+    '   - "ABS", "자산유동화증권" → "ABS"\n'
+    '   - "FB", "여전채", "여신전문금융회사채권" → "FB"\n'
+    '   - "SB", "일반회사채", "회사채" → "SB"\n'
+    '   - "IPO", "기업공개" → "IPO"\n'
+    '   - "유상증자", "유증", "RO", "Rights Offering" → "RO"\n'
+    '   - "ECM" → "ECM"\n'
+    '   - "DCM", "국내채권" → "DCM"\n'
+    '8. 서로 다른 요청이 여러 개 섞인 질문(예: "2024년 ECM이랑 DCM 1위 각각, 그리고 KB증권 IPO 순위 추이")이면\n'
+    '   {"intents": [요청1, 요청2, ...]} 형태로 요청마다 위 항목을 채운 객체를 질문 순서대로 넣을 것\n'
+    '   - "2024년 DCM, ECM 상위 3개"처럼 상품만 나열한 쉼표는 요청 하나 (product 여러 개)\n'
+    '   - 연도·상위 N/순위 범위·비교·항목이 없는 요청은 앞 요청의 값을 그대로 사용, 요청이 하나뿐이면 intents 없이 객체 하나로 응답\n'
+    '\n'
+    '- 단, 질문에 명확히 SB/ABS/FB/IPO/RO가 포함되어 있으면 그 하위 상품명을 그대로 product에 사용해야 함\n'
+    '  (예: "2024년 FB 순위 알려줘" → product는 "FB")\n'
+    '\n'
+    '🔴 아래 키워드가 포함된 질문은 무조건 다음과 같이 응답할 것:\n'
+    '"⚠️질문 주신 내용은 추후 업데이트 될 예정입니다."\n'
+    '\n'
+    '- 키워드 목록:\n'
+    '  전환사채, CB, BW, 신주인수권부사채, ELB, M&A, VC, 벤처캐피탈, '
+    '인수 순위, 인수 실적, 수수료, 수수료 실적, 수수료 순위, 자문 실적, 자문 순위, 부동산, 헤지펀드, 수익률\n'
+)
+
+COMPACT_SYSTEM_PROMPT = (
+    '리그테이블 질문을 JSON 객체 하나로 변환. 키:\n'
+    'years:int[] product:("ECM"|"DCM"|"SB"|"ABS"|"FB"|"IPO"|"RO")[] columns:("금액"|"건수"|"점유율")[] '
+    'company:str[] is_chart:bool is_compare:bool, 선택 top_n:int rank_range:[시작,끝] '
+    'analysis:"concentration"|"volatility"|"cagr"|"milestone" exclude:상품[] combine:bool\n'
+    '규칙: 연도 기간은 사이 연도 모두 포함. 숫자 범위/개수("1~10위","상위 3개")가 있을 때만 rank_range/top_n. '
+    '금액/건수/점유율 언급→columns. 그래프/추이/변화→is_chart. 비교/올랐/떨어졌→is_compare. '
+    '집중도/HHI/허핀달/점유율 합계→analysis "concentration", 변동성/순위 변동→"volatility", 성장률/CAGR/가장 빠르게 성장→"cagr", 연속 1위/마지막·처음 1위→"milestone". '
+    '"○○ 제외/빼고"→exclude에 ○○ 상품, 여러 상품 합산/합친→combine true. '
+    '서로 다른 요청이 여러 개면 {"intents":[요청 객체...]} (질문 순서, 상품만 나열한 쉼표는 요청 하나, 연도·상위 N·비교·항목 없는 요청은 앞 요청 값).\n'
+    '상품: 자산유동화증권→ABS, 여전채·여신전문금융회사채권→FB, 일반회사채·회사채→SB, 기업공개→IPO, '
+    '유상증자·유증·Rights Offering→RO, 국내채권→DCM. 하위 상품명이 있으면 그대로 사용.\n'
+    '전환사채,CB,BW,신주인수권부사채,ELB,M&A,VC,벤처캐피탈,인수 순위,인수 실적,수수료,자문 실적,자문 순위,부동산,헤지펀드,수익률 '
+    '포함 시 {"message":"⚠️질문 주신 내용은 추후 업데이트 될 예정입니다."}'
+)
+
+
+class PromptTemplate:
+    def __init__(self, name, system_prompt, model, max_tokens, json_mode=False, temperature=0.2):
+        self.name = name
+        self.system_prompt = system_prompt
+        self.model = model
+        self.max_tokens = max_tokens
+        self.json_mode = json_mode
+        self.temperature = temperature
+
+    def messages(self, query):
+        # 고정 시스템 메시지 → 질문 (질문은 항상 마지막 user 메시지)
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": query},
+        ]
+
+    def request_kwargs(self, query, model=None):
+        kwargs = {
+            "model": model or self.model,
+            "messages": self.messages(query),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+
+TEMPLATES = {
+    "full": PromptTemplate("full", FULL_SYSTEM_PROMPT, model="gpt-4", max_tokens=800),
+    # JSON 모드는 gpt-4(0613)에서 지원되지 않으므로 compact는 gpt-4o 계열 사용
+    # 복합 질문은 요청 객체 여러 개를 돌려주므로 출력 한도를 그만큼 확보
+    "compact": PromptTemplate("compact", COMPACT_SYSTEM_PROMPT, model="gpt-4o-mini", max_tokens=320, json_mode=True),
+}
+
+
+def get_template(name=None):
+    name = name or os.getenv("LEAGUE_PROMPT_TEMPLATE", "full")
+    if name not in TEMPLATES:
+        raise ValueError(f"알 수 없는 프롬프트 템플릿입니다: {name} (사용 가능: {', '.join(TEMPLATES)})")
+    return TEMPLATES[name]
+
+
+# ✅ 토큰 수 계산 (tiktoken이 있으면 정확히, 없으면 근사치)
+def _load_encoder(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+_encoders = {}
+
+
+def count_tokens(text, model="gpt-4"):
+    if model not in _encoders:
+        _encoders[model] = _load_encoder(model)
+    encoder = _encoders[model]
+    if encoder is not None:
+        return len(encoder.encode(text))
+    # 근사치: 한글 등 비ASCII는 글자당 약 1토큰, ASCII는 약 4글자당 1토큰
+    non_ascii = len(re.findall(r"[^\x00-\x7f]", text))
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def token_usage(response, kwargs):
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input": usage.prompt_tokens,
+            "output": usage.completion_tokens,
+            "cached": getattr(details, "cached_tokens", 0) or 0,
+            "estimated": False,
+        }
+    # usage가 없는 응답(일부 프록시/스텁)은 직접 계산
+    content = response.choices[0].message.content or ""
+    return {
+        "input": sum(count_tokens(m["content"], kwargs["model"]) for m in kwargs["messages"]),
+        "output": count_tokens(content, kwargs["model"]),
+        "cached": 0,
+        "estimated": True,
+    }
+
+
+def _record_usage(template, usage):
+    for kind in ("input", "output", "cached"):
+        if usage[kind]:
+            LLM_TOKENS.inc(usage[kind], template=template.name, kind=kind)
+
+
+# ✅ 템플릿으로 GPT 호출 → (parsed, usage) 반환 (실패 시 예외)
+# close_on_cancel: 요청이 중단되면 client.close()로 진행 중인 HTTP 연결을 끊음 (이 요청 전용 클라이언트일 때만)
+def complete_json(query, client, template=None, model=None, close_on_cancel=False):
+    template = template or get_template()
+    kwargs = template.request_kwargs(query, model=model or os.getenv("LEAGUE_PARSER_MODEL"))
+    # 요청 마감까지 남은 시간을 HTTP timeout으로 넘김 (마감이 없으면 클라이언트 기본값)
+    timeout = remaining()
+    if timeout is not None:
+        kwargs["timeout"] = max(timeout, 0.1)
+
+    with span("gpt_parse", model=kwargs["model"], template=template.name) as parse_span:
+        check_cancelled("parse")
+        try:
+            with on_cancel(getattr(client, "close", None) if close_on_cancel else None):
+                with LLM_LATENCY.time(model=kwargs["model"], purpose="parse"):
+                    response = client.chat.completions.create(**kwargs)
+        except Exception:
+            # 마감/취소로 끊긴 호출이면 연결 오류 대신 RequestCancelled/DeadlineExceeded로 올림
+            check_cancelled("parse")
+            raise
+
+        usage = token_usage(response, kwargs)
+        _record_usage(template, usage)
+        parse_span.set(input_tokens=usage["input"], output_tokens=usage["output"], cached_tokens=usage["cached"])
+
+        choice = response.choices[0]
+        if getattr(choice, "finish_reason", None) == "length":
+            raise ValueError(f"GPT 응답이 max_tokens({template.max_tokens})에서 잘렸습니다.")
+        content = (choice.message.content or "").strip()
+        # full 템플릿은 안내 문구를 JSON 없이 돌려줄 수 있음
+        if content.strip('"').startswith("⚠️"):
+            parsed = {"message": content.strip('"')}
+        else:
+            parsed = json.loads(content)
+        if not isinstance(parsed, dict):
+            raise ValueError("GPT 결과가 유효한 JSON 형식이 아님")
+        parse_span.set(parsed=parsed)
+    return parsed, usage
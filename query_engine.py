@@ -0,0 +1,654 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from utils import load_dataframes, normalize_column_name, product_aliases, company_aliases, page_window, TABLE_PAGE_SIZE
+from tracing import span, traced
+from prompts import complete_json, get_template
+from llm_gate import LLM_GATE, LLMOverloaded, normalize_query_key
+from deadline import RequestCancelled, DeadlineExceeded, check_cancelled
+from metrics import PARSE_RESULTS, QUERY_COUNT
+from cache_manager import cache_region, estimate_size, store_version
+
+# ✅ Streamlit 없이 재사용 가능한 질의 파이프라인 (parse → filter → result)
+# rank_compare_chatbot.py(UI)와 api_server.py(HTTP) 등이 같은 로직을 공유한다.
+
+DISPLAY_COLUMNS = ["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
+
+product_display_names = {v: k.upper() for k, v in product_aliases.items()}
+
+# ✅ DCM/ECM 폴더를 한 번에 로딩 (프로세스당 1회 호출 후 재사용)
+def load_store(base_dir=None):
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+
+    dfs_dcm, structured_dcm = load_dataframes(os.path.join(base_dir, "DCM"))
+    dfs_ecm, structured_ecm = load_dataframes(os.path.join(base_dir, "ECM"))
+
+    dfs = {**dfs_dcm, **dfs_ecm}
+    structured_dfs = {**structured_dcm, **structured_ecm}
+
+    # 회사별 프로필(연도 합산 테이블 포함), 시장 구조 지표, 순위 이정표 색인을 로딩 시점에 미리 생성
+    from company_profiles import get_company_profiles
+    from analytics import warm_analytics
+    from milestones import warm_milestones
+    with span("company_profiles"):
+        get_company_profiles(dfs)
+    with span("analytics"):
+        warm_analytics(dfs)
+    with span("milestones"):
+        warm_milestones(dfs)
+    return dfs, structured_dfs
+
+
+# ✅ GPT 파서 (프롬프트 템플릿/토큰 집계는 prompts.py, 동시성 제어는 llm_gate.py, 실패 시 예외를 그대로 올려 호출 측에서 처리)
+def parse_query(query, client=None, template=None):
+    from openai import OpenAI  # openai>=1.0.0 기준
+
+    # 직접 만든 클라이언트만 요청 중단 시 close (호출 측이 넘긴 클라이언트는 공유일 수 있음)
+    owned = client is None
+    client = client or OpenAI()
+    template = get_template(template)
+    # 같은 질문이 동시에 들어오면 GPT 호출 1회를 공유하고, 전역 동시 호출 수를 제한
+    key = (template.name, normalize_query_key(query))
+    try:
+        parsed = LLM_GATE.run(key, lambda: complete_json(query, client, template=template, close_on_cancel=owned)[0])
+    except LLMOverloaded:
+        PARSE_RESULTS.inc(outcome="overloaded")
+        raise
+    except RequestCancelled as e:
+        PARSE_RESULTS.inc(outcome="deadline" if isinstance(e, DeadlineExceeded) else "cancelled")
+        raise
+    except Exception:
+        PARSE_RESULTS.inc(outcome="error")
+        raise
+    PARSE_RESULTS.inc(outcome="ok")
+    return parsed
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, (str, int)) else list(value)
+
+
+# ✅ GPT 결과를 내부 키(상품/회사 alias 적용, 컬럼 정규화)로 정리
+@traced("alias_resolution")
+def normalize_intent(parsed):
+    products = [product_aliases.get(str(p).lower(), str(p).lower()) for p in _as_list(parsed.get("product"))]
+    companies = [company_aliases.get(c, c).replace(" ", "") for c in _as_list(parsed.get("company"))]
+    years = [int(y) for y in _as_list(parsed.get("years"))]
+    columns = [normalize_column_name(str(c)) for c in _as_list(parsed.get("columns"))]
+    analysis = str(parsed.get("analysis") or "").lower() or None
+    # 두 연도 비교 질문("2023년 대비 2024년 … 가장 크게 오른")은 이정표가 아니라 비교 표로 답함
+    if analysis == "milestone" and parsed.get("is_compare") and len(years) == 2:
+        analysis = None
+
+    return {
+        "products": products,
+        "companies": companies,
+        "years": years,
+        "columns": columns,
+        "role": parsed.get("role") or "lead",
+        "top_n": parsed.get("top_n"),
+        "rank_range": parsed.get("rank_range"),
+        "is_chart": bool(parsed.get("is_chart")),
+        "is_compare": bool(parsed.get("is_compare")),
+        "analysis": analysis,
+        "exclude": [product_aliases.get(str(p).lower(), str(p).lower()) for p in _as_list(parsed.get("exclude"))],
+        "combine": bool(parsed.get("combine")),
+    }
+
+
+# ✅ (상품, 역할) 테이블 조회: 대표주관(lead) 테이블 우선, 없으면 기존 방식 dfs[product]
+def get_table(dfs, product, role="lead", filter_cond=None):
+    for key in [(product, role, filter_cond), (product, role), (product, None, None)]:
+        df = dfs.get(key)
+        if df is not None and not df.empty:
+            return df
+    return dfs.get(product)
+
+
+# ✅ 분기 실적을 연도 단위 리그테이블로 합산 (점유율/순위 재계산)
+def build_annual_table(df):
+    if "분기" not in df.columns:
+        return df[[c for c in DISPLAY_COLUMNS if c in df.columns]].copy()
+
+    rows = df.dropna(subset=["금액(원)"])
+    annual = rows.groupby(["연도", "주관사"], as_index=False)[["금액(원)", "건수"]].sum()
+    # 분기 원본에 결측이 섞이면 금액/건수가 실수형으로 읽히므로 합계를 정수로 복원 (원본 값은 모두 정수)
+    for col in ["금액(원)", "건수"]:
+        if annual[col].dtype.kind == "f":
+            annual[col] = annual[col].round().astype("int64")
+
+    # 시장 전체 금액은 분기별 (금액 / 점유율)로 역산, 점유율이 없으면 상위사 합계로 대체
+    implied = (rows["금액(원)"] / rows["점유율(%)"] * 100).where(rows["점유율(%)"] > 0)
+    market = implied.groupby([rows["연도"], rows["분기"]]).median().groupby(level=0).sum()
+    return rerank(annual, market)
+
+
+# ✅ (연도, 주관사)별 금액/건수 합계에 점유율·순위를 다시 매김
+# market: 연도별 시장 전체 금액 (없거나 0이면 표에 있는 회사 합계로 대체)
+def rerank(annual, market):
+    listed = annual.groupby("연도")["금액(원)"].transform("sum")
+    total = annual["연도"].map(market).where(lambda s: s > 0, listed)
+
+    annual["점유율(%)"] = (annual["금액(원)"] / total * 100).round(2)
+    annual["순위"] = annual.groupby("연도")["금액(원)"].rank(method="min", ascending=False).astype(int)
+    return annual.sort_values(["연도", "순위"]).reset_index(drop=True)[DISPLAY_COLUMNS]
+
+
+# ✅ 연도 합산 테이블은 원본 프레임당 1회만 계산 (서버/배치에서 질문마다 재계산 방지)
+_annual_cache = cache_region("annual_table")
+
+def get_annual_table(dfs, product, role="lead", filter_cond=None):
+    df = get_table(dfs, product, role, filter_cond)
+    if df is None or df.empty:
+        return None
+    return _annual_cache.get_or_build(id(df), lambda: build_annual_table(df), anchor=df)
+
+
+# ✅ 증분 반영: 바뀐 연도의 행만 다시 합산해 기존 연도 합산 테이블에 끼워 넣음 (연도끼리는 서로 독립)
+# 반환값: (이전 연도 합산 테이블, 새 연도 합산 테이블), 이전 테이블이 캐시에 없으면 None (다음 조회 때 전체 계산)
+def update_annual_table(old_df, new_df, years):
+    cached = _annual_cache.pop(id(old_df), anchor=old_df)
+    if cached is None:
+        return None
+    previous, cost = cached
+    part = build_annual_table(new_df[new_df["연도"].isin(years)])
+    annual = pd.concat([previous[~previous["연도"].isin(years)], part], ignore_index=True)
+    annual = annual.sort_values(["연도", "순위"], kind="stable").reset_index(drop=True).astype(previous.dtypes.to_dict())
+    _annual_cache.put(id(new_df), annual, anchor=new_df, cost=cost)
+    return previous, annual
+
+
+# ✅ 상품/조건 테이블 조회, 파일이 없으면 구성 상품 합산으로 계산 (예: sb, dcm noabs)
+def resolve_annual_table(dfs, product, role="lead", filter_cond=None):
+    from composition import COMPONENTS, FILTER_COMPONENTS, get_composite_table
+
+    exact = dfs.get((product, role, filter_cond))
+    if exact is None or exact.empty:
+        if (product, filter_cond) in FILTER_COMPONENTS:
+            table, _ = get_composite_table(dfs, FILTER_COMPONENTS[(product, filter_cond)], role)
+            if table is not None:
+                return table
+        base_product, base_filter = COMPONENTS.get(product, (product, None))
+        if filter_cond is None and base_product != product:
+            return get_annual_table(dfs, base_product, role, base_filter)
+    return get_annual_table(dfs, product, role, filter_cond)
+
+
+# ✅ 여러 상품의 조건 컬럼(연도/주관사/순위)만 한 배열로 쌓아 두고 (상품, 연도[, 주관사, 순위]) 조건을 한 번에 적용
+# 상품마다 테이블 조회 → 연도 필터를 반복하지 않고, 마스크 1회로 고른 행 번호를 상품별 구간으로 나눠
+# 원본 테이블에서 그대로 꺼낸다 (행 데이터 전체를 복사하거나 dtype을 되돌릴 필요 없음).
+# annual=True: 연도 합산 테이블(resolve_annual_table), False: 원본 분기 테이블(dfs[상품])
+# 새 분기가 반영되면(데이터 버전 증가) 이전 묶음은 버리고 다시 쌓음
+STACK_COLUMNS = ["연도", "주관사", "순위"]
+_stack_cache = cache_region("stacked", versioned=True)
+
+
+# 반환값: (쌓은 조건 컬럼, [(상품, 원본 테이블, 시작 행, 끝 행)], [데이터 없는 상품])
+def stack_tables(dfs, products, role="lead", annual=True):
+    tables = [(p, resolve_annual_table(dfs, p, role) if annual else dfs.get(p)) for p in dict.fromkeys(products)]
+    present = [(p, t) for p, t in tables if t is not None and not t.empty]
+    missing = [p for p, t in tables if t is None or t.empty]
+    if not present:
+        return None, [], missing
+
+    key = (annual, role, tuple(p for p, _ in present))
+    tables = tuple(t for _, t in present)
+    cached = _stack_cache.get(key, anchor=tables)
+    if cached is None:
+        version = store_version()
+        started = time.perf_counter()
+        stacked = pd.concat([t.reindex(columns=STACK_COLUMNS) for t in tables], ignore_index=True)
+        offsets = np.cumsum([0] + [len(t) for t in tables])
+        parts = [(p, t, int(offsets[i]), int(offsets[i + 1])) for i, (p, t) in enumerate(present)]
+        cached = (stacked, parts)
+        # 크기는 쌓은 조건 컬럼만 (원본 테이블은 dfs/연도 합산 캐시가 소유)
+        _stack_cache.put(key, cached, anchor=tables, cost=time.perf_counter() - started, size=estimate_size(stacked), version=version)
+    return cached[0], cached[1], missing
+
+
+# 반환값: ({상품: 조건에 맞는 행(원본 테이블의 행, 없으면 빈 표)}, [데이터 없는 상품])
+# top_n: 상품·연도별로 순위순 상위 N행 (분기 원본에서 연도별 head와 같은 동작)
+def filter_products(dfs, products, years=None, companies=None, rank_range=None, top_n=None, role="lead", annual=True):
+    stacked, parts, missing = stack_tables(dfs, products, role, annual)
+    if stacked is None:
+        return {}, missing
+
+    checks = []
+    if years:
+        checks.append(("연도", lambda values: values.isin(years)))
+    if companies:
+        checks.append(("주관사", lambda values: values.isin(companies)))
+    if rank_range:
+        low, high = rank_range
+        checks.append(("순위", lambda values: values.between(low, high)))
+
+    # 조건마다 앞 조건을 통과한 행만 검사 (전체 길이의 마스크를 조건 수만큼 만들지 않음)
+    rows = None
+    for column, check in checks:
+        hit = check(stacked[column] if rows is None else stacked[column].iloc[rows]).to_numpy()
+        rows = np.flatnonzero(hit) if rows is None else rows[hit]
+    if rows is None:
+        rows = np.arange(len(stacked))
+    codes = np.searchsorted([stop for _, _, _, stop in parts], rows, side="right")  # 행 번호 → 상품 순번
+
+    if top_n:
+        # (상품, 연도, 순위) 순으로 정렬(동순위는 원래 순서)한 뒤 (상품, 연도) 묶음 안 순번이 N 미만인 행만
+        year = pd.to_numeric(stacked["연도"].iloc[rows], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        rank = pd.to_numeric(stacked["순위"].iloc[rows], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        order = np.lexsort((rank, year, codes))
+        rows, codes, year = rows[order], codes[order], year[order]
+        position = np.arange(len(rows))
+        group_start = np.r_[True, (codes[1:] != codes[:-1]) | (year[1:] != year[:-1])]
+        keep = position - np.maximum.accumulate(np.where(group_start, position, 0)) < int(top_n)
+        rows, codes = rows[keep], codes[keep]
+
+    bounds = np.searchsorted(codes, np.arange(len(parts) + 1))
+    split = {
+        product: table.iloc[rows[bounds[i]:bounds[i + 1]] - start]
+        for i, (product, table, start, _) in enumerate(parts)
+    }
+    return split, missing
+
+
+# ✅ 비교 함수
+@traced("compare")
+def compare_rank(df, year1, year2, metric_col="순위"):
+    df1 = df[df["연도"] == year1][["주관사", metric_col]].copy()
+    df2 = df[df["연도"] == year2][["주관사", metric_col]].copy()
+
+    df1.rename(columns={metric_col: f"{year1}년 {metric_col}"}, inplace=True)
+    df2.rename(columns={metric_col: f"{year2}년 {metric_col}"}, inplace=True)
+
+    merged = pd.merge(df1, df2, on="주관사")
+    merged["변화"] = merged[f"{year2}년 {metric_col}"] - merged[f"{year1}년 {metric_col}"]
+
+    ascending_order = True if metric_col == "순위" else False
+
+    상승 = merged[merged["변화"] < 0].sort_values("변화", ascending=ascending_order)
+    하락 = merged[merged["변화"] > 0].sort_values("변화", ascending=not ascending_order)
+
+    target_columns = ["주관사", f"{year1}년 {metric_col}", f"{year2}년 {metric_col}", "변화"]
+    상승 = 상승[target_columns]
+    하락 = 하락[target_columns]
+
+    return 상승, 하락
+
+
+@traced("compare")
+def compare_share(df, year1, year2):
+    df1 = df[df["연도"] == year1][["주관사", "점유율(%)"]].copy()
+    df2 = df[df["연도"] == year2][["주관사", "점유율(%)"]].copy()
+
+    # ✅ 열 이름을 비교 출력에 맞게 변경 (예: "2022년 점유율(%)")
+    df1.rename(columns={"점유율(%)": f"{year1}년 점유율(%)"}, inplace=True)
+    df2.rename(columns={"점유율(%)": f"{year2}년 점유율(%)"}, inplace=True)
+
+    # ✅ 병합 후 변화 계산
+    merged = pd.merge(df1, df2, on="주관사")
+    merged["변화"] = merged[f"{year2}년 점유율(%)"] - merged[f"{year1}년 점유율(%)"]
+
+    # ✅ 상승/하락 정렬
+    상승 = merged[merged["변화"] > 0].sort_values("변화", ascending=False)
+    하락 = merged[merged["변화"] < 0].sort_values("변화")
+
+    return 상승, 하락
+
+
+def _display_name(product):
+    return product_display_names.get(product, product.upper())
+
+
+# ✅ 상품 지정 없이 회사만 있는 경우: 전 상품 실적 + 최고 순위 (회사 프로필 조회)
+def _company_overview(intent, dfs):
+    from company_profiles import get_company_profile, profile_rows, best_rank
+
+    companies, years = intent["companies"], intent["years"]
+    results, warnings = [], []
+
+    frames, best = [], None
+    for company in companies:
+        profile = get_company_profile(dfs, company)
+        if profile is None:
+            continue
+        frames.append(profile_rows(profile, years, intent["role"]))
+        record = best_rank(profile, years, intent["role"])
+        if record is not None and (best is None or (record["순위"], record["상품"]) < (best["순위"], best["상품"])):
+            best = record
+
+    rows = pd.concat(frames) if frames else pd.DataFrame(columns=DISPLAY_COLUMNS + ["상품"])
+    for product, product_rows in rows.groupby("상품", sort=True):
+        table = product_rows.sort_values(["연도", "순위"], kind="stable")[DISPLAY_COLUMNS].reset_index(drop=True)
+        results.append({"title": f"{_display_name(product)} {', '.join(companies)} 실적", "table": table})
+
+    if best is None:
+        warnings.append(f"'{', '.join(companies)}'에 대한 데이터를 어떤 상품에서도 찾을 수 없습니다.")
+    else:
+        results.insert(0, {
+            "title": f"{int(best['연도'])}년 {best['주관사']}의 최고 순위는 {_display_name(best['상품'])}에서 {int(best['순위'])}위",
+            "table": pd.DataFrame([best])[DISPLAY_COLUMNS],
+        })
+    return results, warnings
+
+
+# 순위 조건 (start, end): 순위 범위 우선, 회사 지정이 없을 때만 상위 N
+def _rank_bounds(intent):
+    if intent["rank_range"]:
+        start, end = intent["rank_range"]
+        return int(start), int(end)
+    if intent["top_n"] and not intent["companies"]:
+        return 1, int(intent["top_n"])
+    return None
+
+
+# ✅ 상품별 순위/비교/회사 실적
+# by_product=True: 상품 키 → (결과, 경고)로 나눠 반환 (여러 상품을 한 번에 필터하고 상품별로 캐시할 때)
+def _product_results(intent, dfs, by_product=False):
+    products, companies, years = intent["products"], intent["companies"], intent["years"]
+    results, warnings = [], []
+    slices = {}
+
+    # 상품 합산(combine) 또는 제외(exclude) 요청이면 구성 상품을 합쳐 하나의 리그테이블로 계산
+    if intent["exclude"] or (intent["combine"] and len(products) > 1):
+        from composition import resolve_components, composite_label, get_composite_table
+        components = resolve_components(products or ["ecm"], intent["exclude"])
+        annual, missing = get_composite_table(dfs, components, intent["role"]) if components else (None, [])
+        if missing:
+            warnings.append(f"{', '.join(_display_name(c) for c in missing)} 데이터가 없어 합산에서 제외했습니다.")
+        targets = [(None, composite_label(products or ["ecm"], intent["exclude"]), annual)]
+    else:
+        targets = [(p, _display_name(p), resolve_annual_table(dfs, p, intent["role"])) for p in products or ["ecm"]]
+
+    # 여러 상품이면 (상품, 연도, 주관사, 순위) 조건을 쌓은 테이블에 한 번만 적용하고 상품별로 나눔
+    prefiltered = {}
+    if len(targets) > 1:
+        compare_years = intent["is_compare"] and len(years) == 2
+        split, _ = filter_products(
+            dfs, products, years=years or None, companies=None if compare_years else companies or None,
+            rank_range=None if compare_years else _rank_bounds(intent), role=intent["role"],
+        )
+        prefiltered = {_display_name(p): rows for p, rows in split.items()}
+
+    for product, product_str, annual in targets:
+        check_cancelled("filter")
+        slices[product] = (len(results), len(warnings))
+        if annual is None:
+            warnings.append(f"{product_str} 데이터가 없습니다.")
+            continue
+
+        # ✅ 비교 요청 처리 (순위 / 건수 / 점유율 변화)
+        if intent["is_compare"] and len(years) == 2:
+            y1, y2 = years
+            source = prefiltered.get(product_str, annual)
+            metric_col = next((c for c in ["점유율(%)", "건수", "순위"] if c in intent["columns"]), "순위")
+            if metric_col == "점유율(%)":
+                상승, 하락 = compare_share(source, y1, y2)
+            else:
+                상승, 하락 = compare_rank(source, y1, y2, metric_col)
+
+            if companies:
+                상승 = 상승[상승["주관사"].isin(companies)]
+                하락 = 하락[하락["주관사"].isin(companies)]
+
+            metric_label = "점유율" if metric_col == "점유율(%)" else metric_col
+            target_str = f" (대상: {', '.join(companies)})" if companies else ""
+            results.append({"title": f"{y1} → {y2} {product_str} 주관 {metric_label} 상승{target_str}", "table": 상승.reset_index(drop=True), "kind": "compare"})
+            results.append({"title": f"{y1} → {y2} {product_str} 주관 {metric_label} 하락{target_str}", "table": 하락.reset_index(drop=True), "kind": "compare"})
+            continue
+
+        if product_str in prefiltered:
+            filtered_df = prefiltered[product_str]
+        else:
+            filtered_df = annual[annual["연도"].isin(years)] if years else annual
+            if companies:
+                filtered_df = filtered_df[filtered_df["주관사"].isin(companies)]
+            bounds = _rank_bounds(intent)
+            if bounds:
+                filtered_df = filtered_df[filtered_df["순위"].between(*bounds)]
+
+        # ✅ 회사가 지정된 경우: 해당 회사 실적
+        if companies:
+            if filtered_df.empty:
+                warnings.append(f"{product_str} 데이터에서 {', '.join(companies)} 실적을 찾을 수 없습니다.")
+                continue
+            results.append({"title": f"{', '.join(companies)}의 {product_str} 실적", "table": filtered_df.reset_index(drop=True),
+                            "kind": "company", "label": product_str, "annual": annual})
+            continue
+
+        # ✅ Top N, Rank Range, 전체 순위 (순위 조건은 위에서 적용)
+        if filtered_df.empty:
+            warnings.append(f"{product_str} 데이터에서 순위 정보를 찾을 수 없습니다.")
+            continue
+
+        display_cols = DISPLAY_COLUMNS
+        requested = [c for c in ["금액(원)", "건수", "점유율(%)"] if c in intent["columns"]]
+        if requested:
+            display_cols = ["연도", "순위", "주관사"] + requested
+        # kind/label/annual은 요약문(narrative.py)에서 전년 대비 변화를 계산할 때 사용
+        results.append({"title": f"{product_str} 대표주관 순위", "table": filtered_df[display_cols].reset_index(drop=True),
+                        "kind": "ranking", "label": product_str, "annual": annual})
+
+    if by_product:
+        # 각 상품이 시작한 (결과, 경고) 위치부터 다음 상품 시작 전까지
+        bounds = list(slices.values()) + [(len(results), len(warnings))]
+        return {
+            product: (results[r0:r1], warnings[w0:w1])
+            for product, (r0, w0), (r1, w1) in zip(slices, bounds, bounds[1:])
+        }
+    return results, warnings
+
+
+# ✅ 시장 구조 지표 (집중도 / 순위 변동성 / 금액 CAGR)
+def analytics_results(intent, dfs):
+    from analytics import ANALYSES, CR_LEVELS, get_analytics, market_structure, company_momentum
+
+    analysis, years, companies, top_n = intent["analysis"], intent["years"], intent["companies"], intent["top_n"]
+    results, warnings = [], []
+    if analysis not in ANALYSES:
+        return results, [f"지원하지 않는 분석 유형입니다: {analysis}"]
+
+    for product in intent["products"] or ["ecm"]:
+        product_str = _display_name(product)
+        data = get_analytics(dfs, product, intent["role"])
+        if data is None:
+            warnings.append(f"{product_str} 데이터가 없습니다.")
+            continue
+
+        if analysis == "concentration":
+            structure = data["structure"]
+            columns = list(structure.columns)
+            if top_n:
+                n = int(top_n)
+                if n not in CR_LEVELS:
+                    structure = market_structure(data["annual"], levels=(n,))
+                columns = ["연도", "HHI", f"CR{n}(%)", "참여사 수"]
+            if years:
+                structure = structure[structure["연도"].isin(years)]
+            if structure.empty:
+                warnings.append(f"{product_str} 데이터에서 {', '.join(map(str, years))}년 실적을 찾을 수 없습니다.")
+                continue
+            results.append({"title": f"{product_str} 시장 집중도 (HHI · 상위사 점유율 합)", "table": structure[columns].reset_index(drop=True)})
+            continue
+
+        # 기간이 한 해뿐이면 직전 연도와 비교
+        available = data["pivots"]["rank"].columns
+        end = int(max(years)) if years else int(available.max())
+        start = int(min(years)) if years else int(available.min())
+        if start == end:
+            start = end - 1
+        momentum = company_momentum(data["pivots"], start, end)
+        if companies:
+            momentum = momentum[momentum["주관사"].str.replace(" ", "").isin(companies)]
+
+        sort_col = "금액 CAGR(%)" if analysis == "cagr" else "순위 변동성"
+        momentum = momentum.dropna(subset=[sort_col]).sort_values(sort_col, ascending=False)
+        if not companies:
+            momentum = momentum.head(int(top_n) if top_n else 10)
+        if momentum.empty:
+            warnings.append(f"{product_str} {start}~{end}년 {sort_col}을 계산할 수 있는 실적이 없습니다.")
+            continue
+        label = "금액 성장률(CAGR)" if analysis == "cagr" else "순위 변동성"
+        results.append({"title": f"{start}~{end}년 {product_str} {label} 상위", "table": momentum.reset_index(drop=True)})
+
+    return results, warnings
+
+
+# ✅ 회사별 순위 기록 (처음/마지막 1위, 연속 1위·3위 이내, 최대 상승/하락) — 미리 만든 이정표 색인 조회
+# 색인은 전체 기간 기준이라 연도 조건은 쓰지 않음, 상품이 없으면 ECM/DCM 둘 다
+def milestone_results(intent, dfs):
+    from milestones import get_milestones, milestone_table
+
+    companies = intent["companies"]
+    results, warnings = [], []
+    for product in intent["products"] or ["ecm", "dcm"]:
+        product_str = _display_name(product)
+        milestones = get_milestones(dfs, product, intent["role"])
+        if milestones is None:
+            warnings.append(f"{product_str} 데이터가 없습니다.")
+            continue
+        table = milestone_table(milestones, product_str, companies, intent["top_n"])
+        missing = [c for c in companies if c not in set(table["주관사"].str.replace(" ", ""))]
+        if missing:
+            warnings.append(f"{product_str} 데이터에서 {', '.join(missing)} 순위 기록을 찾을 수 없습니다.")
+        if table.empty:
+            continue
+        title = f"{', '.join(companies)}의 {product_str} 순위 기록" if companies else f"{product_str} 최장 연속 1위 상위"
+        results.append({"title": title, "table": table, "kind": "milestone", "label": product_str})
+    return results, warnings
+
+
+# ✅ 복합 질문: 파서가 {"intents": [요청, ...]}로 나눠 준 요청을 동시에 실행하고 질문 순서대로 합침
+# GPT 해석은 질문당 1회, 요청별 조회/집계는 스레드 풀에서 병렬 (span 수집을 위해 요청 context 복사)
+SUBQUERY_WORKERS = int(os.getenv("LEAGUE_SUBQUERY_WORKERS", "4"))
+_subquery_pool = None
+
+
+def split_intents(parsed):
+    intents = parsed.get("intents") if isinstance(parsed, dict) else None
+    if isinstance(intents, list):
+        return [sub for sub in intents if isinstance(sub, dict)]
+    return [parsed]
+
+
+def is_compound(parsed):
+    return len(split_intents(parsed)) > 1
+
+
+def _get_subquery_pool():
+    global _subquery_pool
+    if _subquery_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _subquery_pool = ThreadPoolExecutor(max_workers=SUBQUERY_WORKERS, thread_name_prefix="league-subquery")
+    return _subquery_pool
+
+
+# runner: 요청 1건 실행 함수 (기본 run_query, 대화 상태는 조각 캐시를 쓰는 자체 실행 함수를 넘김)
+# 결과 항목마다 "part"(요청 순번)를 붙이고, parts에 요청별 parsed/경고를 남김
+def run_compound(parsed, dfs, runner=None):
+    import contextvars
+
+    runner = runner or run_query
+    subs = split_intents(parsed)
+    with span("compound", parts=len(subs)):
+        pool = _get_subquery_pool()
+        futures = [pool.submit(contextvars.copy_context().run, runner, sub, dfs) for sub in subs]
+        sub_results = []
+        for part, future in enumerate(futures):
+            try:
+                sub_results.append(future.result())
+            except DeadlineExceeded:
+                # 마감이 지나면 끝난 요청 결과만 보여주고 나머지는 안내 문구로 대체
+                sub_results.append({"intent": subs[part], "results": [], "warnings": [f"⏱️ 시간 초과로 {part + 1}번째 요청은 처리하지 못했습니다."]})
+            except RequestCancelled:
+                for pending in futures:
+                    pending.cancel()
+                raise
+
+    merged = {"intent": [r["intent"] for r in sub_results], "results": [], "warnings": [], "parts": []}
+    for part, (sub, result) in enumerate(zip(subs, sub_results)):
+        merged["results"] += [{**item, "part": part} for item in result["results"]]
+        merged["warnings"] += result["warnings"]
+        merged["parts"].append({"parsed": sub, "warnings": result["warnings"]})
+    return merged
+
+
+# ✅ 정규화된 intent를 실행해 결과 표 목록을 반환
+# 반환값: {"intent": ..., "results": [{"title": str, "table": DataFrame}], "warnings": [str]}
+# ✅ 질문 1건 집계 (상품별) — 요청당 한 곳에서만 호출 (run_query, 또는 조각 캐시를 쓰는 ConversationState.run)
+def count_query(intent):
+    for product in intent["products"] or ["(전체)"]:
+        QUERY_COUNT.inc(product=product)
+
+
+# count=False: 호출 측에서 이미 집계한 요청 (결과 조각 캐시를 채우는 경우)
+def run_query(parsed, dfs, count=True):
+    if "intents" in parsed:
+        return run_compound(parsed, dfs)
+    if "message" in parsed and len(parsed) == 1:
+        return {"intent": parsed, "results": [], "warnings": [parsed["message"]]}
+
+    check_cancelled("filter")
+    intent = normalize_intent(parsed)
+    if count:
+        count_query(intent)
+    if not any([intent["products"], intent["companies"], intent["years"]]):
+        return {"intent": intent, "results": [], "warnings": ["어떤 항목이나 증권사에 대한 요청인지 명확하지 않아요."]}
+
+    with span("filter", products=intent["products"], companies=intent["companies"]) as filter_span:
+        results, warnings = execute_intent(intent, dfs)
+        filter_span.set(results=len(results))
+
+    return {"intent": intent, "results": results, "warnings": warnings}
+
+
+# ✅ 여러 상품 요청을 한 번의 필터(filter_products)로 계산하고 상품 키별 run_query 형식 결과로 나눔 (집계 없음)
+# 대화 상태가 상품별 조각으로 캐시할 때 상품마다 run_query를 따로 돌리지 않도록 사용
+def run_query_by_product(parsed, dfs):
+    intent = normalize_intent(parsed)
+    return {
+        product: {"intent": {**intent, "products": [product]}, "results": results, "warnings": warnings}
+        for product, (results, warnings) in _product_results(intent, dfs, by_product=True).items()
+    }
+
+
+# 집계(QUERY_COUNT) 없이 결과 표만 계산
+def execute_intent(intent, dfs):
+    check_cancelled("filter")
+    if intent["analysis"] == "milestone":
+        return milestone_results(intent, dfs)
+    if intent["analysis"]:
+        return analytics_results(intent, dfs)
+    if intent["companies"] and not intent["products"]:
+        return _company_overview(intent, dfs)
+    return _product_results(intent, dfs)
+
+
+# ✅ 질문 1건 처리 (parse → filter → result)
+def answer(query, dfs, parser=parse_query):
+    parsed = parser(query)
+    result = run_query(parsed, dfs)
+    result["query"] = query
+    result["parsed"] = parsed
+    return result
+
+
+# ✅ JSON 응답용 변환 (DataFrame → records)
+# page 지정 시 표마다 해당 페이지(표의 행 순서 그대로)만 직렬화하고 total_rows/pages를 함께 반환
+def result_to_dict(result, page=None, page_size=None):
+    payload = {k: v for k, v in result.items() if k != "results"}
+    payload["results"] = []
+    for item in result.get("results", []):
+        table = item["table"]
+        entry = {"title": item["title"]}
+        if "part" in item:
+            entry["part"] = item["part"]
+        if page is not None:
+            table, total, pages = page_window(table, page, page_size or TABLE_PAGE_SIZE)
+            entry.update(total_rows=total, page=min(max(1, int(page)), pages), pages=pages)
+        entry["rows"] = json.loads(table.to_json(orient="records", force_ascii=False))
+        payload["results"].append(entry)
+    return payload
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from metrics import CACHE_REQUESTS
+from tracing import span
+
+# ✅ 질의 로그: 요청별 원문 질문 / 해석 결과(parsed) / 캐시 적중 / 단계별 소요 시간을 JSONL로 누적
+#   - 기본 경로: logs/query_log.jsonl (LEAGUE_QUERY_LOG_PATH로 변경)
+#   - 파일이 LEAGUE_QUERY_LOG_MAX_BYTES를 넘으면 .1 → .2 … 로 밀어내며 회전 (LEAGUE_QUERY_LOG_BACKUPS개 보관)
+#   - 기본은 꺼짐: LEAGUE_QUERY_LOG=1 일 때만 기록 (켜면 단계별 소요 시간 기록을 위해 요청마다 span도 수집)
+# ✅ 캐시 워밍: 시작 시 로그에서 가장 많이 나온 intent 상위 K개(LEAGUE_WARM_TOP_K)의 결과 조각을
+#   대화 상태가 조회하는 조각 캐시(conversation.run_slices, query_results)에 미리 채워 배포 직후 첫 사용자가 콜드 경로를 타지 않게 한다.
+#   (연간 테이블/피벗/지표/프로필은 load_store에서 이미 만들어지므로 워밍 대상 아님, 복합 질문 기록은 건너뜀)
+
+logger = logging.getLogger("league.query_log")
+
+QUERY_LOG_ENABLED = os.getenv("LEAGUE_QUERY_LOG", "0") == "1"
+QUERY_LOG_PATH = os.getenv(
+    "LEAGUE_QUERY_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "query_log.jsonl")
+)
+QUERY_LOG_MAX_BYTES = int(os.getenv("LEAGUE_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+QUERY_LOG_BACKUPS = int(os.getenv("LEAGUE_QUERY_LOG_BACKUPS", "3"))
+WARM_TOP_K = int(os.getenv("LEAGUE_WARM_TOP_K", "20"))
+
+
+class QueryLog:
+    def __init__(self, path=QUERY_LOG_PATH, max_bytes=QUERY_LOG_MAX_BYTES, backups=QUERY_LOG_BACKUPS, enabled=QUERY_LOG_ENABLED):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def files(self):
+        # 오래된 파일부터 (query_log.jsonl.3 … .1, query_log.jsonl)
+        rotated = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        return [p for p in rotated + [self.path] if os.path.exists(p)]
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    # 로그 기록 실패가 질문 응답을 막지 않도록 예외는 경고로만 남김
+    def append(self, record):
+        if not self.enabled:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line.encode("utf-8")) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning("질의 로그 기록 실패: %s", e)
+
+    def read(self):
+        for path in self.files():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 기록 도중 잘린 줄은 건너뜀
+
+
+QUERY_LOG = QueryLog()
+
+
+def _cache_delta(before):
+    delta = {}
+    for key, value in CACHE_REQUESTS.snapshot().items():
+        diff = value - before.get(key, 0)
+        if diff:
+            delta[":".join(key)] = diff
+    return delta
+
+
+def _stage_timings(spans):
+    stages = {}
+    for record in spans or []:
+        stages[record["span"]] = round(stages.get(record["span"], 0) + record["duration_ms"], 3)
+    return stages
+
+
+# ✅ 요청 1건을 감싸 기록 (호출 측은 yield된 record에 parsed 등 결과를 채움)
+# spans: trace_request()가 모은 span 목록 / 캐시 적중은 전역 카운터 차이라 동시 요청이 있으면 근사치
+@contextmanager
+def logged_request(query, source, spans=None, log=QUERY_LOG):
+    record = {"ts": datetime.datetime.now().isoformat(timespec="seconds"), "source": source, "query": query}
+    if not log.enabled:
+        yield record
+        return
+    before = CACHE_REQUESTS.snapshot()
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record["cache"] = _cache_delta(before)
+        record["stages"] = _stage_timings(spans)
+        log.append(record)
+
+
+def _is_query_intent(parsed):
+    return isinstance(parsed, dict) and bool(parsed) and "intents" not in parsed and not ("message" in parsed and len(parsed) == 1)
+
+
+# 로그에서 intent별 빈도를 세어 상위 K개의 대표 parsed를 반환
+def top_intents(records, top_k=WARM_TOP_K):
+    from query_engine import normalize_intent
+
+    counts, samples = Counter(), {}
+    for record in records:
+        parsed = record.get("parsed")
+        if not _is_query_intent(parsed):
+            continue
+        key = json.dumps(normalize_intent(parsed), ensure_ascii=False, sort_keys=True, default=str)
+        counts[key] += 1
+        samples.setdefault(key, parsed)
+    return [samples[key] for key, _ in counts.most_common(top_k)]
+
+
+def warm_from_log(dfs, top_k=WARM_TOP_K, log=QUERY_LOG):
+    from conversation import run_slices
+
+    if top_k <= 0 or not log.files():
+        return 0
+    intents = top_intents(log.read(), top_k)
+    warmed = 0
+    with span("cache_warm", candidates=len(intents)) as warm_span:
+        for parsed in intents:
+            try:
+                run_slices(parsed, dfs)
+                warmed += 1
+            except Exception as e:
+                logger.warning("캐시 워밍 실패 (%s): %s", parsed, e)
+        warm_span.set(warmed=warmed)
+    return warmed
@@ -25,9 +25,13 @@ from utils import (
     plot_bar_chart_plotly,
     plot_line_chart_plotly,
     normalize_column_name,
-    plot_multi_metric_line_chart_for_single_company,
-    plot_multi_metric_line_chart_for_two_companies
+    plot_company_matrix_chart,
+    render_dataframe
 )
+from tracing import span, trace_request
+from metrics import start_metrics_server
+
+start_metrics_server()  # METRICS_PORT 지정 시 /metrics 노출 (프로세스당 1회)
 
 # utils.py에 있는 다중 첨부 지원 함수 가져오기
 from utils import send_feedback_email
@@ -46,125 +50,51 @@ def set_korean_font():
 
 set_korean_font()
 
-# 📁 DCM/ECM 폴더 각각에서 Excel 파일 로딩
+# 📁 DCM/ECM 폴더 각각에서 Excel 파일 로딩 (query_engine과 공유)
+from query_engine import load_store, parse_query, compare_rank, compare_share, is_compound, filter_products, resolve_annual_table, count_query, normalize_intent
+from chatbot import stream_analysis
+from narrative import narrate_result
+from profiler import profile_request
+from llm_gate import parse_or_degrade
+from company_profiles import get_company_profile, best_rank
+from pivot_store import get_pivot, METRICS as PIVOT_METRICS
+from conversation import ConversationState, describe_changes
+from query_log import QUERY_LOG, logged_request, warm_from_log
+from ingest import refresh_store
+from cache_manager import cache_stats
+from deadline import REQUEST_TIMEOUT, RequestCancelled, DeadlineExceeded, check_cancelled, request_scope, watch
+
 base_dir = os.path.dirname(__file__)
-dcm_dir = os.path.join(base_dir, "DCM")
-ecm_dir = os.path.join(base_dir, "ECM")
 
-dfs_dcm, structured_dcm = load_dataframes(dcm_dir)
-dfs_ecm, structured_ecm = load_dataframes(ecm_dir)
+# ✅ 데이터 로딩 + 캐시 워밍은 프로세스당 1회 (rerun/세션마다 엑셀을 다시 읽지 않음)
+# 질의 로그의 자주 묻는 intent 상위 K개를 미리 실행해 배포 직후 첫 질문도 워밍된 캐시를 사용
+@st.cache_resource(show_spinner="데이터를 불러오는 중입니다...")
+def load_app_store(base_dir):
+    dfs, structured_dfs = load_store(base_dir)
+    warm_from_log(dfs)
+    return dfs, structured_dfs
 
-# 딕셔너리 병합
-dfs = {**dfs_dcm, **dfs_ecm}
-structured_dfs = {**structured_dcm, **structured_ecm}
+dfs, structured_dfs = load_app_store(base_dir)
 
-# ✅ GPT 파서
-from openai import OpenAI  # openai>=1.0.0 기준
+# ✅ 새 분기 엑셀이 저장되면 바뀐 기간 행만 메모리 테이블/캐시에 반영 (LEAGUE_INGEST_POLL_SECONDS마다 수정 시각 확인)
+refresh_store(dfs, base_dir)
 
+# ✅ GPT 파서 (프롬프트/호출은 query_engine.parse_query 공유, 실패 시 UI 안내)
+# 요청이 몰려 GPT 대기열이 가득 차면 기다리지 않고 로컬 간이 해석으로 바로 응답
 def parse_natural_query_with_gpt(query):
     try:
-        system_prompt = (
-            '사용자의 질문을 다음 항목으로 분석해서 반드시 올바른 JSON 형식으로 응답해줘. '
-            'true/false/null은 반드시 소문자 그대로 사용하고, 문자열은 큰따옴표("")로 감싸줘. '
-            '\n\n'
-            '- years: [2023, 2024] 형태\n'
-            '- product: ECM, DCM, SB, ABS, FB, IPO, RO 중 하나 또는 여러 개 (문맥 또는 명시된 키워드 기반 추출)\n'
-            '- columns: ["금액", "건수", "점유율"] 중 하나 이상\n'
-            '- company: 증권사명 (한 개 또는 여러 개 리스트 가능)\n'
-            '- top_n: 숫자 (선택적)\n'
-            '- rank_range: [시작위, 끝위] (선택적)\n'
-            '- is_chart: true/false\n'
-            '- is_compare: true/false\n'
-            '\n'
-            '🟡 아래 조건을 반드시 따를 것:\n'
-            '1. 질문에 "1~10위", "상위 3개", "상위 몇 개" 등 **정확한 숫자 범위나 개수 표현**이 있을 경우에만 "rank_range" 또는 "top_n"을 포함할 것\n'
-            '2. 질문에 "금액", "점유율", "건수"가 들어 있으면 "columns" 필드에 반드시 포함할 것\n'
-            '3. "그래프", "추이", "변화" 등의 표현이 있으면 "is_chart": true 로 설정할 것\n'
-            '4. "비교", "누가 올랐어?", "누가 떨어졌어?" 등의 표현이 있으면 "is_compare": true 로 설정할 것\n'
-            '5. 연도가 명시되어 있을 경우 "years" 배열로 정확히 추출할 것\n'
-            '6. 질문에 다음 키워드가 포함되면 반드시 해당 "product"로 처리할 것:\n'
-            '   - "ABS", "자산유동화증권" → "ABS"\n'
-            '   - "FB", "여전채", "여신전문금융회사채권" → "FB"\n'
-            '   - "SB", "일반회사채", "회사채" → "SB"\n'
-            '   - "IPO", "기업공개" → "IPO"\n'
-            '   - "유상증자", "유증", "RO", "Rights Offering" → "RO"\n'
-            '   - "ECM" → "ECM"\n'
-            '   - "DCM", "국내채권" → "DCM"\n'
-            '\n'
-            '- 단, 질문에 명확히 SB/ABS/FB/IPO/RO가 포함되어 있으면 그 하위 상품명을 그대로 product에 사용해야 함\n'
-            '  (예: "2024년 FB 순위 알려줘" → product는 "FB")\n'
-            '\n'
-            '🔴 아래 키워드가 포함된 질문은 무조건 다음과 같이 응답할 것:\n'
-            '"⚠️질문 주신 내용은 추후 업데이트 될 예정입니다."\n'
-            '\n'
-            '- 키워드 목록:\n'
-            '  전환사채, CB, BW, 신주인수권부사채, ELB, M&A, VC, 벤처캐피탈, '
-            '인수 순위, 인수 실적, 수수료, 수수료 실적, 수수료 순위, 자문 실적, 자문 순위, 부동산, 헤지펀드, 수익률\n'
-        )
-
-
-        client = OpenAI()
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.2,
-            max_tokens=800
-        )
-
-        content = response.choices[0].message.content.strip()
-        parsed = json.loads(content)
+        parsed, degraded = parse_or_degrade(query, parse_query)
+        if degraded:
+            st.warning("⏳ 지금 질문이 많아 간이 해석으로 답변합니다. 결과가 정확하지 않으면 잠시 후 다시 질문해 주세요.")
         return parsed
 
+    except RequestCancelled:
+        raise
     except Exception as e:
         st.error("❌ GPT 질문 해석에 실패했습니다.")
         st.info("질문 예시: '2024년 ECM 대표주관 순위 알려줘', 'NH와 KB 2023년 순위 비교'")
         st.caption(f"[디버그 정보] GPT 파싱 오류: {e}")
         return None  # ✅ 반드시 함수는 None을 반환해야 흐름에서 처리 가능
-    
-# ✅ 비교 함수
-def compare_rank(df, year1, year2, metric_col="순위"):
-    df1 = df[df["연도"] == year1][["주관사", metric_col]].copy()
-    df2 = df[df["연도"] == year2][["주관사", metric_col]].copy()
-
-    df1.rename(columns={metric_col: f"{year1}년 {metric_col}"}, inplace=True)
-    df2.rename(columns={metric_col: f"{year2}년 {metric_col}"}, inplace=True)
-
-    merged = pd.merge(df1, df2, on="주관사")
-    merged["변화"] = merged[f"{year2}년 {metric_col}"] - merged[f"{year1}년 {metric_col}"]
-
-    ascending_order = True if metric_col == "순위" else False
-
-    상승 = merged[merged["변화"] < 0].sort_values("변화", ascending=ascending_order)
-    하락 = merged[merged["변화"] > 0].sort_values("변화", ascending=not ascending_order)
-
-    target_columns = ["주관사", f"{year1}년 {metric_col}", f"{year2}년 {metric_col}", "변화"]
-    상승 = 상승[target_columns]
-    하락 = 하락[target_columns]
-
-    return 상승, 하락
-
-
-def compare_share(df, year1, year2):
-    df1 = df[df["연도"] == year1][["주관사", "점유율(%)"]].copy()
-    df2 = df[df["연도"] == year2][["주관사", "점유율(%)"]].copy()
-
-    # ✅ 열 이름을 비교 출력에 맞게 변경 (예: "2022년 점유율(%)")
-    df1.rename(columns={"점유율(%)": f"{year1}년 점유율(%)"}, inplace=True)
-    df2.rename(columns={"점유율(%)": f"{year2}년 점유율(%)"}, inplace=True)
-
-    # ✅ 병합 후 변화 계산
-    merged = pd.merge(df1, df2, on="주관사")
-    merged["변화"] = merged[f"{year2}년 점유율(%)"] - merged[f"{year1}년 점유율(%)"]
-
-    # ✅ 상승/하락 정렬
-    상승 = merged[merged["변화"] > 0].sort_values("변화", ascending=False)
-    하락 = merged[merged["변화"] < 0].sort_values("변화")
-
-    return 상승, 하락
 
 # ✅ UI
 st.title("🔔 더벨 리그테이블 챗봇")
@@ -203,36 +133,55 @@ st.markdown("""
 ⚠️ M&A, VC, 헤지펀드 등은 향후 업데이트 될 예정입니다.
 """)
 
+# 디버그 패널은 사이드바 토글 또는 LEAGUE_DEBUG_PANEL=1 로 켬 (꺼져 있으면 span 수집 없음)
+debug_panel = st.sidebar.toggle("🛠️ 디버그 패널", value=os.getenv("LEAGUE_DEBUG_PANEL", "0") == "1")
+# GPT 분석은 추가 GPT 호출이므로 opt-in (LEAGUE_GPT_ANALYSIS=1 로 기본값 변경 가능)
+analysis_enabled = st.sidebar.toggle("📍 GPT 분석 (스트리밍)", value=os.getenv("LEAGUE_GPT_ANALYSIS", "0") == "1")
+
 with st.form(key="question_form"):
     query = st.text_input("질문을 입력하세요:")
     submit = st.form_submit_button("🔍 질문하기")
 
-if submit and query:
+# ✅ 세션별 대화 상태 (직전 질문 해석 결과 + 상품별 결과 조각)
+def get_conversation():
+    if "conversation" not in st.session_state:
+        st.session_state["conversation"] = ConversationState()
+    return st.session_state["conversation"]
+
+# ✅ 질문 1건 처리 (중단 시 st.stop() 대신 return → 아래 집계기준/피드백 UI는 항상 표시)
+# 화면에 출력한 표를 run_query 결과 형식으로 반환 (요약은 이 결과로 작성, 요약할 표가 없으면 None)
+def handle_question(query):
     handled = False
     parsed = None  # ✅ parsed를 먼저 선언 (바깥에서도 접근 가능하도록)
+    st.session_state["last_parsed"] = None
+    conversation = get_conversation()
 
     with st.spinner("GPT가 질문을 해석 중입니다..."):
         from utils import product_aliases, company_aliases
 
         try:
-            parsed = parse_natural_query_with_gpt(query)
-            st.info(f"🔍 parsed: {parsed}")  # 개발 중 디버깅용
+            # "그럼 2023년은?", "KB증권도 추가해줘" 같은 후속 질문은 직전 질문에 변경분만 적용 (GPT 호출 없음)
+            with span("followup_resolve") as followup_span:
+                parsed, changed = conversation.resolve(query, parse_natural_query_with_gpt)  # parsed 결과는 디버그 패널(gpt_parse span)에서 확인
+                followup_span.set(followup=changed is not None)
+            if changed:
+                st.caption(f"↪️ 이전 질문에 이어서 해석했어요 ({describe_changes(changed, parsed)})")
 
             # ✅ dict 여부 먼저 확인
             if isinstance(parsed, dict):
                 if "message" in parsed and len(parsed) == 1:
                     st.warning(f"⚠️ {parsed['message']}")
-                    handled = True
-                    st.stop()
+                    return
             else:
                 raise ValueError("GPT 결과가 유효한 JSON 형식이 아님")
 
+        except RequestCancelled:
+            raise
         except Exception as e:
             if not handled:
                 st.error("❌ 질문을 이해하지 못했어요. 다시 시도해 주세요.")
                 st.caption(f"[디버그 GPT 파싱 오류: {e}]")
-            handled = True
-            st.stop()
+            return
 
     # ✅ spinner 바깥에서 메시지 응답 안전하게 처리
     if isinstance(parsed, dict) and "message" in parsed and len(parsed) == 1:
@@ -241,74 +190,63 @@ if submit and query:
 
     # ✅ handled 예외 여부 체크로 중단
     if handled:
-        st.stop()
+        return
+    check_cancelled("filter")
+    st.session_state["last_parsed"] = parsed  # GPT 분석 스트리밍 등 후속 단계에서 재사용
+    conversation.remember(parsed)
+
+    # ✅ 복합 질문은 요청별로 나눠 동시에 실행 (GPT 해석은 질문당 1회)
+    if is_compound(parsed):
+        result = conversation.run(parsed, dfs)
+        render_compound(result)
+        return result
 
     # ✅ 정상 파싱 이후 전처리
-    product_display_names = {v: k.upper() for k, v in product_aliases.items()}
-    products = parsed.get("product") or []
-    products = [products] if isinstance(products, str) else products
-    products = [product_aliases.get(p.lower(), p.lower()) for p in products]
-    product_strs = [product_display_names.get(p, p.upper()) for p in products]
+    with span("alias_resolution") as alias_span:
+        product_display_names = {v: k.upper() for k, v in product_aliases.items()}
+        products = parsed.get("product") or []
+        products = [products] if isinstance(products, str) else products
+        products = [product_aliases.get(p.lower(), p.lower()) for p in products]
+        product_strs = [product_display_names.get(p, p.upper()) for p in products]
 
-    companies = parsed.get("company") or []
-    companies = [companies] if isinstance(companies, str) else companies
-    companies = [company_aliases.get(c, c) for c in companies]
+        companies = parsed.get("company") or []
+        companies = [companies] if isinstance(companies, str) else companies
+        companies = [company_aliases.get(c, c) for c in companies]
 
-    years = parsed.get("years") or []
+        years = parsed.get("years") or []
+        alias_span.set(products=products, companies=companies, years=years)
+
+    # ✅ 시장 구조 분석(집중도/변동성/CAGR)과 상품 합산·제외 조합, 두 연도 비교는 query_engine으로 처리
+    # (로딩 시 계산해 둔 지표 조회 / 구성 상품 테이블 재합산·재순위 / 후속 질문으로 합쳐진 parsed 기준 비교 지표)
+    is_compare_query = parsed.get("is_compare") and len(years) == 2 and products and not parsed.get("is_chart")
+    if parsed.get("analysis") or parsed.get("exclude") or parsed.get("combine") or is_compare_query or ("sb" in products and not parsed.get("is_chart")):
+        result = conversation.run(parsed, dfs)  # 직전 질문과 같은 상품 조각은 저장된 결과 재사용
+        for warning in result["warnings"]:
+            st.warning(f"⚠️ {warning}")
+        for index, item in enumerate(result["results"]):
+            st.subheader(f"📊 {item['title']}")
+            render_dataframe(item["table"], key=f"{item['title']}_{index}")
+        return result
+
+    # 아래 기존 분기는 conversation.run을 거치지 않으므로 여기서 1회 집계 (query_engine과 같은 기준)
+    count_query(normalize_intent(parsed))
+    shown = {"intent": parsed, "results": [], "warnings": []}
 
     # ✅ 기존 분기 로직 그대로 유지
     if parsed.get("company") and not parsed.get("product"):
+        # 최고 순위 1건을 먼저 요약 (상품 지정 없이, 로딩 시 만들어 둔 회사 프로필 조회 — 전체 테이블 순회 없음)
+        if not any(parsed.get(k) for k in ["is_chart", "is_compare", "top_n", "rank_range"]):
+            render_best_ranks(companies, years)
         from improved_company_year_chart_logic import handle_company_year_chart_logic
         handle_company_year_chart_logic(parsed, dfs)
-        st.stop()
+        return
 
     elif not any([parsed.get("product"), parsed.get("company"), parsed.get("years")]):
         st.warning("⚠️ 어떤 항목이나 증권사에 대한 요청인지 명확하지 않아요.")
-        st.stop()
+        return
 
     already_warned = set()  # 중복 경고 방지용
 
-
-    # ✅ 최고 순위 1건만 출력 (상품 지정 없이)
-    if (
-        parsed.get("company") and
-        not parsed.get("product") and
-        not parsed.get("is_chart") and
-        not parsed.get("is_compare") and
-        not parsed.get("top_n") and
-        not parsed.get("rank_range")
-    ):
-        target_company = companies[0] if isinstance(companies, list) else companies
-        target_year = parsed.get("years")[0]
-
-        top_result = None
-        top_product = None
-
-        for product, df in dfs.items():
-            if df is None or df.empty:
-                continue
-
-            df.columns = df.columns.str.strip()
-            df_year = df[df["연도"] == target_year]
-            df_year = df_year[df_year["주관사"] == target_company]
-
-            if not df_year.empty:
-                row = df_year.sort_values("순위").head(1)
-                if top_result is None or row.iloc[0]["순위"] < top_result.iloc[0]["순위"]:
-                    top_result = row.copy()
-                    top_product = product
-
-        if top_result is not None:
-            best_row = top_result.iloc[0]
-            best_rank = int(best_row["순위"])
-            st.success(f"🏆 {target_year}년 **{target_company}**의 최고 순위는 **{top_product.upper()}**에서 **{best_rank}위**입니다.")
-            st.dataframe(top_result[["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]])
-            handled = True
-
-        else:
-            st.warning(f"⚠️ {target_year}년 {target_company}의 순위 데이터가 없습니다.")
-            handled = True  # 이 위치에 handled = True 유지
-    
     if not handled and (
         parsed.get("product") or
         parsed.get("top_n") or
@@ -341,41 +279,45 @@ if submit and query:
             if "순위" not in columns:
                 columns.append("순위")
 
+        # ✅ 요청 상품을 쌓아 둔 연도 합산 테이블에 (상품, 연도[, 주관사, 순위]) 조건을 한 번만 적용하고 상품별로 나눠 출력
+        # (상품마다 테이블 재조회 · 컬럼 정리 · 연도 필터를 반복하지 않음)
+        # API(query_engine.run_query)와 같은 연간 순위를 쓰도록 분기 원본(dfs[상품])이 아닌 resolve_annual_table 기준
+        is_compare_request = parsed.get("is_compare") and len(years) == 2
+        is_table_request = bool(years) and not parsed.get("is_chart") and not parsed.get("is_compare")
+        top_n = parsed.get("top_n", None)
+        rank_range = parsed.get("rank_range", None)
+
+        product_keys = [p.lower() for p in products]
+        with span("filter", products=product_keys):
+            if is_table_request and companies:
+                split, missing_products = filter_products(dfs, product_keys, years=years, companies=companies, rank_range=rank_range)
+            elif is_table_request:
+                split, missing_products = filter_products(dfs, product_keys, years=years, rank_range=rank_range, top_n=None if rank_range else top_n)
+            else:
+                split, missing_products = filter_products(dfs, product_keys, years=years or None)
+
         for product in products:
-            product_lower = product.lower()        # ✅ 추가
-            df = dfs.get(product_lower)    
-            if df is None or df.empty:
+            check_cancelled("render")
+            product_lower = product.lower()
+            if product_lower in missing_products:
                 st.warning(f"⚠️ {product} 데이터가 없습니다.")
                 continue
-
-            df.columns = df.columns.str.strip()
+            df = split[product_lower]
 
             # ✅ 비교 요청 처리 (순위 / 건수 / 점유율 변화)
-            if parsed.get("is_compare") and len(years) == 2:
+            if is_compare_request:
                 y1, y2 = years
 
-                # ✅ 비교 기준 컬럼 자동 판단
+                # ✅ 비교 기준 컬럼 자동 판단 (질문 원문이 아닌 parsed의 columns 기준, 없으면 순위 — query_engine과 동일)
                 col_candidates = [normalize_column_name(c) for c in columns]
-                metric_col = None
-                for candidate in ["점유율(%)", "건수", "순위"]:
-                    if candidate in col_candidates:
-                        metric_col = candidate
-                        break
-
-                st.write("✅ metric_col:", metric_col)
-                st.write("✅ columns:", columns)
-                st.write("✅ selected function:", "compare_rank" if metric_col == "순위" else "compare_share")
-
-                if not metric_col:
-                    st.warning("⚠️ 비교할 수 있는 항목이 없습니다. (순위/건수/점유율 중 하나 필요)")
-                    handled = True   # ✅ 이 줄을 꼭 추가해야 중복 경고 방지됨
-                    continue         # 또는 return
-
-                # ✅ 항목별 비교 함수 호출
-                if metric_col == "점유율(%)":
-                    상승, 하락 = compare_share(df, y1, y2)
-                else:
-                    상승, 하락 = compare_rank(df, y1, y2, metric_col)
+                metric_col = next((c for c in ["점유율(%)", "건수", "순위"] if c in col_candidates), "순위")
+
+                # ✅ 항목별 비교 함수 호출 (metric_col/columns는 디버그 패널에서 확인)
+                with span("compare", product=product, metric_col=metric_col, columns=columns):
+                    if metric_col == "점유율(%)":
+                        상승, 하락 = compare_share(df, y1, y2)
+                    else:
+                        상승, 하락 = compare_rank(df, y1, y2, metric_col)
 
                 # ✅ 기업 필터링
                 if companies:
@@ -403,7 +345,8 @@ if submit and query:
                     target_str = f" (대상: {', '.join(companies)})" if companies else ""
                     metric_label = "점유율" if metric_col == "점유율(%)" else "순위"
                     st.subheader(f"📈 {y1} → {y2} {product_str} 주관 {metric_label} 상승{target_str}")
-                    st.dataframe(상승.reset_index(drop=True))
+                    render_dataframe(상승.reset_index(drop=True), key=f"{product_str}_{y1}_{y2}_상승")
+                    shown["results"].append({"title": f"{y1} → {y2} {product_str} 주관 {metric_label} 상승{target_str}", "table": 상승.reset_index(drop=True), "kind": "compare"})
                     handled = True  # ✅ 여기 추가
 
                 if not 하락.empty:
@@ -411,211 +354,222 @@ if submit and query:
                     target_str = f" (대상: {', '.join(companies)})" if companies else ""
                     metric_label = "점유율" if metric_col == "점유율(%)" else "순위"
                     st.subheader(f"📉 {y1} → {y2} {product_str} 주관 {metric_label} 하락{target_str}")
-                    st.dataframe(하락.reset_index(drop=True))
+                    render_dataframe(하락.reset_index(drop=True), key=f"{product_str}_{y1}_{y2}_하락")
+                    shown["results"].append({"title": f"{y1} → {y2} {product_str} 주관 {metric_label} 하락{target_str}", "table": 하락.reset_index(drop=True), "kind": "compare"})
                     handled = True  # ✅ 여기 추가
+                continue
 
-            # ✅ Top N, Rank Range, 전체 순위 질문 처리 (회사명이 지정되지 않은 경우)
-            if not handled and products and years and not companies and not parsed.get("is_chart") and not parsed.get("is_compare"):
-                top_n = parsed.get("top_n", None)
-                rank_range = parsed.get("rank_range", None)
-
-                for product in products:
-                    product_lower = product.lower()
-                    df = dfs.get(product_lower)
-                    if df is None or df.empty:
-                        st.warning(f"⚠️ {product.upper()} 데이터가 없습니다.")
-                        continue
-
-                    df.columns = df.columns.str.strip()
-                    filtered_df = df[df["연도"].isin(years)] if years else df.copy()
-
-                    if rank_range:
-                        start, end = rank_range
-                        filtered_df = filtered_df[filtered_df["순위"].between(start, end)]
-                    elif top_n:
-                        filtered_df = (
-                            filtered_df.groupby("연도")
-                            .apply(lambda x: x.nsmallest(top_n, "순위"))
-                            .reset_index(drop=True)
-                        )
-                    else:
-                        # ✅ 전체 순위 요청일 때 연도별 순위 기준 정렬
-                        filtered_df = filtered_df.sort_values(["연도", "순위"]).reset_index(drop=True)
-
-                    if filtered_df.empty:
-                        st.warning(f"⚠️ {product.upper()} 데이터에서 순위 정보를 찾을 수 없습니다.")
-                        continue
-
-                    st.subheader(f"📌 {product.upper()} 대표주관 순위")
-                    st.dataframe(filtered_df[["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]])
-                    handled = True
-
-            # ✅ 전체 순위 요청 처리 (회사명 없이 top_n, rank_range 없이 전체 순위)
-            elif not handled and products and years and not companies and not parsed.get("is_chart") and not parsed.get("is_compare"):
-                for product in products:
-                    product_lower = product.lower()
-                    df = dfs.get(product_lower)
-                    if df is None or df.empty:
-                        st.warning(f"⚠️ {product.upper()} 데이터가 없습니다.")
-                        continue
-
-                    df.columns = df.columns.str.strip()
-                    filtered_df = df[df["연도"].isin(years)].copy()
-
-                    if filtered_df.empty:
-                        st.warning(f"⚠️ {product.upper()} 데이터에서 순위 정보를 찾을 수 없습니다.")
-                        continue
-
-                    display_cols = ["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
-                    st.subheader(f"📌 {product.upper()} 대표주관 순위")
-                    st.dataframe(filtered_df[display_cols].sort_values(["연도", "순위"]).reset_index(drop=True))
-                    handled = True
-
-            # ✅ 회사+연도+상품만 있는 경우 기본 실적 테이블 출력
-            if products and companies and years and not parsed.get("is_chart") and not parsed.get("is_compare"):
-                for product in products:
-                    product_lower = product.lower()
-                    df = dfs.get(product_lower)
-                    if df is None or df.empty:
-                        continue
-
-                    df.columns = df.columns.str.strip()
-                    filtered_df = df[
-                        df["연도"].isin(years) & df["주관사"].isin(companies)
-                    ].copy()
-
-                    if filtered_df.empty:
-                        st.warning(f"⚠️ {product.upper()} 데이터에서 {', '.join(companies)} 실적을 찾을 수 없습니다.")
-                        continue
-
-                    display_cols = ["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
-                    st.subheader(f"📊 {', '.join(companies)}의 {product.upper()} 실적")
-                    st.dataframe(filtered_df[display_cols].sort_values(["연도", "순위"]))
-                    handled = True
-
-                    # ✅ 회사명 + 연도 + 상품 + rank_range만 있는 경우 전용 처리
-                    if (
-                        not handled and
-                        products and companies and years and rank_range and
-                        not parsed.get("is_chart") and not parsed.get("is_compare")
-                    ):
-                        for product in products:
-                            product_lower = product.lower()
-                            df = dfs.get(product_lower)
-                            if df is None or df.empty:
-                                continue
-
-                            df.columns = df.columns.str.strip()
-                            df_filtered = df[
-                                df["연도"].isin(years) & df["주관사"].isin(companies)
-                            ].copy()
-
-                            start, end = rank_range
-                            df_filtered = df_filtered[df_filtered["순위"].between(start, end)]
-
-                            if df_filtered.empty:
-                                st.warning(f"⚠️ {product.upper()} 데이터에서 {', '.join(companies)} 실적을 찾을 수 없습니다.")
-                                continue
-
-                            display_cols = ["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
-                            st.subheader(f"📌 {', '.join(companies)}의 {product.upper()} 실적 (순위 {start}~{end})")
-                            st.dataframe(df_filtered[display_cols].sort_values(["연도", "순위"]))
-                            handled = True
+            # ✅ 회사+연도+상품만 있는 경우 기본 실적 테이블 출력 (순위 범위가 있으면 함께 적용)
+            display_cols = ["연도", "순위", "주관사", "금액(원)", "건수", "점유율(%)"]
+            if is_table_request and companies:
+                if df.empty:
+                    st.warning(f"⚠️ {product.upper()} 데이터에서 {', '.join(companies)} 실적을 찾을 수 없습니다.")
+                    continue
+                range_str = f" (순위 {rank_range[0]}~{rank_range[1]})" if rank_range else ""
+                st.subheader(f"📊 {', '.join(companies)}의 {product.upper()} 실적{range_str}")
+                render_dataframe(df[display_cols].sort_values(["연도", "순위"]), key=f"{product}_company")
+                shown["results"].append({"title": f"{', '.join(companies)}의 {product.upper()} 실적{range_str}", "table": df[display_cols].sort_values(["연도", "순위"]),
+                                         "kind": "company", "label": product.upper(), "annual": resolve_annual_table(dfs, product_lower)})
+                handled = True
 
-                    
-                    # ✅ 회사 없이 product + years + columns만 있는 경우 (Top N 없이 순위 리스트 요청 등)
-                    if not handled and products and years and columns and not companies and not parsed.get("is_chart") and not parsed.get("is_compare"):
-                        for product in products:
-                            product_lower = product.lower()
-                            df = dfs.get(product_lower)
-                            if df is None or df.empty:
-                                st.warning(f"⚠️ {product.upper()} 데이터가 없습니다.")
-                                continue
-
-                            df.columns = df.columns.str.strip()
-                            filtered_df = df[df["연도"].isin(years)].copy()
-
-                            if filtered_df.empty:
-                                st.warning(f"⚠️ {product.upper()} 데이터에서 조건에 맞는 항목을 찾을 수 없습니다.")
-                                continue
-
-                            display_cols = ["연도", "순위", "주관사"] + [c for c in ["금액(원)", "건수", "점유율(%)"] if c in columns]
-                            st.subheader(f"📊 {product.upper()} 대표주관 순위")
-                            st.dataframe(filtered_df[display_cols].sort_values(["연도", "순위"]).reset_index(drop=True))
-                            handled = True
+            # ✅ Top N, Rank Range, 전체 순위 질문 처리 (회사명이 지정되지 않은 경우)
+            elif is_table_request:
+                filtered_df = df if (rank_range or top_n) else df.sort_values(["연도", "순위"])
+                if filtered_df.empty:
+                    st.warning(f"⚠️ {product.upper()} 데이터에서 순위 정보를 찾을 수 없습니다.")
+                    continue
+
+                st.subheader(f"📌 {product.upper()} 대표주관 순위")
+                render_dataframe(filtered_df[display_cols].reset_index(drop=True), key=f"{product}_ranking")
+                shown["results"].append({"title": f"{product.upper()} 대표주관 순위", "table": filtered_df[display_cols].reset_index(drop=True),
+                                         "kind": "ranking", "label": product.upper(), "annual": resolve_annual_table(dfs, product_lower)})
+                handled = True
 
     # ✅ 그래프 요청이 있을 때만 아래 로직 전체 수행
     if parsed.get("is_chart") and companies and years:
-        # 1. product 가져오기
-        products = parsed.get("product") or []
-        if isinstance(products, str):
-            products = [products]
-
-        # 2. ✅ alias 변환: DCM, IPO 등 정규화
-        from utils import product_aliases  # 상단에서 이미 했으면 생략 가능
-        product_display_names = {v: k.upper() for k, v in product_aliases.items()}  # 사람이 읽을 수 있는 이름
-
-        products = [product_aliases.get(p.lower(), p.lower()) for p in products]    # 내부용 키 정규화
-        product_strs = [product_display_names.get(p, p.upper()) for p in products]  # 그래프 제목용 표시 이름 리스트
-
-        # 3. 기업명 정규화
-        companies_normalized = [c.lower().replace(" ", "") for c in companies]
-
-        for product, product_str in zip(products, product_strs):
-            if product in already_warned:
-                continue
-
-            df = dfs.get(product)
-            if df is None or df.empty:
-                st.warning(f"⚠️ {product.upper()} 데이터가 없습니다.")
-                already_warned.add(product)
-                continue
-
-            df.columns = df.columns.str.strip()
-
-            # ✅ 주관사 정규화 컬럼 생성
-            df["주관사_normalized"] = df["주관사"].astype(str).str.lower().str.replace(" ", "")
+        render_company_charts(parsed.get("product") or [], companies, years, columns, already_warned)
+    return shown
+
+# ✅ 회사별 최고 순위 1건 (연도를 지정하지 않으면 전체 기간 중 최고)
+def render_best_ranks(companies, years):
+    for company in companies:
+        with span("filter", company=company):
+            profile = get_company_profile(dfs, company)
+            best = best_rank(profile, years) if profile else None
+        period = f"{years[0]}년 " if len(years) == 1 else f"{min(years)}~{max(years)}년 " if years else ""
+        if best is None:
+            st.warning(f"⚠️ {period}{company}의 순위 데이터가 없습니다.")
+            continue
+        when = "" if len(years) == 1 else f" ({int(best['연도'])}년)"
+        st.success(f"🏆 {period}**{company}**의 최고 순위는 **{best['상품'].upper()}**에서 **{int(best['순위'])}위**{when}입니다.")
+
+
+# ✅ 회사 × 연도 추이 그래프 (상품별, 지표별 1개) — 단일 질문과 복합 질문의 그래프 요청에서 공통 사용
+def render_company_charts(products, companies, years, columns, already_warned=None):
+    already_warned = set() if already_warned is None else already_warned
+    # 1. product 가져오기
+    if isinstance(products, str):
+        products = [products]
+
+    # 2. ✅ alias 변환: DCM, IPO 등 정규화
+    from utils import product_aliases  # 상단에서 이미 했으면 생략 가능
+    product_display_names = {v: k.upper() for k, v in product_aliases.items()}  # 사람이 읽을 수 있는 이름
+
+    products = [product_aliases.get(p.lower(), p.lower()) for p in products]    # 내부용 키 정규화
+    product_strs = [product_display_names.get(p, p.upper()) for p in products]  # 그래프 제목용 표시 이름 리스트
+
+    # 3. 그릴 지표 (요청 컬럼이 없으면 금액/점유율/순위)
+    chart_metrics = [normalize_column_name(c) for c in columns] or ["금액(원)", "점유율(%)", "순위"]
+    chart_metrics = [m for m in chart_metrics if m in PIVOT_METRICS]
+
+    for product, product_str in zip(products, product_strs):
+        check_cancelled("render")
+        if product in already_warned:
+            continue
+
+        # ✅ 로딩 시 만든 회사 × 연도 행렬에서 N개 기업 × M개 연도를 한 번에 슬라이스
+        matrix = get_pivot(dfs, product)
+        if matrix is None:
+            st.warning(f"⚠️ {product.upper()} 데이터가 없습니다.")
+            already_warned.add(product)
+            continue
+
+        with span("filter", product=product):
+            chart = matrix.take(companies, years, chart_metrics)
+
+        if not chart["companies"] or not chart["periods"]:
+            st.warning(f"⚠️ {product.upper()} 데이터에서 {', '.join(companies)} 데이터가 없습니다.")
+            already_warned.add(product)
+            continue
+        if chart["missing"]:
+            st.warning(f"⚠️ {product_str} 데이터에서 {', '.join(chart['missing'])} 데이터가 없습니다.")
+
+        if not chart_metrics:
+            st.warning("⚠️ 비교 가능한 항목이 없습니다.")
+            continue
+
+        # ✅ 꺾은선 그래프 출력 (지표별 1개, 기업 수 제한 없음)
+        names = " vs ".join(chart["companies"])
+        for metric in chart_metrics:
+            check_cancelled("render")
+            plot_company_matrix_chart(
+                chart["periods"],
+                chart["companies"],
+                chart["values"][metric],
+                metric=metric,
+                title=f"📊 [{product_str}] {names} 연도별 {metric} 추이",
+                key=f"matrix_{product}_{metric}_{'_'.join(chart['companies'])}"
+            )
+
+
+# ✅ 복합 질문 출력: 요청마다 제목 → 경고 → 결과 표 → (그래프 요청이면) 추이 그래프, 질문 순서대로
+def _part_label(sub):
+    if "message" in sub and len(sub) == 1:
+        return "지원 예정 항목"
+    products = sub.get("product") or []
+    companies = sub.get("company") or []
+    years = sub.get("years") or []
+    parts = [
+        f"{min(years)}~{max(years)}년" if len(years) > 1 else "".join(f"{y}년" for y in years),
+        ", ".join([products] if isinstance(products, str) else products),
+        ", ".join([companies] if isinstance(companies, str) else companies),
+    ]
+    return " ".join(p for p in parts if p) or "요청"
+
+
+def render_compound(result):
+    from utils import company_aliases
+
+    st.caption(f"🧩 질문을 {len(result['parts'])}개 요청으로 나눠 함께 처리했어요")
+    for part, info in enumerate(result["parts"]):
+        check_cancelled("render")
+        sub = info["parsed"]
+        st.markdown(f"#### {part + 1}. {_part_label(sub)}")
+        for warning in info["warnings"]:
+            st.warning(f"⚠️ {warning}")
+        for index, item in enumerate(result["results"]):
+            if item["part"] == part:
+                st.subheader(f"📊 {item['title']}")
+                render_dataframe(item["table"], key=f"{part}_{item['title']}_{index}")
+        companies = sub.get("company") or []
+        companies = [companies] if isinstance(companies, str) else companies
+        if sub.get("is_chart") and companies and sub.get("years"):
+            render_company_charts(sub.get("product") or [], [company_aliases.get(c, c) for c in companies], sub["years"], sub.get("columns") or [])
+
+
+# ✅ 디버그 패널: 단계별 소요 시간(span) 표시
+def render_debug_panel(spans):
+    with st.expander("🛠️ 디버그 패널 (단계별 소요 시간)", expanded=True):
+        if not spans:
+            st.caption("수집된 span이 없습니다.")
+            return
+        span_df = pd.DataFrame(spans)
+        front = [c for c in ["span", "parent", "start_ms", "duration_ms", "status"] if c in span_df.columns]
+        st.dataframe(span_df[front + [c for c in span_df.columns if c not in front]].astype(str))
+        # 캐시 영역별 현황 (프로세스 공용, cache_manager.py)
+        st.caption("캐시 영역별 항목 수 / 추정 메모리 / 적중률")
+        st.dataframe(pd.DataFrame(cache_stats()))
+
+
+# ✅ 요약: 화면에 출력한 결과 표(handle_question 반환값)로 바로 만드는 로컬 요약(narrative.py)을 항상 출력 (다시 실행하지 않음)
+# GPT 분석(opt-in)은 표와 요약을 근거로 넘겨 도착하는 토큰대로 이어서 출력
+def render_analysis(query, result, enrich=False):
+    check_cancelled("analysis")
+    if not result["results"]:
+        return
+    with span("narrative") as narrative_span:
+        summary = narrate_result(result)
+        narrative_span.set(paragraphs=len(summary))
+    if summary:
+        st.markdown("#### 📍 요약")
+        for paragraph in summary:
+            st.markdown(paragraph)
+    if not enrich:
+        return
+
+    tables = "\n\n".join(
+        f"[{item['title']}]\n{item['table'].head(20).to_markdown(index=False)}" for item in result["results"]
+    )
+    if summary:
+        tables += "\n\n[요약]\n" + "\n".join(summary)
+    st.markdown("#### 📍 GPT 분석")
+    with span("render", kind="analysis_stream"):
+        st.write_stream(stream_analysis(query, tables))
 
-            # ✅ 연도 및 기업 기준 필터링
-            chart_df = df[
-                df["연도"].isin(years) & 
-                df["주관사_normalized"].isin(companies_normalized)
-            ].copy()
 
-            if chart_df.empty:
-                st.warning(f"⚠️ {product.upper()} 데이터에서 {', '.join(companies)} 데이터가 없습니다.")
-                already_warned.add(product)
-                continue
+# ✅ 이 스크립트 실행이 버려졌는지 (사용자가 다시 질문해 rerun 요청 / 세션 종료로 stop 요청)
+# Streamlit은 다음 st.* 호출에서야 실행을 멈추므로, 그 사이의 GPT 호출·pandas 작업은 취소 토큰으로 끊는다.
+def script_abandoned(ctx):
+    script_requests = getattr(ctx, "script_requests", None)
+    state = getattr(script_requests, "_state", None)
+    return state is not None and state.name != "CONTINUE"
 
-            chart_df = chart_df.sort_values(["주관사", "연도"])
-            chart_df["연도"] = chart_df["연도"].astype(int)
-
-            # ✅ product_str은 zip에서 이미 확보됨
-
-            # ✅ 꺾은선 그래프 출력 (회사 수에 따라 분기)
-            if len(companies) == 2:
-                plot_multi_metric_line_chart_for_two_companies(
-                    chart_df,
-                    companies=companies,
-                    x_col="연도",
-                    y_cols=columns,
-                    title=f"📊 [{product_str}] {' vs '.join(companies)} 꺾은선 그래프",
-                    product_name=product_str
-                )
-                handled = True
 
-            elif len(companies) == 1:
-                plot_multi_metric_line_chart_for_single_company(
-                    chart_df,
-                    company_name=companies[0],
-                    x_col="연도",
-                    y_cols=columns,
-                    product_name=product_str
-                )
-                handled = True
-
-            else:
-                st.info("⚠️ 그래프 비교는 최대 2개 기업까지만 지원됩니다.")
+if submit and query:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    script_ctx = get_script_run_ctx()
+    # 요청 프로파일링: LEAGUE_PROFILE=1 또는 URL ?profile=1 (LEAGUE_PROFILE_URL=1 일 때만, 꺼져 있으면 no-op)
+    with profile_request(query, url_requested=st.query_params.get("profile") == "1") as profile:
+        # 질의 로그가 켜져 있으면 단계별 소요 시간 기록을 위해 span도 수집
+        with trace_request(enabled=debug_panel or QUERY_LOG.enabled) as spans:
+            # 요청 전체 마감 LEAGUE_REQUEST_TIMEOUT초, rerun/stop 요청이 오면 진행 중인 작업 중단
+            with request_scope(REQUEST_TIMEOUT) as token, watch(token, lambda: script_abandoned(script_ctx)):
+                try:
+                    with logged_request(query, "app", spans) as log_record:
+                        with span("request", query=query):
+                            shown = handle_question(query)
+                            if shown:
+                                render_analysis(query, shown, enrich=analysis_enabled)
+                        log_record["parsed"] = st.session_state.get("last_parsed")
+                except DeadlineExceeded:
+                    st.warning(f"⏱️ 응답 시간({REQUEST_TIMEOUT:g}초)이 초과되어 처리를 중단했습니다. 질문 범위를 줄여 다시 시도해 주세요.")
+                except RequestCancelled:
+                    pass  # 새 질문으로 rerun되는 중이므로 화면에 남길 것이 없음
+    if profile.artifacts:
+        st.caption("🔬 프로파일 저장: " + ", ".join(f"{kind} `{path}`" for kind, path in profile.artifacts.items()))
+    if debug_panel:
+        render_debug_panel(spans)
 
 with st.expander("📘 더벨 리그테이블 집계기준", expanded=False):
     st.markdown("### 🏦 DCM 리그테이블 작성 기준")
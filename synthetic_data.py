@@ -0,0 +1,122 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from utils import clean_raw_frame, company_aliases
+
+# ✅ 실제 엑셀과 같은 스키마의 합성 리그테이블 생성기 (규모 확장 테스트/벤치마크용)
+# 기본 규모는 실제 데이터와 비슷하게 14년(56개 분기) × 45개 회사, 분기당 약 30개사 실적
+#   - period_scale: 연도 수 배율 (10 → 140년, 연도는 4자리 범위 1000~9999 안에서 생성)
+#   - company_scale: 회사 수 배율 (10 → 450개사, 실제 회사명을 먼저 쓰고 나머지는 '합성00001증권')
+# 생성한 원본 시트는 load_dataframes와 같은 clean_raw_frame을 거치므로 조회/집계 코드가 그대로 동작한다.
+# 실행: python synthetic_data.py -o synthetic --period-scale 10 --company-scale 10   ← DCM/ECM 폴더에 엑셀 저장
+
+BASE_YEARS = 14
+BASE_COMPANIES = 45
+LAST_YEAR = 2024
+MAX_YEARS = 9000  # 기간 문자열의 연도는 4자리
+
+# (폴더, 파일명, 상품, 역할, 조건) — 대표주관 테이블만 생성 (sb는 dcm nofbabs에서 합산)
+SYNTHETIC_TABLES = [
+    ("DCM", "dcm_lead_total", "dcm", "lead", None),
+    ("DCM", "dcm_lead_nofbabs", "dcm", "lead", "nofbabs"),
+    ("DCM", "fb_lead", "fb", "lead", None),
+    ("DCM", "abs_lead", "abs", "lead", None),
+    ("ECM", "ecm_lead_rank", "ecm", "lead", None),
+    ("ECM", "ipo_lead_rank", "ipo", "lead", None),
+    ("ECM", "ro_lead_rank", "ro", "lead", None),
+]
+
+RAW_COLUMNS = ["기간", "순위", "주관사", "주관 실적_금액(백만)", "주관 실적_건수", "주관 실적_점유율(%)"]
+
+
+def company_names(n):
+    real = list(dict.fromkeys(name.replace(" ", "") for name in company_aliases.values()))
+    return (real + [f"합성{i:05d}증권" for i in range(1, n + 1)])[:n]
+
+
+def year_range(period_scale=1):
+    n_years = int(BASE_YEARS * period_scale)
+    if n_years > MAX_YEARS:
+        raise ValueError(f"연도 수는 최대 {MAX_YEARS}년입니다 (요청: {n_years}년)")
+    last = max(LAST_YEAR, 999 + n_years)
+    return list(range(last - n_years + 1, last + 1))
+
+
+# ✅ 원본 엑셀 시트와 같은 컬럼의 분기 실적 (순위/점유율은 분기 안에서 금액 기준)
+def generate_raw_table(years, companies, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(companies)
+    names = np.asarray(companies, dtype=object)
+
+    # 회사별 체급(로그정규) + 연도마다 조금씩 변하는 추세 → 순위가 해마다 오르내림
+    strength = rng.lognormal(0.0, 1.2, n)
+    percentile = strength.argsort().argsort() / max(n - 1, 1)
+    participation = 0.15 + 0.8 * percentile  # 상위사일수록 거의 매 분기 실적 있음
+
+    periods, ranks, holders, amounts, counts, shares = [], [], [], [], [], []
+    for year in years:
+        strength = strength * rng.lognormal(0.0, 0.15, n)
+        for quarter in range(1, 5):
+            active = np.flatnonzero(rng.random(n) < participation)
+            if not len(active):
+                continue
+            amount = np.maximum(1, (strength[active] * rng.lognormal(0.0, 0.5, len(active)) * 50_000).astype(np.int64))
+            order = np.argsort(-amount, kind="stable")
+            amount = amount[order]
+            periods.append(np.full(len(active), f"{year} {quarter}분기", dtype=object))
+            ranks.append(np.arange(1, len(active) + 1))
+            holders.append(names[active[order]])
+            amounts.append(amount)
+            counts.append(1 + rng.poisson(amount / 100_000))
+            shares.append(np.round(amount / amount.sum() * 100, 2))
+
+    return pd.DataFrame(dict(zip(RAW_COLUMNS, [
+        np.concatenate(periods), np.concatenate(ranks), np.concatenate(holders),
+        np.concatenate(amounts), np.concatenate(counts), np.concatenate(shares),
+    ])))
+
+
+# ✅ load_store()와 같은 모양의 dfs (키: 상품 / (상품, 역할) / (상품, 역할, 조건))
+def generate_store(period_scale=1, company_scale=1, seed=0, tables=SYNTHETIC_TABLES):
+    years = year_range(period_scale)
+    companies = company_names(int(BASE_COMPANIES * company_scale))
+    dfs = {}
+    for i, (_, _, product, role, filter_cond) in enumerate(tables):
+        df = clean_raw_frame(generate_raw_table(years, companies, seed + i))
+        if filter_cond is None:
+            dfs[product] = df
+        dfs[(product, role, filter_cond) if filter_cond else (product, role)] = df
+        dfs[(product, role, filter_cond)] = df
+    return dfs
+
+
+# ✅ 엑셀 파일로 저장 (DCM/ECM 폴더 구조 그대로 → load_store(base_dir)로 읽을 수 있음)
+def write_workbooks(base_dir, period_scale=1, company_scale=1, seed=0, tables=SYNTHETIC_TABLES):
+    years = year_range(period_scale)
+    companies = company_names(int(BASE_COMPANIES * company_scale))
+    paths = []
+    for i, (folder, base, _, _, _) in enumerate(tables):
+        os.makedirs(os.path.join(base_dir, folder), exist_ok=True)
+        path = os.path.join(base_dir, folder, f"{base}.xlsx")
+        generate_raw_table(years, companies, seed + i).to_excel(path, sheet_name=base, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="합성 리그테이블 엑셀 생성 (실제 데이터와 같은 스키마)")
+    arg_parser.add_argument("-o", "--output", required=True, help="저장할 폴더 (하위에 DCM/ECM 생성)")
+    arg_parser.add_argument("--period-scale", type=float, default=1, help="연도 수 배율 (기본 14년 기준)")
+    arg_parser.add_argument("--company-scale", type=float, default=1, help="회사 수 배율 (기본 45개사 기준)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    for path in write_workbooks(args.output, args.period_scale, args.company_scale, args.seed):
+        print(f"✅ {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import functools
+import logging
+import contextvars
+from contextlib import contextmanager
+
+# ✅ 단계별 소요 시간 측정용 경량 span (print 디버깅 대체)
+# 사용: with span("gpt_parse", query=query) as s: ...; s.set(parsed=parsed)
+#   - LEAGUE_TRACE=1 이면 모든 span을 JSON 한 줄씩 'league.trace' 로거로 기록
+#     (LEAGUE_TRACE_FILE=경로 지정 시 파일로 기록, 기본은 stderr)
+#   - trace_request()로 감싼 요청은 span 목록을 모아 디버그 패널에 표시
+#   - 둘 다 꺼져 있으면 공유 no-op 객체만 반환하므로 오버헤드가 거의 없음
+
+logger = logging.getLogger("league.trace")
+
+TRACE_ENABLED = os.getenv("LEAGUE_TRACE", "0") == "1"
+
+_current_trace = contextvars.ContextVar("league_trace", default=None)
+_current_span = contextvars.ContextVar("league_span", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, name, trace, attrs):
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.parent = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent = parent.name if parent is not None else None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        _current_span.reset(self._token)
+
+        record = {
+            "span": self.name,
+            "parent": self.parent,
+            "duration_ms": round(duration_ms, 3),
+            "status": "error" if exc_type else "ok",
+            **self.attrs,
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        if self.trace is not None:
+            record["start_ms"] = round((self.start - self.trace["started"]) * 1000, 3)
+            self.trace["spans"].append(record)
+        if TRACE_ENABLED:
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        return False
+
+
+def span(name, **attrs):
+    trace = _current_trace.get()
+    if trace is None and not TRACE_ENABLED:
+        return _NULL_SPAN
+    return Span(name, trace, attrs)
+
+
+# ✅ 함수 전체를 span으로 감싸는 데코레이터
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, func=func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ✅ 요청 단위로 span 수집 (enabled=False면 아무것도 모으지 않음)
+@contextmanager
+def trace_request(enabled=True):
+    if not enabled:
+        yield []
+        return
+    trace = {"started": time.perf_counter(), "spans": []}
+    token = _current_trace.set(trace)
+    try:
+        yield trace["spans"]
+    finally:
+        _current_trace.reset(token)
+
+
+def _configure_logger():
+    if not TRACE_ENABLED or logger.handlers:
+        return
+    path = os.getenv("LEAGUE_TRACE_FILE")
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_logger()
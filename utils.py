@@ -5,7 +5,13 @@ import json
 import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
 from dotenv import load_dotenv
+import time
+import logging
 from collections import defaultdict
+from tracing import span, traced
+from metrics import LOAD_SECONDS, LOADED_TABLES, LOAD_FAILURES
+
+logger = logging.getLogger("league.load")
 
 # ✅ 보정 딕셔너리는 함수 밖, 파일 상단이나 중단에 위치해야 함
 company_aliases = {
@@ -80,58 +86,97 @@ def normalize_column_name(col):
     }
     return column_map.get(col.strip(), col.strip())
 
+# ✅ 원본 엑셀(기간, 주관 실적_금액(백만) 등)을 챗봇 공통 컬럼(연도/분기/금액(원)/건수/점유율(%))으로 맞춤
+def standardize_columns(df):
+    if "기간" in df.columns and "연도" not in df.columns:
+        period = df["기간"].astype(str).str.extract(r"(\d{4})\s*(?:(\d)분기)?")
+        df["연도"] = pd.to_numeric(period[0], errors="coerce")
+        df["분기"] = pd.to_numeric(period[1], errors="coerce")
+
+    # 조정/수수료 실적이 아닌 첫 번째 실적 컬럼을 기준으로 사용
+    for canonical, keyword in [("금액(원)", "금액"), ("건수", "건수"), ("점유율(%)", "점유율")]:
+        if canonical in df.columns:
+            continue
+        source = next((c for c in df.columns if keyword in c and not c.startswith(("조정", "수수료"))), None)
+        if source is None:
+            continue
+        values = pd.to_numeric(df[source], errors="coerce")
+        if canonical == "금액(원)" and "백만" in source:
+            values = values * 1_000_000
+        df[canonical] = values
+
+    # 실적이 없는 분기는 '-' 행으로 채워져 있으므로 제거
+    if "순위" in df.columns:
+        df["순위"] = pd.to_numeric(df["순위"], errors="coerce")
+        df = df[df["순위"].notna()].copy()
+        df["순위"] = df["순위"].astype(int)
+    if "연도" in df.columns:
+        df = df[df["연도"].notna()].copy()
+        df["연도"] = df["연도"].astype(int)
+
+    return df
+
+# ✅ 엑셀 원본 시트 1개를 챗봇 테이블로 정리 (합성 데이터 생성기 synthetic_data.py도 같은 경로 사용)
+def clean_raw_frame(df):
+    # 공통 컬럼 정리
+    df.columns = df.columns.astype(str).str.strip().str.replace('"', '', regex=False)
+
+    if "연도" in df.columns:
+        df["연도"] = df["연도"].astype(str).str.replace("년", "").astype(int)
+
+    if "주관사" not in df.columns and df.shape[1] >= 3:
+        df["주관사"] = df.iloc[:, 2].astype(str).str.strip()
+    else:
+        df["주관사"] = df["주관사"].astype(str).str.strip()
+
+    df["주관사"] = df["주관사"].str.replace(" ", "")
+    return standardize_columns(df)
+
+# ✅ 파일명 → (상품, 역할, 조건)  예: ecm_lead_rank → ("ecm", "lead", None), dcm_lead_nofbabs → ("dcm", "lead", "nofbabs")
+def parse_table_name(filename):
+    tokens = os.path.basename(filename).replace(".xlsx", "").lower().split("_")
+    product = tokens[0]
+
+    role = None
+    filter_cond = None
+    for token in tokens[1:]:
+        # 역할 설정
+        if token in role_aliases and role is None:
+            role = role_aliases[token]
+
+        # 필터 조건 설정 (복수 가능성 고려)
+        elif token in ["noabs", "nofbabs", "corp"] and filter_cond is None:
+            filter_cond = token
+    return product, role, filter_cond
+
+# ✅ 엑셀 파일 원본 시트 로딩 (시트명이 파일명과 달라도 첫 시트로 동작)
+def read_workbook(file_path):
+    base = os.path.basename(file_path).replace(".xlsx", "").lower()
+    try:
+        return pd.read_excel(file_path, sheet_name=base)
+    except:
+        xls = pd.ExcelFile(file_path)
+        return pd.read_excel(xls, sheet_name=xls.sheet_names[0])
+
 def load_dataframes(data_dir):
     dfs = defaultdict(dict)
     structured_dfs = {}  # 새롭게 추가되는 구조화된 딕셔너리
+    load_started = time.perf_counter()
+    dir_label = os.path.basename(os.path.normpath(data_dir))
 
     for filename in os.listdir(data_dir):
         if filename.endswith(".xlsx"):
             base = filename.replace(".xlsx", "").lower()
             file_path = os.path.join(data_dir, filename)
+            product, role, filter_cond = parse_table_name(filename)
 
-            # 파일명 예: ecm_lead_rank → 상품: ecm, 역할: lead
-            tokens = base.split("_")
-            print(f"[DEBUG] 📂 파일명: {base}, tokens: {tokens}")  # ✅ 디버깅 추가
-            product = tokens[0]
-
-            role = None
-            filter_cond = None
-
-            # ✅ 수정된 코드
-            for token in tokens[1:]:
-                token_lower = token.lower()
-
-                # 역할 설정
-                if token_lower in role_aliases and role is None:
-                    role = role_aliases[token_lower]
-
-                # 필터 조건 설정 (복수 가능성 고려)
-                elif token_lower in ["noabs", "nofbabs", "corp"] and filter_cond is None:
-                    filter_cond = token_lower
-
-                    
-            print(f"[DEBUG] 🔍 상품: {product}, 역할: {role}, 필터조건: {filter_cond}")
+            logger.debug("📂 파일명: %s → 상품: %s, 역할: %s, 필터조건: %s", base, product, role, filter_cond)
 
             try:
-                # 엑셀 파일 첫 시트를 로딩 (시트명이 정확하지 않아도 동작)
-                try:
-                    df = pd.read_excel(file_path, sheet_name=base)
-                except:
-                    xls = pd.ExcelFile(file_path)
-                    df = pd.read_excel(xls, sheet_name=xls.sheet_names[0])
+                with span("workbook_load", file=filename) as load_span:
+                    df = clean_raw_frame(read_workbook(file_path))
+                    load_span.set(rows=len(df))
 
-                # 공통 컬럼 정리
-                df.columns = df.columns.astype(str).str.strip().str.replace('"', '', regex=False)
-
-                if "연도" in df.columns:
-                    df["연도"] = df["연도"].astype(str).str.replace("년", "").astype(int)
-
-                if "주관사" not in df.columns and df.shape[1] >= 3:
-                    df["주관사"] = df.iloc[:, 2].astype(str).str.strip()
-                else:
-                    df["주관사"] = df["주관사"].astype(str).str.strip()
-
-                df["주관사"] = df["주관사"].str.replace(" ", "")
                 structured_dfs[(product, role, filter_cond)] = df  # ✅ 이 줄 추가
 
                 # 기존 방식 저장 (기존 코드 호환)
@@ -142,24 +187,85 @@ def load_dataframes(data_dir):
                 structured_dfs[key] = df
                 dfs[key] = df  # ✅ 이 줄 추가
 
-                print(f"✅ [DEBUG] '{filename}' → key: {key} / shape: {df.shape}")
+                logger.debug("✅ '%s' → key: %s / shape: %s", filename, key, df.shape)
 
             except Exception as e:
-                print(f"❌ [ERROR] '{filename}' 로딩 실패:", e)
+                logger.error("❌ '%s' 로딩 실패: %s", filename, e)
+                LOAD_FAILURES.inc(data_dir=dir_label)
 
     # 기존 dfs에 구조화된 항목 추가
     dfs.update(structured_dfs)
-    print("🟡 [DEBUG] 최종 로드된 데이터 키:", list(dfs.keys()))
+    logger.debug("🟡 최종 로드된 데이터 키: %s", list(dfs.keys()))
 
-    # [DEBUG] structured_dfs 내부 키 목록 확인용 (임시 확인 코드)
-    print("[DEBUG] structured_dfs keys:")
-    for key in structured_dfs:
-        print("  →", key)
+    LOAD_SECONDS.set(round(time.perf_counter() - load_started, 3), data_dir=dir_label)
+    LOADED_TABLES.set(len({id(df) for df in structured_dfs.values()}), data_dir=dir_label)
 
     return dfs, structured_dfs
 
 
 
+# ✅ 차트 출력 (브라우저 전송 시간은 render span으로 별도 측정)
+def render_chart(fig, **kwargs):
+    with span("render", kind="chart"):
+        st.plotly_chart(fig, use_container_width=True, **kwargs)
+
+
+TABLE_PAGE_SIZE = int(os.getenv("LEAGUE_TABLE_PAGE_SIZE", "50"))
+
+
+# ✅ 결과 표의 한 페이지만 잘라서 반환 (표의 행 순서 그대로, page는 1부터)
+# 반환값: (window DataFrame, 전체 행 수, 전체 페이지 수)
+def page_window(df, page=1, page_size=TABLE_PAGE_SIZE):
+    total = len(df)
+    pages = max(1, -(-total // page_size))
+    page = min(max(1, int(page)), pages)
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], total, pages
+
+
+# ✅ 표 출력 (render span으로 측정)
+# 행이 TABLE_PAGE_SIZE를 넘으면 보이는 페이지만 브라우저로 보냄 (전체 순위·다년도 요청도 전송량/렌더 시간 일정)
+# key: 호출 측이 정하는 표 이름 (제목 + 순번 등) — 같은 실행의 표끼리 겹치지 않고 rerun 사이에는 같아야 보던 페이지 유지
+def render_dataframe(df, key, page_size=None, **kwargs):
+    page_size = page_size or TABLE_PAGE_SIZE
+    key = f"table_{key}"
+    if len(df) <= page_size:
+        with span("render", kind="table", rows=len(df)):
+            st.dataframe(df, **kwargs)
+    else:
+        _render_paged_dataframe(df, key, page_size, kwargs)
+    render_export_buttons(df, key)
+
+
+# ✅ 결과 표 다운로드 (전체 행 기준, 파일은 버튼을 눌렀을 때만 청크 단위로 생성)
+# st.popover, download_button의 callable data / on_click="ignore", st.fragment → requirements.txt의 streamlit>=1.50
+def render_export_buttons(df, key, file_stem="league_table"):
+    from export import EXPORT_FORMATS, export_bytes
+
+    with st.popover("📥 다운로드"):
+        for fmt, mime in EXPORT_FORMATS.items():
+            st.download_button(
+                fmt.upper(),
+                data=lambda fmt=fmt: export_bytes(df, fmt),
+                file_name=f"{file_stem}.{fmt}",
+                mime=mime,
+                key=f"{key}_{fmt}",
+                on_click="ignore",  # 다운로드해도 화면(질문 결과)을 다시 그리지 않음
+            )
+
+
+# 페이지 이동은 fragment만 다시 실행 (질문 해석/조회를 반복하지 않고 화면의 다른 결과도 유지)
+@st.fragment
+def _render_paged_dataframe(df, key, page_size, kwargs):
+    pages = -(-len(df) // page_size)
+    page = st.number_input(f"페이지 (총 {pages}쪽)", min_value=1, max_value=pages, value=1, step=1, key=key)
+    window, total, _ = page_window(df, page, page_size)
+    with span("render", kind="table_page", rows=len(window), total_rows=total):
+        st.dataframe(window, **kwargs)
+    start = (page - 1) * page_size
+    st.caption(f"{start + 1:,}–{start + len(window):,}행 / 총 {total:,}행")
+
+
 # ✅ (옵션) matplotlib 그래프에서 사용할 한글 폰트 설정
 def set_korean_font():
     import matplotlib.pyplot as plt
@@ -175,6 +281,7 @@ def set_korean_font():
     plt.rcParams['axes.unicode_minus'] = False  # ✅ 마이너스 깨짐 방지
 
 # ✅ plotly 기반 꺾은선 차트 함수 (한글 깨짐 방지)
+@traced("chart_build")
 def plot_line_chart_plotly(df, x_col, y_col, color_col="주관사", title="📈 주관사 순위 변화 추이", key=None):
     import plotly.express as px
 
@@ -189,9 +296,10 @@ def plot_line_chart_plotly(df, x_col, y_col, color_col="주관사", title="📈
         yaxis_autorange='reversed',  # 순위는 숫자 작을수록 위쪽
         xaxis_type='category'
     )
-    st.plotly_chart(fig, use_container_width=True, key=key)
+    render_chart(fig, key=key)
 
 # ✅ bar chart 함수도 유지 (필요 시 사용 가능)
+@traced("chart_build")
 def plot_bar_chart_plotly(df, x_col, y_cols, title="📊 주관사별 비교", key=None):
     import plotly.express as px
     import streamlit as st
@@ -208,10 +316,11 @@ def plot_bar_chart_plotly(df, x_col, y_cols, title="📊 주관사별 비교", k
             uniformtext_mode='hide',
             xaxis_tickangle=-45
         )
-        st.plotly_chart(fig, use_container_width=True, key=unique_key)
+        render_chart(fig, key=unique_key)
 
 
 # ✅ 단일 주관사 기준, 여러 연도 실적 항목을 하나의 꺾은선 그래프로 표현
+@traced("chart_build")
 def plot_multi_metric_line_chart_for_single_company(df, company_name, x_col="연도", y_cols=["금액(원)", "건수", "점유율(%)"], product_name=None):
     import plotly.express as px
 
@@ -253,10 +362,11 @@ def plot_multi_metric_line_chart_for_single_company(df, company_name, x_col="연
         if 항목 == "순위":
             fig.update_yaxes(autorange="reversed")
 
-        st.plotly_chart(fig, use_container_width=True)
+        render_chart(fig)
 
 
 # ✅ 여러 기업 비교용 꺾은선 그래프 함수
+@traced("chart_build")
 def plot_multi_line_chart_plotly(df, x_col, y_cols, color_col, title="📊 비교 꺾은선 그래프"):
     import plotly.express as px
     import streamlit as st
@@ -278,9 +388,10 @@ def plot_multi_line_chart_plotly(df, x_col, y_cols, color_col, title="📊 비
         if y_col == "순위":
             fig.update_yaxes(autorange="reversed")
 
-        st.plotly_chart(fig, use_container_width=True, key=f"{y_col}_{color_col}_multi")
+        render_chart(fig, key=f"{y_col}_{color_col}_multi")
 
 # ✅ 2개 이하 기업의 순위 비교 꺾은선 그래프 함수
+@traced("chart_build")
 def plot_rank_comparison_for_up_to_two_companies(
     df, companies, x_col="연도", y_col="순위", product_name=None
 ):
@@ -331,8 +442,9 @@ def plot_rank_comparison_for_up_to_two_companies(
         fig.update_yaxes(autorange="reversed")  # ✅ 순위는 낮을수록 상위
 
     key_suffix = str(uuid.uuid4())[:8]
-    st.plotly_chart(fig, use_container_width=True, key=f"rank_compare_{key_suffix}")
+    render_chart(fig, key=f"rank_compare_{key_suffix}")
 
+@traced("chart_build")
 def plot_multi_metric_line_chart_for_two_companies(
     df, companies, x_col="연도", y_cols=["금액(원)", "점유율(%)", "순위"], title=None, product_name=None
 ):
@@ -385,4 +497,34 @@ def plot_multi_metric_line_chart_for_two_companies(
         if 항목 == "순위":
             fig.update_yaxes(autorange="reversed")
 
-        st.plotly_chart(fig, use_container_width=True, key=f"{항목}_{uuid.uuid4().hex[:8]}")
+        render_chart(fig, key=f"{항목}_{uuid.uuid4().hex[:8]}")
+
+
+# ✅ N개 기업 × M개 연도 행렬을 그대로 그리는 꺾은선 그래프 (melt/isin 없이 행 단위 trace)
+# values: (기업 수, 연도 수) 배열, 실적 없는 연도는 NaN → 선이 끊겨 표시됨
+# (figure 생성은 화면 출력과 분리 → 시작 시 캐시 워밍에서도 호출)
+def build_company_matrix_figure(periods, companies, values, metric, title):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    x = [str(p) for p in periods]
+    for company, row in zip(companies, values):
+        fig.add_trace(go.Scatter(x=x, y=row, mode="lines+markers", name=company))
+
+    fig.update_layout(
+        title=title,
+        title_font=dict(family="Nanum Gothic", size=20),
+        font=dict(family="Nanum Gothic", size=12),
+        xaxis_title="연도",
+        yaxis_title=metric,
+        legend_title="주관사",
+        xaxis=dict(type="category")
+    )
+    if metric == "순위":
+        fig.update_yaxes(autorange="reversed")  # ✅ 순위는 낮을수록 상위
+    return fig
+
+
+@traced("chart_build")
+def plot_company_matrix_chart(periods, companies, values, metric, title, key=None):
+    render_chart(build_company_matrix_figure(periods, companies, values, metric, title), key=key)